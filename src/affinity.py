@@ -0,0 +1,602 @@
+"""Array-backed affinity engine. Interactions are collected as (actor, author, weight) triples, duplicates
+are summed in bulk and the result is frozen into a CSR matrix indexed by dense user ids.
+
+`BucketedAffinity` keeps undecayed weights per day so the matrix can be frozen again for a later `now`.
+
+`friend_of_friend_triples` propagates affinity two hops, from a user through their friends.
+
+`CsrAffinity`, `BucketedAffinity` and `nx.DiGraph` are all accepted by `feed.get_feed` (through
+`author_affinities`) and by `graph_generator.print_graph` (through `edges(data='affinity')`).
+"""
+
+import threading
+from typing import Iterator
+
+import numpy as np
+
+import timestamps
+from graph_generator import COMMENT_WEIGHT, FRIEND_WEIGHT, REACTION_WEIGHT, SHARE_WEIGHT, DAY_THRESHOLDS, DAY_MULTIPLIERS
+from graph_generator import FRIEND_OF_FRIEND_MAX_PRODUCTS, FRIEND_OF_FRIEND_TOP_K, FRIEND_OF_FRIEND_WEIGHT
+from graph_generator import add_affinity, get_date_difference_multipliers
+from timestamps import SECONDS_PER_DAY
+from status_table import StatusTable
+
+
+ROLL_LAG_DAYS: int = 7
+
+
+class CsrAffinity(object):
+    """Affinity matrix in CSR form. Row `user` holds the authors `user` has affinity to, sorted by id.
+    """
+    def __init__(self, indptr: np.ndarray, indices: np.ndarray, data: np.ndarray):
+        self.indptr: np.ndarray = indptr
+        self.indices: np.ndarray = indices
+        self.data: np.ndarray = data
+
+    @classmethod
+    def from_triples(cls, actors: np.ndarray, authors: np.ndarray, weights: np.ndarray) -> "CsrAffinity":
+        """Sums weights of equal (actor, author) pairs and freezes them into a matrix. Weights of a pair are
+        added in input order, starting from 0, the same way `graph_generator.add_affinity` does.
+
+        Args:
+            actors (np.ndarray): acting users
+            authors (np.ndarray): affected users
+            weights (np.ndarray): affinity per interaction
+
+        Returns:
+            CsrAffinity: affinity matrix
+        """
+        actors = np.asarray(actors, dtype=np.int64)
+        authors = np.asarray(authors, dtype=np.int64)
+        weights = np.asarray(weights, dtype=np.float64)
+        if len(actors) == 0:
+            return cls(np.zeros(1, dtype=np.int64), np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float64))
+
+        size: int = int(max(actors.max(), authors.max())) + 1
+        keys, inverse = np.unique(actors * size + authors, return_inverse=True)
+        data: np.ndarray = np.bincount(inverse.ravel(), weights=weights, minlength=len(keys))
+        rows: np.ndarray = keys // size
+        indptr: np.ndarray = np.zeros(int(rows[-1]) + 2, dtype=np.int64)
+        np.cumsum(np.bincount(rows), out=indptr[1:])
+        return cls(indptr, (keys % size).astype(np.int32), data)
+
+    def __contains__(self, user: int) -> bool:
+        return 0 <= user < len(self.indptr) - 1
+
+    def number_of_edges(self) -> int:
+        return len(self.indices)
+
+    def row(self, user: int) -> tuple:
+        """Gets authors and affinities of `user`.
+
+        Args:
+            user (int): user
+
+        Returns:
+            tuple: (`authors`, `affinities`), empty for unknown users
+        """
+        if user not in self:
+            return self.indices[:0], self.data[:0]
+        start, end = self.indptr[user], self.indptr[user + 1]
+        return self.indices[start:end], self.data[start:end]
+
+    def affinity(self, user: int, friend: int) -> float:
+        """Gets affinity between two users.
+
+        Args:
+            user (int): first user
+            friend (int): second user
+
+        Returns:
+            float: affinity, 0 if there is no edge
+        """
+        return float(self.affinities(user, np.array([friend]))[0])
+
+    def affinities(self, user: int, authors: np.ndarray) -> np.ndarray:
+        """Gets affinity of `user` towards each author.
+
+        Args:
+            user (int): user
+            authors (np.ndarray): author ids
+
+        Returns:
+            np.ndarray: affinity per author, 0 if there is no edge
+        """
+        authors = np.asarray(authors)
+        indices, data = self.row(user)
+        if len(indices) == 0:
+            return np.zeros(len(authors), dtype=np.float64)
+        positions: np.ndarray = np.minimum(np.searchsorted(indices, authors), len(indices) - 1)
+        return np.where(indices[positions] == authors, data[positions], 0.0)
+
+    def edges(self, data: str = 'affinity') -> Iterator[tuple]:
+        """Iterates over edges, like `nx.DiGraph.edges(data='affinity')`.
+
+        Args:
+            data (str, optional): Edge attribute, only 'affinity' is stored. Defaults to 'affinity'.
+
+        Yields:
+            tuple: (`user`, `friend`, `affinity`)
+        """
+        rows: np.ndarray = np.repeat(np.arange(len(self.indptr) - 1), np.diff(self.indptr))
+        yield from zip(rows.tolist(), self.indices.tolist(), self.data.tolist())
+
+    def triples(self) -> tuple:
+        """Gets edges as arrays.
+
+        Returns:
+            tuple: (`actors`, `authors`, `weights`)
+        """
+        rows: np.ndarray = np.repeat(np.arange(len(self.indptr) - 1, dtype=np.int64), np.diff(self.indptr))
+        return rows, self.indices.astype(np.int64), self.data
+
+    def copy(self) -> "CsrAffinity":
+        """Copies matrix, `update` replaces arrays instead of writing into them, so they are shared.
+
+        Returns:
+            CsrAffinity: copy
+        """
+        return CsrAffinity(self.indptr, self.indices, self.data)
+
+    def update(self, actors: np.ndarray, authors: np.ndarray, weights: np.ndarray) -> None:
+        """Adds interactions in place. Stored affinities come first, so each sum keeps the incremental order.
+
+        Args:
+            actors (np.ndarray): acting users
+            authors (np.ndarray): affected users
+            weights (np.ndarray): affinity per interaction
+        """
+        old_actors, old_authors, old_weights = self.triples()
+        merged: CsrAffinity = CsrAffinity.from_triples(np.concatenate((old_actors, np.asarray(actors, dtype=np.int64))),
+                                                       np.concatenate((old_authors, np.asarray(authors, dtype=np.int64))),
+                                                       np.concatenate((old_weights, np.asarray(weights, dtype=np.float64))))
+        self.indptr, self.indices, self.data = merged.indptr, merged.indices, merged.data
+
+
+def _status_authors(statuses, status_ids: np.ndarray) -> np.ndarray:
+    if isinstance(statuses, StatusTable):
+        return statuses.authors[statuses.index[status_ids]].astype(np.int64)
+    return np.fromiter((statuses[status_id]['author'] for status_id in status_ids.tolist()), dtype=np.int64, count=len(status_ids))
+
+
+def _interaction_arrays(groups: dict, statuses, time_field: str, weight_of) -> tuple:
+    records: list = [record for records in groups.values() for record in records]
+    count: int = len(records)
+    actors: np.ndarray = np.fromiter((actor for actor, records in groups.items() for _ in records), dtype=np.int64, count=count)
+    status_ids: np.ndarray = np.fromiter((record['status_id'] for record in records), dtype=np.int64, count=count)
+    times: np.ndarray = np.fromiter((record[time_field] for record in records), dtype=np.int64, count=count)
+    weights: np.ndarray = np.broadcast_to(np.asarray(weight_of(records), dtype=np.float64), (count,))
+    return actors, _status_authors(statuses, status_ids), times, weights
+
+
+def interaction_arrays(statuses, shares: dict, reactions: dict, comments: dict) -> tuple:
+    """Collects comments, reactions and shares as arrays, in the order `graph_generator.generate_graph`
+    applies them. Weights are not multiplied by time dependency.
+
+    Args:
+        statuses (dict | StatusTable): all statuses
+        shares (dict): all shares
+        reactions (dict): all reactions
+        comments (dict): all comments
+
+    Returns:
+        tuple: (`actors`, `authors`, `times`, `weights`)
+    """
+    parts: list = [
+        _interaction_arrays(comments, statuses, 'comment_published', lambda records: COMMENT_WEIGHT),
+        _interaction_arrays(reactions, statuses, 'reacted',
+                            lambda records: np.fromiter((REACTION_WEIGHT[record['type_of_reaction']] for record in records), dtype=np.float64, count=len(records))),
+        _interaction_arrays(shares, statuses, 'status_shared', lambda records: SHARE_WEIGHT),
+    ]
+    return tuple(np.concatenate([part[i] for part in parts]) for i in range(4))
+
+
+def friend_arrays(users: dict) -> tuple:
+    """Collects friendships as arrays.
+
+    Args:
+        users (dict): all users, keyed by user id
+
+    Returns:
+        tuple: (`actors`, `authors`, `weights`)
+    """
+    count: int = sum(len(friends) for friends in users.values())
+    return (
+        np.fromiter((user for user, friends in users.items() for _ in friends), dtype=np.int64, count=count),
+        np.fromiter((friend for friends in users.values() for friend in friends), dtype=np.int64, count=count),
+        np.full(count, FRIEND_WEIGHT, dtype=np.float64),
+    )
+
+
+def affinity_triples(users: dict, statuses, shares: dict, reactions: dict, comments: dict, now: int = None) -> tuple:
+    """Collects interactions as arrays in the order `graph_generator.generate_graph` applies them.
+
+    Args:
+        users (dict): all users, keyed by user id
+        statuses (dict | StatusTable): all statuses
+        shares (dict): all shares
+        reactions (dict): all reactions
+        comments (dict): all comments
+        now (int, optional): Time recency is measured from, in seconds. Defaults to None (current time).
+
+    Returns:
+        tuple: (`actors`, `authors`, `weights`)
+    """
+    if now is None:
+        now = timestamps.now()
+    actors, authors, times, weights = interaction_arrays(statuses, shares, reactions, comments)
+    friend_actors, friend_authors, friend_weights = friend_arrays(users)
+    return (np.concatenate((actors, friend_actors)), np.concatenate((authors, friend_authors)),
+            np.concatenate((weights * get_date_difference_multipliers(times, now), friend_weights)))
+
+
+def _sum_by(columns: tuple, weights: np.ndarray) -> tuple:
+    """Sums weights of rows with equal values in every column.
+
+    Args:
+        columns (tuple): int64 arrays of equal length
+        weights (np.ndarray): weight per row
+
+    Returns:
+        tuple: (`unique columns`, `sums`)
+    """
+    if len(weights) == 0:
+        return tuple(column[:0] for column in columns), weights[:0]
+    order: np.ndarray = np.lexsort(columns[::-1])
+    columns = tuple(column[order] for column in columns)
+    starts: np.ndarray = np.ones(len(order), dtype=bool)
+    starts[1:] = np.any([column[1:] != column[:-1] for column in columns], axis=0)
+    heads: np.ndarray = np.flatnonzero(starts)
+    return tuple(column[heads] for column in columns), np.add.reduceat(weights[order], heads)
+
+
+class BucketedAffinity(object):
+    """Affinity kept as undecayed weights per edge and absolute day, so time dependency can be applied for
+    any `now` without a rebuild. Age is counted in calendar days, `now // SECONDS_PER_DAY - action day`, like
+    `graph_generator.get_date_difference_multiplier`, and mapped to `DAY_MULTIPLIERS` with `DAY_THRESHOLDS`.
+    Day buckets older than the last threshold all get the last multiplier, so `roll` folds them into one
+    expired sum per edge. Friendships are static weights.
+    """
+    def __init__(self):
+        empty_int: np.ndarray = np.empty(0, dtype=np.int64)
+        empty_float: np.ndarray = np.empty(0, dtype=np.float64)
+        self.buckets: tuple = (empty_int, empty_int, empty_int)
+        self.bucket_weights: np.ndarray = empty_float
+        self.expired: tuple = (empty_int, empty_int)
+        self.expired_weights: np.ndarray = empty_float
+        self.static: tuple = (empty_int, empty_int)
+        self.static_weights: np.ndarray = empty_float
+        self.propagation: dict = None
+        self.rolled_day: int = None
+        self.frozen_day: int = None
+        self.frozen: CsrAffinity = None
+        self.lock: threading.Lock = threading.Lock()
+
+    @classmethod
+    def from_datasets(cls, users: dict, statuses, shares: dict, reactions: dict, comments: dict) -> "BucketedAffinity":
+        """Builds buckets from loaded datasets.
+
+        Args:
+            users (dict): all users, keyed by user id
+            statuses (dict | StatusTable): all statuses
+            shares (dict): all shares
+            reactions (dict): all reactions
+            comments (dict): all comments
+
+        Returns:
+            BucketedAffinity: bucketed affinity
+        """
+        bucketed = cls()
+        bucketed.add(users, statuses, shares, reactions, comments)
+        return bucketed
+
+    def copy(self) -> "BucketedAffinity":
+        """Copies buckets. Arrays are replaced instead of written into, so they are shared with the copy.
+
+        Returns:
+            BucketedAffinity: copy
+        """
+        bucketed = BucketedAffinity()
+        with self.lock:
+            for name in ("buckets", "bucket_weights", "expired", "expired_weights", "static", "static_weights",
+                         "propagation", "rolled_day", "frozen_day", "frozen"):
+                setattr(bucketed, name, getattr(self, name))
+        return bucketed
+
+    def add(self, users: dict, statuses, shares: dict, reactions: dict, comments: dict) -> None:
+        """Adds interactions and friendships.
+
+        Args:
+            users (dict): users with new friends, keyed by user id
+            statuses (dict | StatusTable): statuses the interactions refer to
+            shares (dict): new shares
+            reactions (dict): new reactions
+            comments (dict): new comments
+        """
+        actors, authors, times, weights = interaction_arrays(statuses, shares, reactions, comments)
+        self.add_interactions(actors, authors, times, weights)
+        friend_actors, friend_authors, friend_weights = friend_arrays(users)
+        self.static, self.static_weights = _sum_by(
+            (np.concatenate((self.static[0], friend_actors)), np.concatenate((self.static[1], friend_authors))),
+            np.concatenate((self.static_weights, friend_weights)))
+        self.frozen_day = None
+
+    def add_interactions(self, actors: np.ndarray, authors: np.ndarray, times: np.ndarray, weights: np.ndarray) -> None:
+        """Adds undecayed interaction weights to their day buckets.
+
+        Args:
+            actors (np.ndarray): acting users
+            authors (np.ndarray): affected users
+            times (np.ndarray): interaction times, in seconds
+            weights (np.ndarray): undecayed weights
+        """
+        days: np.ndarray = np.asarray(times, dtype=np.int64) // SECONDS_PER_DAY
+        self.buckets, self.bucket_weights = _sum_by(
+            tuple(np.concatenate((old, np.asarray(new, dtype=np.int64))) for old, new in zip(self.buckets, (actors, authors, days))),
+            np.concatenate((self.bucket_weights, np.asarray(weights, dtype=np.float64))))
+        self.frozen_day = None
+
+    def roll(self, now: int) -> None:
+        """Folds day buckets that reached the last threshold `ROLL_LAG_DAYS` days before `now` into the expired
+        sums. Folding cannot be undone, so `now` is capped at the current time and never moves `rolled_day`
+        back, and days down to `ROLL_LAG_DAYS` before `rolled_day` can still be frozen exactly.
+
+        Args:
+            now (int): current time, in seconds
+        """
+        day: int = min(now, timestamps.now()) // SECONDS_PER_DAY
+        if self.rolled_day is not None and day <= self.rolled_day:
+            return
+        self.rolled_day = day
+        ages: np.ndarray = day - ROLL_LAG_DAYS - self.buckets[2]
+        old: np.ndarray = ages >= DAY_THRESHOLDS[-1]
+        if not old.any():
+            return
+        self.expired, self.expired_weights = _sum_by(
+            (np.concatenate((self.expired[0], self.buckets[0][old])), np.concatenate((self.expired[1], self.buckets[1][old]))),
+            np.concatenate((self.expired_weights, self.bucket_weights[old])))
+        self.buckets = tuple(column[~old] for column in self.buckets)
+        self.bucket_weights = self.bucket_weights[~old]
+
+    def freeze(self, now: int = None) -> CsrAffinity:
+        """Applies time dependency for `now`. The matrix is cached until the day changes or data is added.
+        Freezing holds `lock`, so readers on several threads share one matrix.
+
+        Args:
+            now (int, optional): Current time, in seconds. Defaults to None (current time).
+
+        Raises:
+            ValueError: `now` is more than `ROLL_LAG_DAYS` days before a day the buckets were rolled to
+
+        Returns:
+            CsrAffinity: affinity matrix for `now`
+        """
+        if now is None:
+            now = timestamps.now()
+        day: int = now // SECONDS_PER_DAY
+        with self.lock:
+            if self.frozen_day == day:
+                return self.frozen
+            if self.rolled_day is not None and day < self.rolled_day - ROLL_LAG_DAYS:
+                raise ValueError(f"Buckets are rolled to day {self.rolled_day}, day {day} cannot be frozen")
+
+            self.roll(now)
+            multipliers: np.ndarray = np.asarray(DAY_MULTIPLIERS)[np.searchsorted(DAY_THRESHOLDS, day - self.buckets[2], side="right")]
+            self.frozen = CsrAffinity.from_triples(
+                np.concatenate((self.static[0], self.expired[0], self.buckets[0])),
+                np.concatenate((self.static[1], self.expired[1], self.buckets[1])),
+                np.concatenate((self.static_weights, self.expired_weights * DAY_MULTIPLIERS[-1], self.bucket_weights * multipliers)))
+            if self.propagation is not None:
+                self.frozen.update(*friend_of_friend_triples(self.static, self.frozen, **self.propagation))
+            self.frozen_day = day
+            return self.frozen
+
+    def propagate(self, top_k: int = FRIEND_OF_FRIEND_TOP_K, weight: float = FRIEND_OF_FRIEND_WEIGHT,
+                  max_products: int = FRIEND_OF_FRIEND_MAX_PRODUCTS) -> None:
+        """Adds friend of friend affinity, see `friend_of_friend_triples`, every time the matrix is frozen.
+
+        Args:
+            top_k (int, optional): Second degree neighbours kept per user, 0 turns propagation off. Defaults to `FRIEND_OF_FRIEND_TOP_K`.
+            weight (float, optional): Propagation weight. Defaults to `FRIEND_OF_FRIEND_WEIGHT`.
+            max_products (int, optional): Two-hop products held in memory at once. Defaults to `FRIEND_OF_FRIEND_MAX_PRODUCTS`.
+        """
+        self.propagation = {"top_k": top_k, "weight": weight, "max_products": max_products} if top_k > 0 else None
+        self.frozen_day = None
+
+    def affinities(self, user: int, authors: np.ndarray, now: int = None) -> np.ndarray:
+        """Gets affinity of `user` towards each author at `now`.
+
+        Args:
+            user (int): user
+            authors (np.ndarray): author ids
+            now (int, optional): Current time, in seconds. Defaults to None (current time).
+
+        Returns:
+            np.ndarray: affinity per author, 0 if there is no edge
+        """
+        return self.freeze(now).affinities(user, authors)
+
+    def edges(self, data: str = 'affinity') -> Iterator[tuple]:
+        """Iterates over edges with affinity for the current time.
+
+        Yields:
+            tuple: (`user`, `friend`, `affinity`)
+        """
+        return self.freeze().edges(data)
+
+
+def generate_affinity(users: dict, statuses, shares: dict, reactions: dict, comments: dict, now: int = None) -> CsrAffinity:
+    """Generates CSR affinity matrix, the array counterpart of `graph_generator.generate_graph`.
+
+    Args:
+        users (dict): all users, keyed by user id
+        statuses (dict | StatusTable): all statuses
+        shares (dict): all shares
+        reactions (dict): all reactions
+        comments (dict): all comments
+        now (int, optional): Time recency is measured from, in seconds. Defaults to None (current time).
+
+    Returns:
+        CsrAffinity: affinity matrix
+    """
+    return CsrAffinity.from_triples(*affinity_triples(users, statuses, shares, reactions, comments, now))
+
+
+def friend_of_friend_triples(friends: tuple, affinity: CsrAffinity, top_k: int = FRIEND_OF_FRIEND_TOP_K,
+                             weight: float = FRIEND_OF_FRIEND_WEIGHT, max_products: int = FRIEND_OF_FRIEND_MAX_PRODUCTS) -> tuple:
+    """Computes second degree affinity as the sparse product of the friendship and affinity matrices.
+    User `user` gets `weight * sum(affinity[friend, author]) / number of friends` towards every author its
+    friends have affinity to. Authors `user` already has an edge to and `user` itself are left out, and only the
+    `top_k` strongest second degree neighbours of each user are kept.
+
+    Users are processed in batches of at most `max_products` two-hop products, so memory and runtime grow
+    with the number of friendships times the affinity degree of the friends. The products of one user are
+    never split, a user over the ceiling forms a batch of its own.
+
+    Args:
+        friends (tuple): (`users`, `friends`) friendship arrays
+        affinity (CsrAffinity): direct affinity
+        top_k (int, optional): Second degree neighbours kept per user. Defaults to `FRIEND_OF_FRIEND_TOP_K`.
+        weight (float, optional): Propagation weight. Defaults to `FRIEND_OF_FRIEND_WEIGHT`.
+        max_products (int, optional): Two-hop products held in memory at once. Defaults to `FRIEND_OF_FRIEND_MAX_PRODUCTS`.
+
+    Returns:
+        tuple: (`actors`, `authors`, `weights`)
+    """
+    users, friends = _sum_by((np.asarray(friends[0], dtype=np.int64), np.asarray(friends[1], dtype=np.int64)),
+                             np.zeros(len(friends[0]), dtype=np.float64))[0]
+    empty: tuple = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64))
+    if len(users) == 0 or top_k <= 0:
+        return empty
+
+    heads: np.ndarray = np.flatnonzero(np.r_[True, users[1:] != users[:-1]])
+    friend_counts: np.ndarray = np.diff(np.r_[heads, len(users)])
+    rows: int = len(affinity.indptr) - 1
+    starts: np.ndarray = affinity.indptr[np.minimum(friends, rows)]
+    lengths: np.ndarray = affinity.indptr[np.minimum(friends + 1, rows)] - starts
+    ends: np.ndarray = np.cumsum(np.add.reduceat(lengths, heads))
+
+    size: int = max(int(users.max()), rows, int(affinity.indices.max(initial=-1)) + 1) + 1
+    direct_actors, direct_authors, _ = affinity.triples()
+    direct: np.ndarray = direct_actors * size + direct_authors
+
+    parts: list = []
+    first: int = 0
+    while first < len(heads):
+        limit: int = (ends[first - 1] if first else 0) + max_products
+        last: int = max(int(np.searchsorted(ends, limit, side="right")), first + 1)
+        edges: slice = slice(heads[first], heads[last] if last < len(heads) else len(users))
+        batch_lengths: np.ndarray = lengths[edges]
+        total: int = int(batch_lengths.sum())
+        first = last
+        if total == 0:
+            continue
+
+        offsets: np.ndarray = np.repeat(starts[edges] - np.cumsum(batch_lengths) + batch_lengths, batch_lengths)
+        positions: np.ndarray = offsets + np.arange(total)
+        actors: np.ndarray = np.repeat(users[edges], batch_lengths)
+        scale: np.ndarray = np.repeat(weight / np.repeat(friend_counts, friend_counts)[edges], batch_lengths)
+        keys: np.ndarray = actors * size + affinity.indices[positions]
+        keys, inverse = np.unique(keys, return_inverse=True)
+        sums: np.ndarray = np.bincount(inverse.ravel(), weights=affinity.data[positions] * scale, minlength=len(keys))
+
+        actors, authors = keys // size, keys % size
+        found: np.ndarray = np.minimum(np.searchsorted(direct, keys), max(len(direct) - 1, 0))
+        keep: np.ndarray = (actors != authors) & ~((direct[found] == keys) if len(direct) else np.zeros(len(keys), dtype=bool))
+        actors, authors, sums = actors[keep], authors[keep], sums[keep]
+
+        order: np.ndarray = np.lexsort((-sums, actors))
+        actors, authors, sums = actors[order], authors[order], sums[order]
+        group_heads: np.ndarray = np.flatnonzero(np.r_[True, actors[1:] != actors[:-1]]) if len(actors) else np.empty(0, dtype=np.int64)
+        ranks: np.ndarray = np.arange(len(actors)) - np.repeat(group_heads, np.diff(np.r_[group_heads, len(actors)]))
+        top: np.ndarray = ranks < top_k
+        parts.append((actors[top], authors[top], sums[top]))
+
+    if not parts:
+        return empty
+    return tuple(np.concatenate([part[i] for part in parts]) for i in range(3))
+
+
+def propagate_friends(graph, users: dict, top_k: int = FRIEND_OF_FRIEND_TOP_K, weight: float = FRIEND_OF_FRIEND_WEIGHT,
+                      max_products: int = FRIEND_OF_FRIEND_MAX_PRODUCTS) -> None:
+    """Adds friend of friend affinity to any backend, see `friend_of_friend_triples`. `CsrAffinity` and
+    `nx.DiGraph` are updated once, `BucketedAffinity` recomputes it whenever it is frozen for a new day.
+
+    Args:
+        graph (CsrAffinity | BucketedAffinity | nx.DiGraph): affinity graph
+        users (dict): all users, keyed by user id
+        top_k (int, optional): Second degree neighbours kept per user. Defaults to `FRIEND_OF_FRIEND_TOP_K`.
+        weight (float, optional): Propagation weight. Defaults to `FRIEND_OF_FRIEND_WEIGHT`.
+        max_products (int, optional): Two-hop products held in memory at once. Defaults to `FRIEND_OF_FRIEND_MAX_PRODUCTS`.
+    """
+    if isinstance(graph, BucketedAffinity):
+        graph.propagate(top_k, weight, max_products)
+        return
+    friends: tuple = friend_arrays(users)[:2]
+    if isinstance(graph, CsrAffinity):
+        graph.update(*friend_of_friend_triples(friends, graph, top_k, weight, max_products))
+        return
+    for user, friend, value in zip(*(part.tolist() for part in friend_of_friend_triples(friends, to_csr(graph), top_k, weight, max_products))):
+        add_affinity(user, friend, value, graph)
+
+
+def to_csr(graph, now: int = None) -> CsrAffinity:
+    """Gets affinity of any backend as a CSR matrix.
+
+    Args:
+        graph (CsrAffinity | BucketedAffinity | nx.DiGraph): affinity graph
+        now (int, optional): Current time for `BucketedAffinity`, in seconds. Defaults to None (current time).
+
+    Returns:
+        CsrAffinity: affinity matrix
+    """
+    if isinstance(graph, BucketedAffinity):
+        return graph.freeze(now)
+    if isinstance(graph, CsrAffinity):
+        return graph
+    edges: list = list(graph.edges(data='affinity'))
+    return CsrAffinity.from_triples(np.array([edge[0] for edge in edges], dtype=np.int64),
+                                    np.array([edge[1] for edge in edges], dtype=np.int64),
+                                    np.array([edge[2] for edge in edges], dtype=np.float64))
+
+
+def user_affinities(graph, user_id: int, now: int = None) -> tuple:
+    """Gets every author user has an edge to from any backend.
+
+    Args:
+        graph (CsrAffinity | BucketedAffinity | nx.DiGraph): affinity graph
+        user_id (int): user
+        now (int, optional): Current time for `BucketedAffinity`, in seconds. Defaults to None (current time).
+
+    Returns:
+        tuple: (`authors`, `affinities`)
+    """
+    if isinstance(graph, BucketedAffinity):
+        graph = graph.freeze(now)
+    if isinstance(graph, CsrAffinity):
+        return graph.row(user_id)
+    neighbours = graph[user_id] if user_id in graph else {}
+    return (np.fromiter(neighbours, dtype=np.int64, count=len(neighbours)),
+            np.fromiter((edge['affinity'] for edge in neighbours.values()), dtype=np.float64, count=len(neighbours)))
+
+
+def author_affinities(graph, user_id: int, authors: np.ndarray, now: int = None) -> np.ndarray:
+    """Gets affinity of user towards each author from any backend.
+
+    Args:
+        graph (CsrAffinity | BucketedAffinity | nx.DiGraph): affinity graph
+        user_id (int): user
+        authors (np.ndarray): author ids
+        now (int, optional): Current time for `BucketedAffinity`, in seconds. Defaults to None (current time).
+
+    Returns:
+        np.ndarray: affinity per author, 0 if there is no edge
+    """
+    if isinstance(graph, BucketedAffinity):
+        return graph.affinities(user_id, authors, now)
+    if isinstance(graph, CsrAffinity):
+        return graph.affinities(user_id, authors)
+    user = graph[user_id] if user_id in graph else {}
+    unique, inverse = np.unique(authors, return_inverse=True)
+    values: np.ndarray = np.array([user[author]['affinity'] if author in user else 0.0 for author in unique.tolist()], dtype=np.float64)
+    return values[inverse.ravel()]
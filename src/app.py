@@ -1,11 +1,25 @@
-import parse_dict
+import argparse
+import dataset_cache
+import ids
 import re
 import sys
 import time
-import networkx as nx
 from trie import Trie
+from compact_trie import CompactTrie
+from status_table import StatusTable
+from ingest import Ingestor
 import graph_generator
+import graph_snapshot
+import search_index
+import timestamps
+from affinity import BucketedAffinity, propagate_friends
 import feed
+import feed_store
+from result_cache import ResultCache
+from data_snapshot import DataSnapshot, SnapshotHolder
+from phrase_index import original_spans
+from status_table import SCORE_BUCKET
+import numpy as np
 
 
 REACTION_PATH_TEST: str = "dataset/test_reactions.csv"
@@ -20,28 +34,243 @@ STATUS_PATH_ORIGINAL: str = "dataset/original_statuses.csv"
 COMMENTS_PATH_ORIGINAL: str = "dataset/original_comments.csv"
 SHARES_PATH_ORIGINAL: str = "dataset/original_shares.csv"
 
+ORIGINAL_SOURCES: dict = {
+    "friends": FRIEND_PATH,
+    "statuses": STATUS_PATH_ORIGINAL,
+    "shares": SHARES_PATH_ORIGINAL,
+    "reactions": REACTION_PATH_ORIGINAL,
+    "comments": COMMENTS_PATH_ORIGINAL,
+}
 
-def main():
+AUTOCOMPLETE_SIZE: int = 10
+
+
+def load_datasets(sources: dict, workers: int, registry: ids.Registry) -> dict:
+    """Loads datasets through the snapshot cache, reports cache hit/miss and interns user and status ids.
+
+    Args:
+        sources (dict): (`kind` : `path`)
+        workers (int): number of parsing processes, 0 for all cores
+        registry (ids.Registry): id registry
+
+    Returns:
+        dict: (`kind` : `dataset keyed by ids`)
+    """
+    datasets, hits = dataset_cache.load_datasets(sources, workers)
+    for kind, path in sources.items():
+        print(f"{path}: cache {'hit' if hits[kind] else 'miss'}")
+    return ids.intern_datasets(datasets, registry)
+
+
+def build_graph(backend: str, sources: dict, datasets: dict, registry: ids.Registry, workers: int = 1, friends_of_friends: int = 0,
+                fof_weight: float = graph_generator.FRIEND_OF_FRIEND_WEIGHT,
+                fof_max_products: int = graph_generator.FRIEND_OF_FRIEND_MAX_PRODUCTS):
+    """Loads affinity graph from its snapshot or generates it from the datasets.
+
+    Args:
+        backend (str): `csr` or `networkx`
+        sources (dict): (`kind` : `path`) of the datasets
+        datasets (dict): interned datasets
+        registry (ids.Registry): id registry
+        workers (int, optional): Processes for a new networkx graph. Defaults to 1.
+        friends_of_friends (int, optional): Second degree neighbours added per user, 0 to disable. Defaults to 0.
+        fof_weight (float, optional): Friend of friend weight. Defaults to `FRIEND_OF_FRIEND_WEIGHT`.
+        fof_max_products (int, optional): Two-hop products held in memory at once. Defaults to `FRIEND_OF_FRIEND_MAX_PRODUCTS`.
+
+    Returns:
+        BucketedAffinity | nx.DiGraph: affinity graph
+    """
+    users, status_records, shares, reactions, comments = (datasets[kind] for kind in ("friends", "statuses", "shares", "reactions", "comments"))
+    if backend == "networkx":
+        now: int = timestamps.now()
+        graph, stale = graph_snapshot.load_graph(now, sources, registry)
+        if graph is None:
+            print(f"Graph snapshot not used: {stale}")
+            graph = graph_generator.generate_graph(users, status_records, shares, reactions, comments, now=now, workers=workers)
+            graph_snapshot.save_graph(graph, now, sources, registry)
+    else:
+        graph, stale = graph_snapshot.load_bucketed(sources, registry)
+        if graph is None:
+            print(f"Affinity snapshot not used: {stale}")
+            graph = BucketedAffinity.from_datasets(users, status_records, shares, reactions, comments)
+            graph_snapshot.save_bucketed(graph, sources, registry)
+    if friends_of_friends > 0:
+        propagate_friends(graph, users, friends_of_friends, fof_weight, fof_max_products)
+    return graph
+
+
+def build_trie(status_records: dict, kind: str = "compact") -> Trie:
+    """Inserts words of every status into a new trie.
+
+    Args:
+        status_records (dict): statuses keyed by status id
+        kind (str, optional): `compact` or `nodes`. Defaults to "compact".
+
+    Returns:
+        CompactTrie | Trie: search trie
+    """
+    trie: Trie = CompactTrie() if kind == "compact" else Trie()
+    for status in status_records:
+        trie.insert(status_records[status]['status_message'], status_records[status]['status_id'])
+    return trie
+
+
+def load_trie(status_path: str, status_records: dict, registry: ids.Registry, kind: str = "compact", rebuild: bool = False) -> Trie:
+    """Loads compact trie from the search index or builds it from the statuses and saves the index.
+
+    Args:
+        status_path (str): status dataset
+        status_records (dict): statuses keyed by status id
+        registry (ids.Registry): id registry
+        kind (str, optional): `compact` or `nodes`, the node trie is always built. Defaults to "compact".
+        rebuild (bool, optional): Build the index even if it is valid. Defaults to False.
+
+    Returns:
+        CompactTrie | Trie: search trie
+    """
+    if kind != "compact":
+        return build_trie(status_records, kind)
+    trie, stale = search_index.load_index(status_path, registry) if not rebuild else (None, "rebuild requested")
+    if trie is None:
+        print(f"Search index not used: {stale}")
+        trie = build_trie(status_records, kind)
+        search_index.save_index(trie, status_path, registry)
+    return trie
+
+
+def data_version(version: int) -> tuple:
+    """Gets version of the data results are computed from, it changes with data snapshots and score buckets.
+
+    Args:
+        version (int): data snapshot version
+
+    Returns:
+        tuple: data version
+    """
+    return (version, timestamps.now() // SCORE_BUCKET)
+
+
+def add_datasets(snapshot: DataSnapshot, backend: str, users: dict, datasets: dict) -> None:
+    """Adds statuses and interactions to the graph, status table and trie of a snapshot being built.
+
+    Args:
+        snapshot (DataSnapshot): next data snapshot
+        backend (str): `csr` or `networkx`
+        users (dict): all users, keyed by user id
+        datasets (dict): interned `statuses`, `shares`, `reactions` and `comments`
+    """
+    new_statuses, shares, reactions, comments = (datasets[kind] for kind in ("statuses", "shares", "reactions", "comments"))
+    if backend == "networkx":
+        graph_generator.add_affinities(snapshot.graph, graph_generator.generate_graph(users, new_statuses, shares, reactions, comments))
+    else:
+        snapshot.graph.add(users, new_statuses, shares, reactions, comments)
+    snapshot.statuses.insert(new_statuses)
+    for status in new_statuses:
+        snapshot.trie.insert(new_statuses[status]['status_message'], new_statuses[status]['status_id'])
+
+
+def search_phrase(graph, user_id: int, statuses: StatusTable, trie: Trie, phrase: str, users: ids.IdMap = None) -> tuple:
+    """Ranks statuses with `phrase` from the trie's phrase index.
+
+    Args:
+        graph (BucketedAffinity | nx.DiGraph): affinity graph
+        user_id (int): logged user
+        statuses (StatusTable): status table
+        trie (CompactTrie | Trie): search trie
+        phrase (str): phrase
+        users (ids.IdMap, optional): Id map used to show author names. Defaults to None.
+
+    Returns:
+        tuple: (ranked `feed.Status` list, (`status` : match offsets in its message))
+    """
+    matches: dict = trie.search_phrases(phrase)
+    ranked: list = feed.get_feed(graph, user_id, statuses, users=users, status_ids=list(matches))
+    return ranked, {status.status_id: original_spans(status.original_message, matches[status.status_id]) for status in ranked}
+
+
+def highlight(message: str, spans: list) -> str:
+    """Highlights character spans of a message.
+
+    Args:
+        message (str): message
+        spans (list): sorted (`start`, `end`) offsets
+
+    Returns:
+        str: message with highlighted spans
+    """
+    parts: list = []
+    last: int = 0
+    for start, end in spans:
+        parts.append(message[last:start] + f"\033[101m{message[start:end]}\033[0m")
+        last = end
+    return "".join(parts) + message[last:]
+
+
+def cached(cache: ResultCache, key: tuple, compute):
+    """Gets result from cache or computes and caches it.
+
+    Args:
+        cache (ResultCache): result cache
+        key (tuple): cache key
+        compute (Callable): computes result
+
+    Returns:
+        result
+    """
+    result = cache.get(key)
+    if result is None:
+        result = compute()
+        cache.put(key, result)
+    return result
+
+
+def main(workers: int = 1, backend: str = "csr", friends_of_friends: int = 0, fof_weight: float = graph_generator.FRIEND_OF_FRIEND_WEIGHT,
+         fof_max_products: int = graph_generator.FRIEND_OF_FRIEND_MAX_PRODUCTS, precompute: bool = False, trie_kind: str = "compact",
+         build_index: bool = False):
     start = time.time()
     print(f"Loading data...")
-    users: dict = parse_dict.load_friends_dict(FRIEND_PATH)
-    statuses: dict = parse_dict.load_statuses_dict(STATUS_PATH_ORIGINAL)
-    shares: dict = parse_dict.load_shares_dict(SHARES_PATH_ORIGINAL)
-    reactions: dict = parse_dict.load_reactions_dict(REACTION_PATH_ORIGINAL)
-    comments: dict = parse_dict.load_comments_dict(COMMENTS_PATH_ORIGINAL)
+    registry: ids.Registry = ids.Registry()
+    sources: dict = dict(ORIGINAL_SOURCES)
+    datasets: dict = load_datasets(sources, workers, registry)
+    users: dict = datasets["friends"]
+    status_records: dict = datasets["statuses"]
     print(f"Loading data: {time.time() - start}")
+
+    if build_index:
+        start = time.time()
+        load_trie(sources["statuses"], status_records, registry, rebuild=True)
+        print(f"Building search index: {time.time() - start}")
+        return
     
     start = time.time()
-    print("Generating graph...")    
-    graph: nx.DiGraph = graph_generator.load_graph("graph.obj")
-    if graph is None:
-        graph = graph_generator.generate_graph(users, statuses, shares, reactions, comments)
-
+    print("Generating graph...")
+    graph = build_graph(backend, sources, datasets, registry, workers, friends_of_friends, fof_weight, fof_max_products)
     print(f"Generating graph: {time.time() - start}")
 
-    trie: Trie = Trie()
-    for status in statuses:
-        trie.insert(statuses[status]['status_message'], statuses[status]['status_id'])
+    statuses: StatusTable = StatusTable.from_statuses(status_records)
+    settings: dict = {"affinity": backend, "friends_of_friends": friends_of_friends, "fof_weight": fof_weight}
+    if precompute:
+        start = time.time()
+        now: int = timestamps.now()
+        store: feed_store.FeedStore = feed_store.precompute_feeds(graph, statuses, np.arange(len(registry.users)), now, workers=workers)
+        feed_store.save_feeds(store, now, sources, registry, settings)
+        print(f"Precomputing {len(store)} feeds: {time.time() - start}")
+        return
+    store, stale = feed_store.load_feeds(timestamps.now(), sources, registry, settings)
+    if store is None:
+        print(f"Feed store not used: {stale}")
+    start = time.time()
+    trie: Trie = load_trie(sources["statuses"], status_records, registry, trie_kind)
+    print(f"Loading search index: {time.time() - start}")
+
+    ingestor: Ingestor = Ingestor({
+        "statuses": STATUS_PATH_ORIGINAL,
+        "comments": COMMENTS_PATH_ORIGINAL,
+        "reactions": REACTION_PATH_ORIGINAL,
+        "shares": SHARES_PATH_ORIGINAL,
+    }, registry)
+    ingestor.mark_loaded(dataset_cache.loaded_sizes({kind: sources[kind] for kind in ingestor.sources}))
+    holder: SnapshotHolder = SnapshotHolder(DataSnapshot(graph, statuses, trie, 0))
 
     while True:
         print("------------")
@@ -55,28 +284,42 @@ def main():
         elif operation == "load_test_data":
             start = time.time()
             print(f"Loading test data...")
-            test_statuses: dict = parse_dict.load_statuses_dict(STATUS_PATH_TEST)
-            test_shares: dict = parse_dict.load_shares_dict(SHARES_PATH_TEST)
-            test_reactions: dict = parse_dict.load_reactions_dict(REACTION_PATH_TEST)
-            test_comments: dict = parse_dict.load_comments_dict(COMMENTS_PATH_TEST)
+            test_data: dict = load_datasets({
+                "statuses": STATUS_PATH_TEST,
+                "shares": SHARES_PATH_TEST,
+                "reactions": REACTION_PATH_TEST,
+                "comments": COMMENTS_PATH_TEST,
+            }, workers, registry)
             print(f"Loading test data: {time.time() - start}")
-            graph_generator.generate_graph(users, test_statuses, test_shares, test_reactions, test_comments, graph)
-            for status in test_statuses:
-                trie.insert(test_statuses[status]['status_message'], test_statuses[status]['status_id'])
+            holder.update(lambda snapshot: add_datasets(snapshot, backend, users, test_data))
+            store = None
             break
              
     print("Username: ")
     username = input(">> ")
 
+    user_id: int = registry.users.get(username, ids.UNKNOWN_ID)
+    graph, statuses, trie, version = holder.current
+
     print(f"Welcome {username}!")
-    feed_statuses: list = feed.get_feed(graph, username, statuses)
+    cache: ResultCache = ResultCache()
+    feed_statuses: list = store.feed(user_id, statuses, registry.users) if store is not None else None
+    feed_cursor: str = None
+    if feed_statuses is None:
+        feed_statuses, feed_cursor = feed.get_feed_page(graph, user_id, statuses, users=registry.users, snapshot_version=version)
+    else:
+        feed_cursor = feed.page_cursor(graph, user_id, statuses, feed_statuses, snapshot_version=version)
     for status in feed_statuses:
         print(status.message)
 
     while True:
+        graph, statuses, trie, version = holder.current
         print("------------")
         print("Commands:")
         print("search")
+        print("more - Show next page of the feed")
+        print("ingest - Apply rows appended to the dataset files")
+        print("cache - Show result cache counters")
         print("exit")
         print("-----------")
         operation: str = input(">> ")
@@ -84,12 +327,8 @@ def main():
             term: str = input(">> Search: ")
             
             if term[0] != '"' and term[-1] != "*" and term[-1] != '"':
-                search_ids: dict = trie.search_words_union(term)
-                relevant_statuses: dict = {}
-                for status_id in search_ids:
-                    relevant_statuses[status_id] = statuses[status_id]  
-                    
-                search_statuses: list = feed.get_feed(graph, username, relevant_statuses, search_ids)
+                search_statuses: list = cached(cache, cache.key(user_id, "words", term, data_version(version)),
+                                               lambda: feed.get_feed(graph, user_id, statuses, trie.search_words_union(term), users=registry.users))
 
                 for status in search_statuses:
                     message: str = status.message
@@ -101,38 +340,50 @@ def main():
 
                     print(message)
             elif term[-1] == "*":
-                words: list = trie.autocomplete(term[:-1])
+                words: list = cached(cache, cache.key(None, "autocomplete", term[:-1], data_version(version)), lambda: trie.autocomplete(term[:-1], AUTOCOMPLETE_SIZE))
                 print("------------")
                 print("Popular search options:")
-                for word in words[:10]:
+                for word in words:
                     print(word[0], end=", ")
                 print()
                 print("------------")
             elif term[0] == '"' and term[-1] == '"':
-                term = term[1:-1] + " "
-                search_ids: list = trie.search_phrases(term, statuses)
-                relevant_statuses: dict = {}
-                for status_id in search_ids:
-                    relevant_statuses[status_id] = statuses[status_id]
-                
-                search_statuses: list = feed.get_feed(graph, username, relevant_statuses)
+                term = term[1:-1]
+                search_statuses, matches = cached(cache, cache.key(user_id, "phrase", term, data_version(version)),
+                                                  lambda: search_phrase(graph, user_id, statuses, trie, term, registry.users))
 
                 for status in search_statuses:
-                    message: str = status.message
-                    message_copy: str = "" + message
-                    highlighted_message: str = ""
-                    while True:
-                        has, index = trie.has_phrase(message_copy.lower(), term.lower())
-                        if not has:
-                            highlighted_message += message_copy
-                            break
-                        highlighted_message += message_copy[:index] + " " + f"\033[101m{term}\033[0m"
-                        message_copy = message_copy[index + len(term):]
-
-                    print(highlighted_message)
+                    original: str = status.original_message
+                    print(status.message.replace(original, highlight(original, matches[status.status_id]), 1))
                     print()
             else:
                 print("Invalid input!")
+        elif operation == "more":
+            if feed_cursor is None:
+                print("No more statuses.")
+                continue
+            try:
+                page, feed_cursor = feed.get_feed_page(graph, user_id, statuses, feed_cursor, users=registry.users, snapshot_version=version)
+            except feed.StaleCursorError:
+                print("Feed changed, showing it from the start.")
+                page, feed_cursor = feed.get_feed_page(graph, user_id, statuses, users=registry.users, snapshot_version=version)
+            if not page:
+                print("No more statuses.")
+            for status in page:
+                print(status.message)
+        elif operation == "ingest":
+            start = time.time()
+            applied, progress = holder.update(lambda snapshot: ingestor.ingest(snapshot.graph, snapshot.statuses, snapshot.trie))
+            ingestor.commit(progress)
+            store = None
+            if friends_of_friends > 0:
+                cache.clear()
+            else:
+                cache.invalidate_users(ingestor.touched_users)
+            print(", ".join(f"{kind}: {count}" for kind, count in applied.items()))
+            print(f"Ingesting: {time.time() - start}")
+        elif operation == "cache":
+            print(", ".join(f"{name}: {value}" for name, value in cache.stats().items()))
         elif operation == "exit":
             print("Exiting...")
             sys.exit(0)
@@ -140,6 +391,26 @@ def main():
             print("Invalid command!")
             
                                     
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    """Adds data loading options shared by the console and the HTTP server.
+
+    Args:
+        parser (argparse.ArgumentParser): argument parser
+    """
+    parser.add_argument("--workers", type=int, default=1, help="dataset parsing processes, 0 for all cores")
+    parser.add_argument("--affinity", choices=["csr", "networkx"], default="csr", help="affinity graph backend")
+    parser.add_argument("--friends-of-friends", type=int, default=0, help="second degree neighbours added per user, 0 to disable")
+    parser.add_argument("--fof-weight", type=float, default=graph_generator.FRIEND_OF_FRIEND_WEIGHT, help="friend of friend affinity weight")
+    parser.add_argument("--fof-max-products", type=int, default=graph_generator.FRIEND_OF_FRIEND_MAX_PRODUCTS,
+                        help="two-hop products held in memory at once")
+    parser.add_argument("--trie", choices=["compact", "nodes"], default="compact", help="search trie, arrays or one node per character")
+
+
 if __name__ == "__main__":
-    sys.setrecursionlimit(30000)
-    main()
+    parser = argparse.ArgumentParser(description="EdgeRank feed")
+    add_arguments(parser)
+    parser.add_argument("--precompute-feeds", action="store_true", help="rank feeds of every user into the feed store and exit")
+    parser.add_argument("--build-search-index", action="store_true", help="build the search index snapshot and exit")
+    args = parser.parse_args()
+    main(args.workers, args.affinity, args.friends_of_friends, args.fof_weight, args.fof_max_products, args.precompute_feeds, args.trie,
+         args.build_search_index)
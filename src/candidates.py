@@ -0,0 +1,111 @@
+"""Candidate index for feed ranking. Rows of a `StatusTable` are kept in two orders: all rows by descending
+base score, and rows grouped by author, each group by descending base score. A feed merges the groups of
+the authors a user has affinity to with the global order and stops after `k` statuses, or resumes after the
+last status of a previous page.
+"""
+
+import heapq
+from itertools import islice
+from typing import Iterator
+
+import numpy as np
+
+
+class CandidateIndex(object):
+    """Rows ordered by base score, globally and per author. Equal scores keep row order.
+    """
+    def __init__(self, scores: np.ndarray, authors: np.ndarray):
+        """
+        Args:
+            scores (np.ndarray): base score per row
+            authors (np.ndarray): author per row
+        """
+        self.scores: np.ndarray = scores
+        self.authors: np.ndarray = authors
+        self.ranked: np.ndarray = np.lexsort((np.arange(len(scores)), -scores))
+        self.ranked_keys: np.ndarray = -scores[self.ranked]
+        self.by_author: np.ndarray = self.ranked[np.argsort(authors[self.ranked], kind="stable")]
+        self.author_ptr: np.ndarray = np.zeros(int(authors.max(initial=-1)) + 2, dtype=np.int64)
+        np.cumsum(np.bincount(authors, minlength=len(self.author_ptr) - 1), out=self.author_ptr[1:])
+
+    def __author_head(self, author: int, position: int, affinity: float, stream: int) -> tuple:
+        end: int = int(self.author_ptr[author + 1])
+        if position >= end:
+            return None
+        row: int = int(self.by_author[position])
+        return (-float(self.scores[row]) * affinity, row, stream, position)
+
+    def __global_head(self, position: int, neighbours: set) -> tuple:
+        while position < len(self.ranked):
+            row: int = int(self.ranked[position])
+            if int(self.authors[row]) not in neighbours:
+                return (-float(self.scores[row]), row, -1, position)
+            position += 1
+        return None
+
+    def __author_start(self, author: int, affinity: float, after: tuple) -> int:
+        start, end = int(self.author_ptr[author]), int(self.author_ptr[author + 1])
+        if after is None:
+            return start
+        relevance, last_row = after
+        rows: np.ndarray = self.by_author[start:end]
+        relevances: np.ndarray = self.scores[rows] * affinity
+        later: np.ndarray = (relevances < relevance) | ((relevances == relevance) & (rows > last_row))
+        return start + int(np.argmax(later)) if later.any() else end
+
+    def __global_start(self, after: tuple) -> int:
+        if after is None:
+            return 0
+        relevance, last_row = after
+        first: int = int(np.searchsorted(self.ranked_keys, -relevance, side="left"))
+        last: int = int(np.searchsorted(self.ranked_keys, -relevance, side="right"))
+        return first + int(np.searchsorted(self.ranked[first:last], last_row, side="right"))
+
+    def ranked_rows(self, authors: np.ndarray, affinities: np.ndarray, after: tuple = None) -> Iterator[tuple]:
+        """Lazily yields rows by descending `base score * affinity`, where authors without affinity count as 1.
+        Equal relevances keep row order. Only the first entries of the neighbours' groups and of the global
+        order are visited, every stream starts with a binary search or a scan of one author past `after`.
+
+        Args:
+            authors (np.ndarray): authors the user has affinity to
+            affinities (np.ndarray): affinity per author
+            after (tuple, optional): (`relevance`, `row`) of the last row already returned. Defaults to None.
+
+        Yields:
+            tuple: (`row`, `relevance`)
+        """
+        neighbours: list = [(author, affinity) for author, affinity in zip(authors.tolist(), affinities.tolist())
+                            if affinity != 0.0 and author < len(self.author_ptr) - 1]
+        neighbour_set: set = {author for author, _ in neighbours}
+        heap: list = []
+        for stream, (author, affinity) in enumerate(neighbours):
+            heap.append(self.__author_head(author, self.__author_start(author, affinity, after), affinity, stream))
+        heap.append(self.__global_head(self.__global_start(after), neighbour_set))
+        heap = [entry for entry in heap if entry is not None]
+        heapq.heapify(heap)
+
+        while heap:
+            score, row, stream, position = heapq.heappop(heap)
+            yield row, -score
+            if stream < 0:
+                entry = self.__global_head(position + 1, neighbour_set)
+            else:
+                author, affinity = neighbours[stream]
+                entry = self.__author_head(author, position + 1, affinity, stream)
+            if entry is not None:
+                heapq.heappush(heap, entry)
+
+    def top(self, authors: np.ndarray, affinities: np.ndarray, k: int, after: tuple = None) -> tuple:
+        """Gets the `k` first rows of `ranked_rows`.
+
+        Args:
+            authors (np.ndarray): authors the user has affinity to
+            affinities (np.ndarray): affinity per author
+            k (int): number of rows
+            after (tuple, optional): (`relevance`, `row`) of the last row already returned. Defaults to None.
+
+        Returns:
+            tuple: (`rows`, `relevances`) sorted by descending relevance
+        """
+        ranked: list = list(islice(self.ranked_rows(authors, affinities, after), k))
+        return [row for row, _ in ranked], [relevance for _, relevance in ranked]
@@ -0,0 +1,515 @@
+"""Compact search trie. Words are stored once in a term table: one string with all terms, their counts and
+their posting lists as sorted `int32` status ids. A path compressed (radix) trie over the terms is kept in
+parallel arrays in preorder, so the subtree of a node is the node range up to `ends[node]` and its children
+are found by jumping from `node + 1` over sibling subtrees. Edge labels point into the term string, and
+`best` holds the largest word count of every subtree for best first autocompletion.
+
+Inserted words are staged and merged into the arrays by `compact`, which the first query after inserts
+runs. Children are ordered by the first insert of a word below them, so words come out in the same order
+as from `trie.Trie`.
+"""
+
+import bisect
+import heapq
+import re
+import threading
+from typing import NamedTuple
+
+import numpy as np
+
+from phrase_index import PhraseIndex
+from text import filter_chars, has_phrase
+from trie import suffix_range
+
+
+class RadixIndex(NamedTuple):
+    """Arrays of a compacted trie.
+    """
+    text: str
+    term_ptr: np.ndarray
+    counts: np.ndarray
+    post_ptr: np.ndarray
+    postings: np.ndarray
+    suffix_order: np.ndarray
+    label_start: np.ndarray
+    label_len: np.ndarray
+    ends: np.ndarray
+    node_term: np.ndarray
+    best: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.term_ptr) - 1
+
+    def term(self, term_id: int) -> str:
+        return self.text[int(self.term_ptr[term_id]):int(self.term_ptr[term_id + 1])]
+
+    def posting(self, term_id: int) -> np.ndarray:
+        return self.postings[int(self.post_ptr[term_id]):int(self.post_ptr[term_id + 1])]
+
+
+def empty_index() -> RadixIndex:
+    """Builds index without terms.
+
+    Returns:
+        RadixIndex: index with only the root node
+    """
+    return RadixIndex("", np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(1, dtype=np.int64),
+                      np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32), np.zeros(1, dtype=np.int32),
+                      np.zeros(1, dtype=np.int32), np.ones(1, dtype=np.int32), np.full(1, -1, dtype=np.int32),
+                      np.zeros(1, dtype=np.int64))
+
+
+def build_nodes(text: str, term_ptr: np.ndarray, counts: np.ndarray) -> tuple:
+    """Builds radix nodes over terms in preorder. Children of a node are ordered by their smallest term id.
+
+    Args:
+        text (str): all terms
+        term_ptr (np.ndarray): term offsets in `text`
+        counts (np.ndarray): count per term
+
+    Returns:
+        tuple: (`label_start`, `label_len`, `ends`, `node_term`, `best`) arrays
+    """
+    starts: list = term_ptr.tolist()
+    terms: list = [text[starts[term_id]:starts[term_id + 1]] for term_id in range(len(starts) - 1)]
+    order: list = sorted(range(len(terms)), key=terms.__getitem__)
+    words: list = [terms[term_id] for term_id in order]
+
+    label_start: list = []
+    label_len: list = []
+    node_term: list = []
+    parents: list = []
+    stack: list = [(-1, 0, len(words), 0, 0, 0)]
+    while stack:
+        parent, low, high, depth, start, length = stack.pop()
+        node: int = len(node_term)
+        parents.append(parent)
+        label_start.append(start)
+        label_len.append(length)
+        term_id: int = -1
+        if low < high and len(words[low]) == depth:
+            term_id = order[low]
+            low += 1
+        node_term.append(term_id)
+
+        groups: list = []
+        while low < high:
+            char: str = words[low][depth]
+            end: int = low + 1
+            while end < high and words[end][depth] == char:
+                end += 1
+            first, last = words[low], words[end - 1]
+            shared: int = depth + 1
+            while shared < len(first) and shared < len(last) and first[shared] == last[shared]:
+                shared += 1
+            groups.append((min(order[low:end]), low, end, shared))
+            low = end
+        groups.sort()
+        for first_term, group_low, group_high, shared in reversed(groups):
+            stack.append((node, group_low, group_high, shared, starts[first_term] + depth, shared - depth))
+
+    term_counts: list = counts.tolist()
+    best: list = [term_counts[term_id] if term_id >= 0 else 0 for term_id in node_term]
+    sizes: list = [1] * len(parents)
+    for node in range(len(parents) - 1, 0, -1):
+        sizes[parents[node]] += sizes[node]
+        best[parents[node]] = max(best[parents[node]], best[node])
+    ends: np.ndarray = np.arange(len(parents), dtype=np.int32) + np.asarray(sizes, dtype=np.int32)
+    return (np.asarray(label_start, dtype=np.int32), np.asarray(label_len, dtype=np.int32), ends,
+            np.asarray(node_term, dtype=np.int32), np.asarray(best, dtype=np.int64))
+
+
+def _subtrees(items: list, depth: int) -> list:
+    """Builds radix subtrees like `build_nodes` over items sharing their first `depth` characters.
+
+    Args:
+        items (list): (`chars`, offset of `chars` in the term string, `term id`, `node`) ordered by term id,
+            `node` is -1 for a word, an existing node is an item with its label as `chars` and term id -1
+        depth (int): shared characters
+
+    Returns:
+        list: subtrees, (`label_start`, `label_len`, `term id`, children) or (`label_start`, `label_len`, `node`) for an existing node
+    """
+    groups: dict = {}
+    for item in items:
+        if len(item[0]) > depth:
+            groups.setdefault(item[0][depth], []).append(item)
+    subtrees: list = []
+    for group in groups.values():
+        first: str = group[0][0]
+        shared: int = depth + 1
+        while all(len(item[0]) > shared and item[0][shared] == first[shared] for item in group):
+            shared += 1
+        start: int = group[0][1] + depth
+        ending: list = [item for item in group if len(item[0]) == shared]
+        if ending and ending[0][3] >= 0:
+            subtrees.append((start, shared - depth, ending[0][3]))
+        else:
+            subtrees.append((start, shared - depth, ending[0][2] if ending else -1, _subtrees(group, shared)))
+    return subtrees
+
+
+def _flatten(subtrees: list, counts: np.ndarray, best: np.ndarray, entries: list) -> int:
+    """Appends subtrees to `entries` in preorder, a new node as [`label_start`, `label_len`, `term id`, `best`,
+    `size`] and an existing node as (`node`, `label_start`, `label_len`).
+
+    Returns:
+        int: largest word count of the subtrees
+    """
+    largest: int = 0
+    for subtree in subtrees:
+        if len(subtree) == 3:
+            entries.append((subtree[2], subtree[0], subtree[1]))
+            largest = max(largest, int(best[subtree[2]]))
+            continue
+        entry: list = [subtree[0], subtree[1], subtree[2], int(counts[subtree[2]]) if subtree[2] >= 0 else 0, 1]
+        entries.append(entry)
+        position: int = len(entries)
+        entry[3] = max(entry[3], _flatten(subtree[3], counts, best, entries))
+        entry[4] += len(entries) - position
+        largest = max(largest, entry[3])
+    return largest
+
+
+def _place(first: int, second: int, child: int, cut: int, position: int) -> int:
+    """Maps a position in the entries of a node or split child to a node in the merged arrays.
+
+    Args:
+        first (int): start of the new children of a node or of the new nodes above a split child
+        second (int): start of the new nodes after the subtree of a split child
+        child (int): merged position of the split child, -1 for new children of a node
+        cut (int): position of the split child in the entries
+
+    Returns:
+        int: merged position
+    """
+    if child < 0 or position < cut:
+        return first + position
+    if position == cut:
+        return child
+    return second + position - cut - 1
+
+
+def merge_nodes(index: RadixIndex, text: str, term_ptr: np.ndarray, counts: np.ndarray, words: dict) -> tuple:
+    """Merges words into the radix nodes of `index` without rebuilding them. Every word is walked down the
+    existing nodes: it ends at a node, goes below a node as a new child or splits the label of a child. The
+    new nodes of a node or of a split child are built like `build_nodes` does and all of them are inserted
+    into the preorder arrays at once. New children go after the existing ones, new terms have larger ids.
+
+    Args:
+        index (RadixIndex): compacted arrays
+        text (str): all terms, the terms of `index` first
+        term_ptr (np.ndarray): term offsets in `text`
+        counts (np.ndarray): count per term
+        words (dict): (`word` : `term id`) of inserted words, new terms numbered after the terms of `index`
+
+    Returns:
+        tuple: (`label_start`, `label_len`, `ends`, `node_term`, `best`) arrays
+    """
+    ends: np.ndarray = index.ends
+    label_start: np.ndarray = index.label_start.copy()
+    label_len: np.ndarray = index.label_len.copy()
+    node_term: np.ndarray = index.node_term.copy()
+    path_nodes: list = []
+    path_counts: list = []
+    appended: dict = {}
+    split: dict = {}
+    for word, term_id in sorted(words.items(), key=lambda item: item[1]):
+        node, position, path = 0, 0, [0]
+        while position < len(word):
+            child: int = node + 1
+            while child < ends[node] and text[label_start[child]] != word[position]:
+                child = int(ends[child])
+            item: tuple = (word[position:], int(term_ptr[term_id]) + position, term_id, -1)
+            if child >= ends[node]:
+                appended.setdefault(node, (path, []))[1].append(item)
+                break
+            start, length = int(label_start[child]), int(label_len[child])
+            if text[start:start + length] != word[position:position + length]:
+                split.setdefault(child, (path, [(text[start:start + length], start, -1, child)]))[1].append(item)
+                break
+            node, position = child, position + length
+            path = path + [node]
+        else:
+            node_term[node] = term_id
+        path_nodes.extend(path)
+        path_counts.extend([int(counts[term_id])] * len(path))
+    best: np.ndarray = index.best.copy()
+    np.maximum.at(best, np.asarray(path_nodes, dtype=np.int64), np.asarray(path_counts, dtype=np.int64))
+
+    # blocks of new nodes as [existing node they go before, order on that node, entries, start]: new nodes
+    # above a split child go before it and the others after its subtree. `inside` counts the new nodes at
+    # the end of an existing subtree that belong to it
+    blocks: list = []
+    pieces: list = []
+    inside: dict = {}
+    for node, (path, items) in appended.items():
+        entries: list = []
+        _flatten(_subtrees(items, 0), counts, best, entries)
+        blocks.append([int(ends[node]), -len(path), entries, 0])
+        pieces.append((blocks[-1], blocks[-1], -1, len(entries), entries))
+        for parent in path:
+            if ends[parent] == ends[node]:
+                inside[parent] = inside.get(parent, 0) + len(entries)
+    for child, (path, items) in split.items():
+        entries = []
+        _flatten(_subtrees(items, 0), counts, best, entries)
+        cut: int = next(position for position, entry in enumerate(entries) if isinstance(entry, tuple))
+        _, label_start[child], label_len[child] = entries[cut]
+        blocks.append([child, -len(path) - 0.25, entries[:cut], 0])
+        blocks.append([int(ends[child]), -len(path) - 0.5, entries[cut + 1:], 0])
+        pieces.append((blocks[-2], blocks[-1], child, cut, entries))
+        for parent in path:
+            if ends[parent] == ends[child]:
+                inside[parent] = inside.get(parent, 0) + len(entries) - cut - 1
+    blocks.sort(key=lambda block: block[:2])
+
+    slots: np.ndarray = np.asarray([block[0] for block in blocks], dtype=np.int64)
+    before: np.ndarray = np.concatenate(([0], np.cumsum([len(block[2]) for block in blocks], dtype=np.int64)))
+    for block, start in zip(blocks, (slots + before[:-1]).tolist()):
+        block[3] = start
+    nodes: np.ndarray = np.arange(len(ends), dtype=np.int64)
+    positions: np.ndarray = nodes + before[np.searchsorted(slots, nodes, side="right")]
+    new_ends: np.ndarray = ends + before[np.searchsorted(slots, ends, side="left")]
+    if inside:
+        new_ends[list(inside)] += np.asarray(list(inside.values()), dtype=np.int64)
+
+    size: int = len(ends) + int(before[-1])
+    columns: tuple = (np.zeros(size, dtype=np.int32), np.zeros(size, dtype=np.int32), np.zeros(size, dtype=np.int32),
+                      np.zeros(size, dtype=np.int32), np.zeros(size, dtype=np.int64))
+    for column, values in zip(columns, (label_start, label_len, new_ends, node_term, best)):
+        column[positions] = values
+    for first, second, child, cut, entries in pieces:
+        child = int(positions[child]) if child >= 0 else -1
+        for position, entry in enumerate(entries):
+            if isinstance(entry, list):
+                node = _place(first[3], second[3], child, cut, position)
+                columns[0][node], columns[1][node], columns[3][node], columns[4][node] = entry[:4]
+                columns[2][node] = _place(first[3], second[3], child, cut, position + entry[4])
+    return columns
+
+
+class CompactTrie(object):
+    """Trie with the interface of `trie.Trie`, stored in arrays. `copy` shares the arrays, they are never
+    changed in place. Phrases are searched in the positional index `phrases`.
+    """
+    def __init__(self, index: RadixIndex = None, phrases: PhraseIndex = None):
+        """
+        Args:
+            index (RadixIndex, optional): Compacted arrays. Defaults to None (empty trie).
+            phrases (PhraseIndex, optional): Phrase index of the same statuses. Defaults to None (empty index).
+        """
+        self.index: RadixIndex = index if index is not None else empty_index()
+        self.phrases: PhraseIndex = phrases if phrases is not None else PhraseIndex()
+        self.pending: dict = {}
+        self.lock: threading.Lock = threading.Lock()
+        self.version: int = 0
+
+    def copy(self) -> "CompactTrie":
+        """Copies trie without copying arrays.
+
+        Returns:
+            CompactTrie: copy
+        """
+        trie: CompactTrie = CompactTrie(self.index, self.phrases.copy())
+        trie.pending = {word: [count, list(status_ids)] for word, (count, status_ids) in self.pending.items()}
+        trie.version = self.version
+        return trie
+
+    def insert(self, status: str, id: int):
+        """Inserts status words into trie.
+
+        Args:
+            status (str): status
+            id (int): status id
+        """
+        self.version += 1
+        self.phrases.insert(status, id)
+        for word in filter_chars(status).split(" "):
+            entry: list = self.pending.get(word)
+            if entry is None:
+                entry = self.pending[word] = [0, []]
+            entry[0] += 1
+            entry[1].append(id)
+
+    def compact(self) -> RadixIndex:
+        """Merges inserted words into the arrays. Postings are merged per inserted word, new terms are
+        inserted into the suffix order and the radix nodes, which are only built from scratch for an empty
+        trie.
+
+        Returns:
+            RadixIndex: compacted arrays
+        """
+        with self.lock:
+            if not self.pending:
+                return self.index
+            index: RadixIndex = self.index
+            terms: int = len(index)
+            new_words: list = []
+            term_ids: list = []
+            for word in self.pending:
+                term_id: int = self.__find(index, word)
+                if term_id < 0:
+                    term_id = terms + len(new_words)
+                    new_words.append(word)
+                term_ids.append(term_id)
+            entries: list = list(self.pending.values())
+
+            text: str = index.text + "".join(new_words)
+            term_ptr: np.ndarray = np.concatenate((index.term_ptr, index.term_ptr[-1] + np.cumsum([len(word) for word in new_words], dtype=np.int64)))
+            counts: np.ndarray = np.concatenate((index.counts, np.zeros(len(new_words), dtype=np.int64)))
+            np.add.at(counts, term_ids, [count for count, _ in entries])
+
+            post_counts: np.ndarray = np.concatenate((np.diff(index.post_ptr), np.zeros(len(new_words), dtype=np.int64)))
+            post_at: list = []
+            post_ids: list = []
+            for term_id, (_, status_ids) in zip(term_ids, entries):
+                if term_id >= terms:
+                    continue
+                ids: np.ndarray = np.unique(np.asarray(status_ids, dtype=np.int32))
+                posting: np.ndarray = index.posting(term_id)
+                at: np.ndarray = np.searchsorted(posting, ids)
+                fresh: np.ndarray = posting[np.minimum(at, len(posting) - 1)] != ids
+                post_counts[term_id] += int(np.count_nonzero(fresh))
+                post_at.append(at[fresh] + index.post_ptr[term_id])
+                post_ids.append(ids[fresh])
+            new_entries: list = [(term_id, status_ids) for term_id, (_, status_ids) in zip(term_ids, entries) if term_id >= terms]
+            new_terms: np.ndarray = np.repeat(np.asarray([term_id for term_id, _ in new_entries], dtype=np.int64),
+                                              [len(status_ids) for _, status_ids in new_entries])
+            new_ids: np.ndarray = np.asarray([status_id for _, status_ids in new_entries for status_id in status_ids], dtype=np.int64)
+            pairs: np.ndarray = np.unique((new_terms << 32) | new_ids)
+            post_counts[terms:] = np.bincount((pairs >> 32) - terms, minlength=len(new_words))
+            post_at.append(np.full(len(pairs), len(index.postings), dtype=np.int64))
+            post_ids.append((pairs & 0xFFFFFFFF).astype(np.int32))
+            postings: np.ndarray = np.insert(index.postings, np.concatenate(post_at), np.concatenate(post_ids))
+            post_ptr: np.ndarray = np.zeros(len(term_ptr), dtype=np.int64)
+            np.cumsum(post_counts, out=post_ptr[1:])
+
+            reversed_words: list = sorted((word[::-1], term_id) for term_id, word in enumerate(new_words, terms))
+            suffix_at: list = [bisect.bisect_left(index.suffix_order, chars, key=lambda term_id: index.term(term_id)[::-1])
+                               for chars, _ in reversed_words]
+            suffix_order: np.ndarray = np.insert(index.suffix_order, suffix_at, [term_id for _, term_id in reversed_words]).astype(np.int32)
+            if terms:
+                nodes: tuple = merge_nodes(index, text, term_ptr, counts, dict(zip(self.pending, term_ids)))
+            else:
+                nodes = build_nodes(text, term_ptr, counts)
+            self.index = RadixIndex(text, term_ptr, counts, post_ptr, postings, suffix_order, *nodes)
+            self.pending = {}
+            return self.index
+
+    def __current(self) -> RadixIndex:
+        return self.compact() if self.pending else self.index
+
+    @staticmethod
+    def __walk(index: RadixIndex, word: str) -> tuple:
+        """Follows `word` from the root.
+
+        Args:
+            index (RadixIndex): arrays
+            word (str): word
+
+        Returns:
+            tuple: (node the word ends in or below, -1 if the word is not a prefix of a term; True if it ends exactly at the node)
+        """
+        node: int = 0
+        position: int = 0
+        while position < len(word):
+            child: int = node + 1
+            end: int = int(index.ends[node])
+            while child < end and index.text[int(index.label_start[child])] != word[position]:
+                child = int(index.ends[child])
+            if child >= end:
+                return -1, False
+            start, length = int(index.label_start[child]), int(index.label_len[child])
+            taken: int = min(length, len(word) - position)
+            if index.text[start:start + taken] != word[position:position + taken]:
+                return -1, False
+            position += taken
+            node = child
+            if taken < length:
+                return node, False
+        return node, True
+
+    def __find(self, index: RadixIndex, word: str) -> int:
+        node, exact = self.__walk(index, word)
+        return int(index.node_term[node]) if node >= 0 and exact else -1
+
+    def autocomplete(self, prefix: str, k: int = None) -> list:
+        """Autocomletes word. All words are sorted at once, the `k` first are found best first by the
+        largest count of every subtree, visiting only the paths to them and their siblings.
+
+        Args:
+            prefix (str): word prefix
+            k (int, optional): Number of words. Defaults to None (all words).
+
+        Returns:
+            list: (`word`, `word count`) pairs, the most frequent first, equal counts in trie order
+        """
+        index: RadixIndex = self.__current()
+        node, _ = self.__walk(index, filter_chars(prefix))
+        if node < 0:
+            return []
+        if k is None:
+            term_ids: np.ndarray = index.node_term[node:int(index.ends[node])]
+            term_ids = term_ids[term_ids >= 0]
+            term_ids = term_ids[np.argsort(-index.counts[term_ids], kind="stable")]
+            return [(index.term(term_id), int(index.counts[term_id])) for term_id in term_ids.tolist()]
+
+        words: list = []
+        heap: list = [(-int(index.best[node]), node, 1)]
+        while heap and len(words) < k:
+            count, node, is_subtree = heapq.heappop(heap)
+            term_id: int = int(index.node_term[node])
+            if not is_subtree:
+                words.append((index.term(term_id), -count))
+                continue
+            if term_id >= 0:
+                heapq.heappush(heap, (-int(index.counts[term_id]), node, 0))
+            end: int = int(index.ends[node])
+            child: int = node + 1
+            while child < end:
+                heapq.heappush(heap, (-int(index.best[child]), child, 1))
+                child = int(index.ends[child])
+        return words
+
+    def suffix_terms(self, chars: str) -> np.ndarray:
+        """Finds terms ending with `chars`, the way `trie.Trie` matches a search word.
+
+        Args:
+            chars (str): word
+
+        Returns:
+            np.ndarray: term ids
+        """
+        index: RadixIndex = self.__current()
+        low, high = suffix_range(index.suffix_order, chars, key=lambda term_id: index.term(term_id)[::-1])
+        return index.suffix_order[low:high]
+
+    def search_words_union(self, term: str) -> dict:
+        """Search statuses with `term`. It can search for muliple terms.
+
+        Args:
+            term (str): term
+
+        Returns:
+            dict: (`status` : `word count`)
+        """
+        index: RadixIndex = self.__current()
+        status_ids: dict = {}
+        for word in re.findall(r'\b\w+\b', filter_chars(term)):
+            term_ids: list = self.suffix_terms(word).tolist()
+            if not term_ids:
+                continue
+            for status_id in np.unique(np.concatenate([index.posting(term_id) for term_id in term_ids])).tolist():
+                status_ids[status_id] = status_ids.get(status_id, 0) + 1
+        return status_ids
+
+    def has_phrase(self, status: str, phrase: str) -> tuple:
+        """Checks if status have `phrase`, see `text.has_phrase`.
+        """
+        return has_phrase(status, phrase)
+
+    def search_phrases(self, phrase: str) -> dict:
+        """Search for phrases, see `PhraseIndex.find`.
+        """
+        return self.phrases.find(phrase)
@@ -0,0 +1,61 @@
+"""Immutable versions of the served data. A `DataSnapshot` bundles the affinity graph, the status table, the
+trie and a version number, and is never changed once published. Readers take `SnapshotHolder.current` and
+use it without locking. Writers build the next version from copies and publish it with one reference
+assignment, so a reader sees either the old or the new version, never a mix.
+"""
+
+import threading
+from typing import Callable, NamedTuple
+
+import networkx as nx
+
+from graph_generator import share_graph
+from status_table import StatusTable
+from trie import Trie
+
+
+class DataSnapshot(NamedTuple):
+    """Data served by one version.
+    """
+    graph: object
+    statuses: StatusTable
+    trie: Trie
+    version: int
+
+    def copy(self) -> "DataSnapshot":
+        """Copies data for the next version. The status table, the trie and the graph share everything they
+        do not change, `nx.DiGraph` only copies its node maps, see `graph_generator.share_graph`.
+
+        Returns:
+            DataSnapshot: copy with the next version number
+        """
+        graph = share_graph(self.graph) if isinstance(self.graph, nx.DiGraph) else self.graph.copy()
+        return DataSnapshot(graph, self.statuses.copy(), self.trie.copy(), self.version + 1)
+
+
+class SnapshotHolder(object):
+    """Reference to the current snapshot. Writers are serialized, readers never wait.
+    """
+    def __init__(self, snapshot: DataSnapshot):
+        """
+        Args:
+            snapshot (DataSnapshot): first version
+        """
+        self.current: DataSnapshot = snapshot
+        self.lock: threading.Lock = threading.Lock()
+
+    def update(self, change: Callable[[DataSnapshot], object]):
+        """Builds the next version by applying `change` to a copy of the current one and publishes it.
+        If `change` raises, nothing is published.
+
+        Args:
+            change (Callable[[DataSnapshot], object]): changes the graph, statuses and trie of the copy in place
+
+        Returns:
+            result of `change`
+        """
+        with self.lock:
+            following: DataSnapshot = self.current.copy()
+            result = change(following)
+            self.current = following
+        return result
@@ -0,0 +1,380 @@
+"""Binary snapshot cache for parsed datasets.
+
+Each parsed CSV is written to `CACHE_DIR` as one `snapshot` file holding column arrays and a string table.
+A snapshot is valid while its source file keeps the same size and mtime, or the same content hash if only
+the mtime moved, then the snapshot takes the new mtime. Otherwise the CSV is parsed again and the snapshot
+is rewritten.
+"""
+
+from typing import Iterable, Iterator
+from datetime import datetime
+import hashlib
+import os
+
+import numpy as np
+
+import parallel_load
+import parse_dict
+import timestamps
+from snapshot import read_arrays, read_header, update_header, write_snapshot
+
+
+CACHE_DIR: str = "cache"
+SNAPSHOT_VERSION: int = 4
+HASH_CHUNK_SIZE: int = 1 << 20
+READ_ROWS: int = 1 << 16
+
+
+def _friends_records(path: str, size: int = None) -> Iterator[dict]:
+    for user, friends in parse_dict.iter_friends(path, size):
+        yield {"user": user, "friends": friends}
+
+
+def _statuses_from_records(records: Iterable[dict]) -> dict:
+    return {record["status_id"]: record for record in records}
+
+
+def _friends_from_records(records: Iterable[dict]) -> dict:
+    return {record["user"]: record["friends"] for record in records}
+
+
+def _statuses_to_records(statuses: dict) -> list:
+    return list(statuses.values())
+
+
+def _groups_to_records(groups: dict) -> list:
+    return [record for records in groups.values() for record in records]
+
+
+def _friends_to_records(friends: dict) -> list:
+    return [{"user": user, "friends": user_friends} for user, user_friends in friends.items()]
+
+
+DATASETS: dict = {
+    "statuses": (parse_dict.iter_statuses, _statuses_from_records, _statuses_to_records),
+    "comments": (parse_dict.iter_comments, lambda records: parse_dict.group_by(records, "comment_author"), _groups_to_records),
+    "reactions": (parse_dict.iter_reactions, lambda records: parse_dict.group_by(records, "reactor"), _groups_to_records),
+    "shares": (parse_dict.iter_shares, lambda records: parse_dict.group_by(records, "sharer"), _groups_to_records),
+    "friends": (_friends_records, _friends_from_records, _friends_to_records),
+}
+
+
+def file_hash(path: str) -> str:
+    """Hashes file content.
+
+    Args:
+        path (str): file path
+
+    Returns:
+        str: hex digest
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def fingerprint(path: str, content_hash: str = None) -> dict:
+    """Gets size, mtime and content hash of `path`.
+
+    Args:
+        path (str): file path
+        content_hash (str, optional): Already computed hash. Defaults to None.
+
+    Returns:
+        dict: source file fingerprint
+    """
+    stat = os.stat(path)
+    return {
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "hash": content_hash if content_hash is not None else file_hash(path),
+    }
+
+
+def snapshot_path(kind: str, path: str, cache_dir: str = CACHE_DIR) -> str:
+    """Gets snapshot file path for a dataset.
+
+    Args:
+        kind (str): dataset kind, key of `DATASETS`
+        path (str): source file path
+        cache_dir (str, optional): Cache directory. Defaults to `CACHE_DIR`.
+
+    Returns:
+        str: snapshot file path
+    """
+    name: str = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(cache_dir, f"{name}.{kind}.snap")
+
+
+def _column_kind(value) -> str:
+    if isinstance(value, bool):
+        raise TypeError("Boolean columns are not supported.")
+    if isinstance(value, int):
+        return "int"
+    if isinstance(value, float):
+        return "float"
+    if isinstance(value, datetime):
+        return "datetime"
+    if isinstance(value, str):
+        return "str"
+    if isinstance(value, list):
+        return "strlist"
+    raise TypeError(f"Unsupported column value: {type(value).__name__}")
+
+
+class _StringTable(object):
+    """Deduplicated utf-8 strings addressed by index.
+    """
+    def __init__(self):
+        self.index: dict = {}
+        self.encoded: list = []
+
+    def add(self, value: str) -> int:
+        position = self.index.get(value)
+        if position is None:
+            position = len(self.encoded)
+            self.index[value] = position
+            self.encoded.append(value.encode("utf-8"))
+        return position
+
+    def arrays(self) -> tuple:
+        lengths = np.fromiter((len(value) for value in self.encoded), dtype=np.int64, count=len(self.encoded))
+        offsets = np.zeros(len(self.encoded) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        return offsets, np.frombuffer(b"".join(self.encoded), dtype=np.uint8)
+
+
+def _encode_columns(records: list) -> dict:
+    """Turns records into named arrays.
+
+    Args:
+        records (list): records with the same keys
+
+    Returns:
+        dict: (`name` : (`kind`, arrays))
+    """
+    strings = _StringTable()
+    columns: dict = {}
+    if not records:
+        return columns
+
+    for name, sample in records[0].items():
+        kind: str = _column_kind(sample)
+        values: list = [record[name] for record in records]
+        if kind == "int":
+            arrays = (np.array(values, dtype=np.int64),)
+        elif kind == "float":
+            arrays = (np.array(values, dtype=np.float64),)
+        elif kind == "datetime":
+            arrays = (np.array([timestamps.to_timestamp(value) for value in values], dtype=np.int64),)
+        elif kind == "str":
+            arrays = (np.array([strings.add(value) for value in values], dtype=np.int32),)
+        else:
+            lengths = np.array([len(value) for value in values], dtype=np.int64)
+            offsets = np.zeros(len(values) + 1, dtype=np.int64)
+            np.cumsum(lengths, out=offsets[1:])
+            items = np.array([strings.add(item) for value in values for item in value], dtype=np.int32)
+            arrays = (offsets, items)
+        columns[name] = (kind, arrays)
+
+    columns["__strings__"] = ("strings", strings.arrays())
+    return columns
+
+
+def write_dataset(file_path: str, source: dict, records: list, loaded: int = None) -> None:
+    """Writes records to a snapshot file.
+
+    Args:
+        file_path (str): snapshot file path
+        source (dict): source file fingerprint
+        records (list): parsed records
+        loaded (int, optional): Source bytes the records were parsed from. Defaults to None (the fingerprinted size).
+    """
+    layout: list = []
+    arrays: dict = {}
+    for name, (kind, column_arrays) in _encode_columns(records).items():
+        layout.append({"name": name, "kind": kind, "arrays": len(column_arrays)})
+        for i, array in enumerate(column_arrays):
+            arrays[f"{name}/{i}"] = array
+
+    write_snapshot(file_path, {
+        "version": SNAPSHOT_VERSION,
+        "source": source,
+        "loaded": source["size"] if loaded is None else loaded,
+        "count": len(records),
+        "columns": layout,
+    }, arrays)
+
+
+def read_dataset_header(file_path: str) -> dict:
+    """Reads dataset snapshot header.
+
+    Args:
+        file_path (str): snapshot file path
+
+    Returns:
+        dict: header, None if the file is missing, not a snapshot or of another version
+    """
+    header: dict = read_header(file_path)
+    if header is None or header.get("version") != SNAPSHOT_VERSION:
+        return None
+    return header
+
+
+def iter_dataset(file_path: str, rows: int = READ_ROWS) -> Iterator[dict]:
+    """Reads records from a snapshot through mmap. Columns stay arrays of the mapping, they are turned into
+    records `rows` at a time, and strings are decoded when a record first uses them.
+
+    Args:
+        file_path (str): snapshot file path
+        rows (int, optional): Records converted at once. Defaults to `READ_ROWS`.
+
+    Yields:
+        dict: record
+    """
+    header, arrays = read_arrays(file_path)
+    count: int = header["count"]
+    if count == 0:
+        return
+
+    string_data: np.ndarray = arrays.pop("__strings__/1")
+    bounds: np.ndarray = arrays.pop("__strings__/0")
+    strings: dict = {}
+
+    def string(index: int) -> str:
+        value: str = strings.get(index)
+        if value is None:
+            value = strings[index] = string_data[bounds[index]:bounds[index + 1]].tobytes().decode("utf-8")
+        return value
+
+    columns: list = [(column["name"], column["kind"], [arrays[f"{column['name']}/{i}"] for i in range(column["arrays"])])
+                     for column in header["columns"] if column["kind"] != "strings"]
+    names: list = [name for name, _, _ in columns]
+    for low in range(0, count, rows):
+        high: int = min(low + rows, count)
+        values: list = []
+        for _, kind, column_arrays in columns:
+            if kind in ("int", "float"):
+                column_values = column_arrays[0][low:high].tolist()
+            elif kind == "datetime":
+                column_values = [timestamps.to_datetime(value) for value in column_arrays[0][low:high].tolist()]
+            elif kind == "str":
+                column_values = [string(index) for index in column_arrays[0][low:high].tolist()]
+            else:
+                offsets: list = column_arrays[0][low:high + 1].tolist()
+                items: list = [string(index) for index in column_arrays[1][offsets[0]:offsets[-1]].tolist()]
+                column_values = [items[start - offsets[0]:end - offsets[0]] for start, end in zip(offsets, offsets[1:])]
+            values.append(column_values)
+        for row in zip(*values):
+            yield dict(zip(names, row))
+
+
+def is_fresh(source: dict, path: str) -> bool:
+    """Checks that `path` still matches a fingerprint. Size and mtime are compared first, the content
+    hash only when the mtime moved. If the hash matches, `source` takes the new mtime, so a snapshot that
+    stores it again is not hashed on the next check.
+
+    Args:
+        source (dict): fingerprint from `fingerprint`
+        path (str): file path
+
+    Returns:
+        bool: True if the file is unchanged
+    """
+    if not os.path.exists(path):
+        return False
+    stat = os.stat(path)
+    if stat.st_size != source["size"]:
+        return False
+    if stat.st_mtime_ns == source["mtime_ns"]:
+        return True
+    if file_hash(path) != source["hash"]:
+        return False
+    source["mtime_ns"] = stat.st_mtime_ns
+    return True
+
+
+def _load_snapshot(kind: str, path: str, cache_dir: str) -> dict:
+    file_path: str = snapshot_path(kind, path, cache_dir)
+    header: dict = read_dataset_header(file_path)
+    if header is None or not is_fresh(header["source"], path):
+        return None
+    update_header(file_path, header)
+    _, build, _ = DATASETS[kind]
+    return build(iter_dataset(file_path))
+
+
+def load_dataset(kind: str, path: str, cache_dir: str = CACHE_DIR) -> tuple:
+    """Loads dataset from its snapshot, or parses `path` and writes a new snapshot if it is missing or stale.
+
+    Args:
+        kind (str): dataset kind, key of `DATASETS`
+        path (str): source CSV path
+        cache_dir (str, optional): Cache directory. Defaults to `CACHE_DIR`.
+
+    Returns:
+        tuple: (`dataset`, `cache hit`)
+    """
+    dataset: dict = _load_snapshot(kind, path, cache_dir)
+    if dataset is not None:
+        return dataset, True
+
+    iter_records, build, _ = DATASETS[kind]
+    source: dict = fingerprint(path)
+    loaded: int = parse_dict.complete_size(path, source["size"])
+    records: list = list(iter_records(path, loaded))
+    write_dataset(snapshot_path(kind, path, cache_dir), source, records, loaded)
+    return build(records), False
+
+
+def load_datasets(sources: dict, workers: int = 1, cache_dir: str = CACHE_DIR) -> tuple:
+    """Loads several datasets through the cache. With more than one worker, cache misses are parsed in
+    parallel by `parallel_load`.
+
+    Args:
+        sources (dict): (`kind` : `path`)
+        workers (int, optional): Number of parsing processes, 0 for all cores. Defaults to 1.
+        cache_dir (str, optional): Cache directory. Defaults to `CACHE_DIR`.
+
+    Returns:
+        tuple: ((`kind` : `dataset`), (`kind` : `cache hit`))
+    """
+    if workers == 1:
+        loaded: dict = {kind: load_dataset(kind, path, cache_dir) for kind, path in sources.items()}
+        return {kind: loaded[kind][0] for kind in loaded}, {kind: loaded[kind][1] for kind in loaded}
+
+    datasets: dict = {}
+    missing: dict = {}
+    for kind, path in sources.items():
+        dataset: dict = _load_snapshot(kind, path, cache_dir)
+        if dataset is None:
+            missing[kind] = path
+        else:
+            datasets[kind] = dataset
+
+    if missing:
+        fingerprints: dict = {kind: fingerprint(path) for kind, path in missing.items()}
+        loaded: dict = {kind: parse_dict.complete_size(path, fingerprints[kind]["size"]) for kind, path in missing.items()}
+        parsed: dict = parallel_load.load_datasets(missing, workers or None, sizes=loaded)
+        for kind, path in missing.items():
+            _, _, to_records = DATASETS[kind]
+            write_dataset(snapshot_path(kind, path, cache_dir), fingerprints[kind], to_records(parsed[kind]), loaded[kind])
+        datasets.update(parsed)
+
+    return {kind: datasets[kind] for kind in sources}, {kind: kind not in missing for kind in sources}
+
+
+def loaded_sizes(sources: dict, cache_dir: str = CACHE_DIR) -> dict:
+    """Gets the number of bytes of every source the loaded snapshots hold, up to the last complete record.
+    Rows appended after the load, and the rest of a row that was half written, start there.
+
+    Args:
+        sources (dict): (`kind` : `path`), loaded by `load_datasets`
+        cache_dir (str, optional): Cache directory. Defaults to `CACHE_DIR`.
+
+    Returns:
+        dict: (`path` : `loaded bytes`)
+    """
+    return {path: read_dataset_header(snapshot_path(kind, path, cache_dir))["loaded"] for kind, path in sources.items()}
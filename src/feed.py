@@ -1,58 +1,210 @@
+import base64
+import json
+from typing import Iterable
 import networkx as nx
-from graph_generator import get_date_difference_multiplier
-from graph_generator import SHARE_WEIGHT, COMMENT_WEIGHT, REACTION_WEIGHT
-import operator
+import numpy as np
+import timestamps
+from ids import IdMap
+from status_table import SCORE_BUCKET, StatusTable
+from affinity import author_affinities, user_affinities
+
+
+FEED_SIZE: int = 10
+
+
+class StaleCursorError(ValueError):
+    """Raised for a cursor of statuses or scores that changed since its page.
+    """
 
 
 class Status(object):
-    """Status class that stores message and relevance.
+    """Ranked status: a status id and its relevance. The message is rendered from the status table only when
+    it is read.
+    """
+    __slots__ = ("status_id", "relevance", "statuses", "users")
+
+    def __init__(self, status_id: int, relevance: float, statuses: StatusTable, users: IdMap = None):
+        self.status_id: int = status_id
+        self.relevance: float = relevance
+        self.statuses: StatusTable = statuses
+        self.users: IdMap = users
+
+    @property
+    def original_message(self) -> str:
+        return self.statuses.message(self.status_id)
+
+    @property
+    def message(self) -> str:
+        status: dict = self.statuses[self.status_id]
+        author = self.users.name(status['author']) if self.users is not None else status['author']
+        return f"\nMessage: {status['status_message']}\nLink: {status['status_link']}\nPublished: {timestamps.format_timestamp(status['status_published'])}\nAuthor: {author}"
+
+
+def top_k(scores: np.ndarray, k: int = FEED_SIZE) -> np.ndarray:
+    """Selects positions of the `k` highest scores in linear time, ties keep their order like a stable sort.
+
+    Args:
+        scores (np.ndarray): scores
+        k (int, optional): Number of positions. Defaults to `FEED_SIZE`.
+
+    Returns:
+        np.ndarray: positions sorted by descending score
     """
-    relevance: float = 0.0
-    message: str = ""
+    if len(scores) > k:
+        threshold: float = np.partition(scores, len(scores) - k)[len(scores) - k]
+        candidates: np.ndarray = np.flatnonzero(scores >= threshold)
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind="stable")][:k]
 
-    def __init__(self, status: dict, relevance: float):
-        self.relevance = relevance
-        self.original_message = status['status_message']
-        self.message = f"\nMessage: {status['status_message']}\nLink: {status['status_link']}\nPublished: {status['status_published']}\nAuthor: {status['author']}"
 
-def get_feed(graph: nx.DiGraph, username: str, statuses: dict, word_count: dict = None) -> list[Status]:
+def get_feed(graph: nx.DiGraph, user_id: int, statuses: StatusTable, word_count: dict = None, now: int = None, users: IdMap = None,
+             status_ids: Iterable[int] = None) -> list[Status]:
     """Gets 10 relevant statuses with formula: `affinity * popularity * time dependency` (if affinity is 0 - `popularity * time dependency`).  
+    `popularity * time dependency` is precomputed per status, see `StatusTable.base_scores`, and `Status` objects are built only for the winners.
+    Without `status_ids` and `word_count` only the user's neighbourhood and the best statuses overall are visited, see `candidates.CandidateIndex`.
 
     Args:
-        graph (nx.DiGraph): affinity graph
-        username (str): logged user
-        statuses (dict): all statuses
-        word_count (dict, optional): Word count. Defaults to None.
+        graph (nx.DiGraph): affinity graph, `affinity.CsrAffinity` and `affinity.BucketedAffinity` are accepted too
+        user_id (int): logged user
+        statuses (StatusTable): all statuses, a dict keyed by status id is converted to a table
+        word_count (dict, optional): Word count, its keys are the ranked statuses if `status_ids` is not set. Defaults to None.
+        now (int, optional): Time recency is measured from, in seconds. Defaults to None (current time).
+        users (IdMap, optional): Id map used to show author names. Defaults to None.
+        status_ids (Iterable[int], optional): Statuses to rank. Defaults to None (all statuses).
 
     Returns:
         list[Status]: List of 10 most relevant statuses.
     """
+    if now is None:
+        now = timestamps.now()
+
+    if isinstance(statuses, dict):
+        statuses = StatusTable.from_statuses(statuses)
+    if status_ids is None and word_count is not None:
+        status_ids = word_count.keys()
+    if status_ids is None:
+        authors, affinities = user_affinities(graph, user_id, now)
+        rows, relevances = statuses.candidate_index(now).top(authors, affinities, FEED_SIZE)
+        return [Status(int(statuses.status_ids[row]), relevance, statuses, users) for row, relevance in zip(rows, relevances)]
+    rows: np.ndarray = statuses.rows(status_ids)
+
+    relevance: np.ndarray = statuses.base_scores(now)[rows]
+    user_affinity: np.ndarray = author_affinities(graph, user_id, statuses.authors[rows], now)
+    relevance = np.where(user_affinity != 0.0, relevance * user_affinity, relevance)
+
+    if word_count != None:
+        relevance *= np.array([1000 ** word_count[status_id] for status_id in statuses.status_ids[rows].tolist()], dtype=np.float64)
+
+    return [Status(int(statuses.status_ids[rows[i]]), float(relevance[i]), statuses, users) for i in top_k(relevance).tolist()]
+
+
+def feed_version(statuses: StatusTable, now: int, snapshot_version: int = 0) -> str:
+    """Gets version of the data a feed page is ranked from.
+
+    Args:
+        statuses (StatusTable): status table
+        now (int): current time, in seconds
+        snapshot_version (int, optional): Version of the `DataSnapshot`, it changes with the affinity graph. Defaults to 0.
+
+    Returns:
+        str: version of the data snapshot, the statuses and the score bucket
+    """
+    return f"{snapshot_version}.{statuses.version}.{now // SCORE_BUCKET}"
+
+
+def encode_cursor(relevance: float, status_id: int, version: str) -> str:
+    """Encodes the position after a returned status as an opaque cursor.
+
+    Args:
+        relevance (float): relevance of the last status
+        status_id (int): id of the last status
+        version (str): data version, see `feed_version`
+
+    Returns:
+        str: cursor
+    """
+    position: str = json.dumps([relevance.hex(), status_id, version])
+    return base64.urlsafe_b64encode(position.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """Decodes cursor of `encode_cursor`.
+
+    Args:
+        cursor (str): cursor
+
+    Raises:
+        ValueError: cursor is malformed
+
+    Returns:
+        tuple: (`relevance`, `status_id`, `version`)
+    """
     try:
-        user = graph[username]
-    except:
-        graph.add_node(username)
-        user = graph[username]
-
-    feed: list[Status] = []
-
-    for status_id, status in statuses.items():
-        author: str = status['author']
-        popularity: int = (COMMENT_WEIGHT * status['num_comments'] + status['num_shares'] * SHARE_WEIGHT + status['num_likes'] + status['num_loves'] +
-                                 status['num_wows'] + status['num_hahas'] + status['num_sads'] + status['num_angrys'] + status['num_special'])
-        time_dependency: float = get_date_difference_multiplier(status['status_published'])
-        try:
-            user_affinity: float = user[author]['affinity']
-        except:
-            user_affinity = 0.0
-        
-        
-        total_relevance: float = popularity * time_dependency * user_affinity if user_affinity != 0.0 else popularity * time_dependency
-        
-        if word_count != None:
-            total_relevance *= (1000 ** word_count[status_id])
-            
-        feed.append(Status(status, total_relevance))
-
-    feed.sort(key=operator.attrgetter("relevance"), reverse=True)
-
-    return feed[:10]
+        relevance, status_id, version = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return float.fromhex(relevance), int(status_id), str(version)
+    except (ValueError, TypeError, UnicodeError) as error:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from error
+
+
+def get_feed_page(graph: nx.DiGraph, user_id: int, statuses: StatusTable, cursor: str = None, page_size: int = FEED_SIZE,
+                  now: int = None, users: IdMap = None, snapshot_version: int = 0) -> tuple:
+    """Gets a page of the feed ranked like `get_feed`. The next page starts after the last status of this one
+    and is produced lazily from the candidate index, earlier pages are not ranked again.
+
+    Args:
+        graph (nx.DiGraph): affinity graph, `affinity.CsrAffinity` and `affinity.BucketedAffinity` are accepted too
+        user_id (int): logged user
+        statuses (StatusTable): all statuses
+        cursor (str, optional): Cursor returned with the previous page. Defaults to None (first page).
+        page_size (int, optional): Statuses per page. Defaults to `FEED_SIZE`.
+        now (int, optional): Time recency is measured from, in seconds. Defaults to None (current time).
+        users (IdMap, optional): Id map used to show author names. Defaults to None.
+        snapshot_version (int, optional): Version of the `DataSnapshot` the graph and statuses belong to. Defaults to 0.
+
+    Raises:
+        ValueError: cursor is malformed
+        StaleCursorError: data snapshot, statuses or scores changed since the cursor was returned
+
+    Returns:
+        tuple: (`list[Status]`, cursor of the next page or None after the last page)
+    """
+    if now is None:
+        now = timestamps.now()
+    version: str = feed_version(statuses, now, snapshot_version)
+    after: tuple = None
+    if cursor is not None:
+        relevance, status_id, cursor_version = decode_cursor(cursor)
+        if cursor_version != version or status_id not in statuses:
+            raise StaleCursorError(f"Feed changed since the cursor was returned: {cursor_version} != {version}")
+        after = (relevance, int(statuses.index[status_id]))
+
+    authors, affinities = user_affinities(graph, user_id, now)
+    rows, relevances = statuses.candidate_index(now).top(authors, affinities, page_size + 1, after)
+    page: list = [Status(int(statuses.status_ids[row]), relevance, statuses, users) for row, relevance in zip(rows[:page_size], relevances[:page_size])]
+    if len(rows) <= page_size:
+        return page, None
+    return page, encode_cursor(relevances[page_size - 1], int(statuses.status_ids[rows[page_size - 1]]), version)
+
+
+def page_cursor(graph: nx.DiGraph, user_id: int, statuses: StatusTable, page: list, now: int = None, snapshot_version: int = 0) -> str:
+    """Gets cursor of the page after a first page that `get_feed_page` did not return, e.g. a precomputed
+    feed. The last status of the page is ranked again so the next page follows its current relevance.
+
+    Args:
+        graph (nx.DiGraph): affinity graph, `affinity.CsrAffinity` and `affinity.BucketedAffinity` are accepted too
+        user_id (int): logged user
+        statuses (StatusTable): all statuses
+        page (list): shown statuses, the most relevant first
+        now (int, optional): Time recency is measured from, in seconds. Defaults to None (current time).
+        snapshot_version (int, optional): Version of the `DataSnapshot` the graph and statuses belong to. Defaults to 0.
+
+    Returns:
+        str: cursor of the next page, None if the page is empty
+    """
+    if not page:
+        return None
+    if now is None:
+        now = timestamps.now()
+    last: Status = get_feed(graph, user_id, statuses, now=now, status_ids=[page[-1].status_id])[0]
+    return encode_cursor(last.relevance, last.status_id, feed_version(statuses, now, snapshot_version))
@@ -0,0 +1,178 @@
+"""Precomputed feeds. `precompute_feeds` ranks the top statuses of many users at once, split across worker
+processes, and `save_feeds` writes them to a snapshot that the interactive path reads before ranking a
+login itself. A store is refused when the datasets, the user ids or the settings changed, or when it is
+older than `FEED_STORE_MAX_AGE`.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import os
+
+import numpy as np
+
+from affinity import CsrAffinity, to_csr
+from candidates import CandidateIndex
+import feed
+import graph_snapshot
+import ids
+from snapshot import read_arrays, read_header, write_snapshot
+from status_table import StatusTable
+import timestamps
+
+
+FEED_STORE_PATH: str = "cache/feeds.snap"
+FEED_STORE_MAX_AGE: int = 6 * 3600
+
+
+class FeedStore(object):
+    """Top statuses per user, as rows of a `users x k` matrix. Missing entries are -1.
+    """
+    def __init__(self, users: np.ndarray, status_ids: np.ndarray, relevances: np.ndarray):
+        """
+        Args:
+            users (np.ndarray): sorted user ids
+            status_ids (np.ndarray): status ids per user, shape (users, k)
+            relevances (np.ndarray): relevance per status, shape (users, k)
+        """
+        self.users: np.ndarray = users
+        self.status_ids: np.ndarray = status_ids
+        self.relevances: np.ndarray = relevances
+
+    def __len__(self) -> int:
+        return len(self.users)
+
+    def get(self, user_id: int) -> list:
+        """Gets precomputed feed of a user.
+
+        Args:
+            user_id (int): user
+
+        Returns:
+            list: (`status_id`, `relevance`) pairs, None if the user has no precomputed feed
+        """
+        position: int = int(np.searchsorted(self.users, user_id))
+        if position == len(self.users) or self.users[position] != user_id:
+            return None
+        status_ids: np.ndarray = self.status_ids[position]
+        known: np.ndarray = status_ids >= 0
+        return list(zip(status_ids[known].tolist(), self.relevances[position][known].tolist()))
+
+    def feed(self, user_id: int, statuses: StatusTable, users: ids.IdMap = None) -> list:
+        """Builds `feed.Status` objects of a precomputed feed.
+
+        Args:
+            user_id (int): user
+            statuses (StatusTable): status table
+            users (ids.IdMap, optional): Id map used to show author names. Defaults to None.
+
+        Returns:
+            list[feed.Status]: feed, None if the user has no precomputed feed
+        """
+        entries: list = self.get(user_id)
+        if entries is None:
+            return None
+        return [feed.Status(status_id, relevance, statuses, users) for status_id, relevance in entries if status_id in statuses]
+
+
+def _top_feeds(indptr: np.ndarray, indices: np.ndarray, data: np.ndarray, scores: np.ndarray, authors: np.ndarray,
+               users: np.ndarray, k: int) -> tuple:
+    """Ranks feeds of a chunk of users in a worker process.
+
+    Returns:
+        tuple: (`rows`, `relevances`) matrices, missing rows are -1
+    """
+    affinity = CsrAffinity(indptr, indices, data)
+    index = CandidateIndex(scores, authors)
+    rows: np.ndarray = np.full((len(users), k), -1, dtype=np.int64)
+    relevances: np.ndarray = np.zeros((len(users), k), dtype=np.float64)
+    for position, user in enumerate(users.tolist()):
+        user_rows, user_relevances = index.top(*affinity.row(user), k)
+        rows[position, :len(user_rows)] = user_rows
+        relevances[position, :len(user_rows)] = user_relevances
+    return rows, relevances
+
+
+def precompute_feeds(graph, statuses: StatusTable, user_ids: np.ndarray, now: int = None, k: int = feed.FEED_SIZE,
+                     workers: int = 1) -> FeedStore:
+    """Ranks top `k` statuses of every user, the same way `feed.get_feed` ranks a login. Users are split into
+    one chunk per worker process, every chunk walks the affinity rows of its users against the base scores.
+
+    Args:
+        graph (CsrAffinity | BucketedAffinity | nx.DiGraph): affinity graph
+        statuses (StatusTable): status table
+        user_ids (np.ndarray): users to rank feeds for
+        now (int, optional): Time recency is measured from, in seconds. Defaults to None (current time).
+        k (int, optional): Statuses per user. Defaults to `feed.FEED_SIZE`.
+        workers (int, optional): Number of processes, 0 for all cores. Defaults to 1.
+
+    Returns:
+        FeedStore: feeds
+    """
+    if now is None:
+        now = timestamps.now()
+    affinity: CsrAffinity = to_csr(graph, now)
+    scores: np.ndarray = statuses.base_scores(now)
+    users: np.ndarray = np.unique(np.asarray(user_ids, dtype=np.int64))
+    arguments: tuple = (affinity.indptr, affinity.indices, affinity.data, scores, statuses.authors)
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        rows, relevances = _top_feeds(*arguments, users, k)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            parts: list = list(executor.map(_top_feeds, *zip(*[arguments + (chunk, k) for chunk in np.array_split(users, workers)])))
+        rows = np.concatenate([part[0] for part in parts])
+        relevances = np.concatenate([part[1] for part in parts])
+
+    status_ids: np.ndarray = np.full(rows.shape, -1, dtype=np.int32)
+    found: np.ndarray = rows >= 0
+    status_ids[found] = statuses.status_ids[rows[found]]
+    return FeedStore(users, status_ids, relevances)
+
+
+def save_feeds(store: FeedStore, now: int, sources: dict, registry: ids.Registry, settings: dict, file_path: str = FEED_STORE_PATH) -> None:
+    """Saves precomputed feeds.
+
+    Args:
+        store (FeedStore): feeds
+        now (int): time the feeds were ranked for, in seconds
+        sources (dict): (`kind` : `path`) of the datasets
+        registry (ids.Registry): id registry
+        settings (dict): JSON serializable options the feeds depend on, like the affinity backend
+        file_path (str, optional): Store path. Defaults to `FEED_STORE_PATH`.
+    """
+    header: dict = graph_snapshot.snapshot_header("feeds", sources, registry)
+    header["built"] = now
+    header["k"] = store.status_ids.shape[1]
+    header["settings"] = settings
+    write_snapshot(file_path, header, {
+        "users": store.users,
+        "status_ids": store.status_ids.ravel(),
+        "relevances": store.relevances.ravel(),
+    })
+
+
+def load_feeds(now: int, sources: dict, registry: ids.Registry, settings: dict, file_path: str = FEED_STORE_PATH) -> tuple:
+    """Loads precomputed feeds if they match the loaded data and `settings` and are recent enough.
+
+    Args:
+        now (int): current time, in seconds
+        sources (dict): (`kind` : `path`) of the datasets
+        registry (ids.Registry): id registry
+        settings (dict): options the feeds depend on
+        file_path (str, optional): Store path. Defaults to `FEED_STORE_PATH`.
+
+    Returns:
+        tuple: (`FeedStore` or None, reason the store was refused or None)
+    """
+    header: dict = read_header(file_path)
+    reason: str = graph_snapshot.check_header(header, "feeds", sources, registry)
+    if reason is None and header["settings"] != settings:
+        reason = "different settings"
+    if reason is None and not 0 <= now - header["built"] < FEED_STORE_MAX_AGE:
+        reason = "too old"
+    if reason is not None:
+        return None, reason
+
+    _, arrays = read_arrays(file_path)
+    shape: tuple = (len(arrays["users"]), header["k"])
+    return FeedStore(arrays["users"], arrays["status_ids"].reshape(shape), arrays["relevances"].reshape(shape)), None
@@ -1,15 +1,23 @@
-"""Module that generates affinity graph. It contants `DATE_FORMAT`, `FRIEND_WEIGHT`, `SHARE_WEIGHT`, `COMMENT_WEIGHT`, and `REACTION_WEIGHT` constants.
+"""Module that generates affinity graph. It contants `DATE_FORMAT`, `FRIEND_WEIGHT`, `FRIEND_OF_FRIEND_WEIGHT`, `FRIEND_OF_FRIEND_TOP_K`, `FRIEND_OF_FRIEND_MAX_PRODUCTS`, `SHARE_WEIGHT`, `COMMENT_WEIGHT`, `REACTION_WEIGHT`, `DAY_THRESHOLDS` and `DAY_MULTIPLIERS` constants.
 """
 
-import pickle
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+import os
 import networkx as nx
-from datetime import datetime, timedelta
+import numpy as np
+from ids import IdMap
+import timestamps
+from timestamps import SECONDS_PER_DAY
 
 import time
 
 
-DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+DATE_FORMAT = timestamps.DATE_FORMAT
 FRIEND_WEIGHT: float = 5000.0
+FRIEND_OF_FRIEND_WEIGHT: float = 0.1
+FRIEND_OF_FRIEND_TOP_K: int = 20
+FRIEND_OF_FRIEND_MAX_PRODUCTS: int = 5_000_000
 SHARE_WEIGHT: float = 2.0
 COMMENT_WEIGHT: float = 1.0
 REACTION_WEIGHT: dict = {
@@ -21,14 +29,16 @@ REACTION_WEIGHT: dict = {
     "likes": 0.6,
     "special": 0.7
 }
+DAY_THRESHOLDS: tuple = (1, 7, 14, 30, 60)
+DAY_MULTIPLIERS: tuple = (10.0, 2.5, 1.0, 0.6, 0.01, 0.001)
 
 
-def get_affinity(user: str, friend: str, graph: nx.DiGraph) -> float:
+def get_affinity(user: int, friend: int, graph: nx.DiGraph) -> float:
     """Gets affinity between two users.
 
     Args:
-        user (str): first users
-        friend (str): second users
+        user (int): first users
+        friend (int): second users
         graph (nx.DiGraph): affinity graph
 
     Returns:
@@ -40,12 +50,12 @@ def get_affinity(user: str, friend: str, graph: nx.DiGraph) -> float:
         return 0
 
 
-def add_affinity(user: str, friend: str, value: float, graph: nx.DiGraph) -> None:
+def add_affinity(user: int, friend: int, value: float, graph: nx.DiGraph) -> None:
     """Adds/updates user affinity.
 
     Args:
-        user (str): first user
-        friend (str): second user
+        user (int): first user
+        friend (int): second user
         value (float): affinity
         graph (nx.DiGraph): affinity graph
     """
@@ -53,60 +63,114 @@ def add_affinity(user: str, friend: str, value: float, graph: nx.DiGraph) -> Non
     graph.add_edge(user, friend, affinity=current_affinity + value)
 
 
-def get_date_difference_multiplier(action_date: datetime) -> float:
-    """Gets time dependency.
+def share_graph(graph: nx.DiGraph) -> nx.DiGraph:
+    """Copies graph for a new data version. Only the node and adjacency maps are copied, rows and edge
+    attributes are shared, so the copy is changed through `add_affinities`.
 
     Args:
-        action_date (datetime): when action is performed
+        graph (nx.DiGraph): affinity graph
+
+    Returns:
+        nx.DiGraph: copy
+    """
+    shared: nx.DiGraph = nx.DiGraph()
+    shared.graph.update(graph.graph)
+    shared._node = dict(graph._node)
+    shared._adj = dict(graph._adj)
+    shared._pred = dict(graph._pred)
+    return shared
+
+
+def add_affinities(graph: nx.DiGraph, delta: nx.DiGraph) -> None:
+    """Adds affinities of `delta` to a graph from `share_graph`. Rows and edge attributes are replaced by
+    copies before they are written, so graphs sharing them do not change.
+
+    Args:
+        graph (nx.DiGraph): affinity graph
+        delta (nx.DiGraph): affinity to add
+    """
+    for node in delta.nodes:
+        if node not in graph:
+            graph.add_node(node)
+    successors: set = set()
+    predecessors: set = set()
+    for user, friend, value in delta.edges(data="affinity"):
+        if user not in successors:
+            graph._adj[user] = dict(graph._adj[user])
+            successors.add(user)
+        if friend not in predecessors:
+            graph._pred[friend] = dict(graph._pred[friend])
+            predecessors.add(friend)
+        data: dict = dict(graph._adj[user].get(friend, {}))
+        data["affinity"] = data.get("affinity", 0) + value
+        graph._adj[user][friend] = data
+        graph._pred[friend][user] = data
+    getattr(graph, "__networkx_cache__", {}).clear()
+
+
+def get_date_difference_multiplier(action_time: int, now: int) -> float:
+    """Gets time dependency. Age is counted in calendar days, `now // SECONDS_PER_DAY - action day`, the way
+    `affinity.BucketedAffinity` buckets actions.
+
+    Args:
+        action_time (int): when action is performed, in seconds
+        now (int): current time, in seconds
 
     Returns:
         float: time dependency
     """
-    current_date: datetime = datetime.today()
-    difference: timedelta = current_date - action_date
-
-    multiplier: float = 1.0
-    if difference.days < 1:
-        multiplier *= 10.0
-    elif difference.days < 7:
-        multiplier *= 2.5
-    elif difference.days < 14:
-        multiplier *= 1.0
-    elif difference.days < 30:
-        multiplier *= 0.6
-    elif difference.days < 60:
-        multiplier *= 0.01
-    else:
-        multiplier *= 0.001
-
-    return multiplier
-
-
-def print_graph(graph: nx.DiGraph):
+    days: int = now // SECONDS_PER_DAY - action_time // SECONDS_PER_DAY
+    return DAY_MULTIPLIERS[bisect_right(DAY_THRESHOLDS, days)]
+
+
+def get_date_difference_multipliers(action_times: np.ndarray, now: int) -> np.ndarray:
+    """Gets time dependency for many actions at once, see `get_date_difference_multiplier`.
+
+    Args:
+        action_times (np.ndarray): when actions are performed, in seconds
+        now (int): current time, in seconds
+
+    Returns:
+        np.ndarray: time dependencies
+    """
+    days: np.ndarray = now // SECONDS_PER_DAY - np.asarray(action_times, dtype=np.int64) // SECONDS_PER_DAY
+    return np.asarray(DAY_MULTIPLIERS)[np.searchsorted(DAY_THRESHOLDS, days, side="right")]
+
+
+def print_graph(graph: nx.DiGraph, users: IdMap = None):
     """Prints affinity graph.
 
     Args:
-        graph (nx.DiGraph): affinity graph
+        graph (nx.DiGraph): affinity graph, `affinity.CsrAffinity` and `affinity.BucketedAffinity` are accepted too
+        users (IdMap, optional): Id map used to print user names. Defaults to None.
     """
-    for edge in graph.edges:
-        affinity: float = get_affinity(edge[0], edge[1], graph)
-        print(f"{edge[0]} -> {edge[1]} : {affinity}")
+    for user, friend, affinity in graph.edges(data='affinity'):
+        if users is not None:
+            user, friend = users.name(user), users.name(friend)
+        print(f"{user} -> {friend} : {affinity}")
 
 
-def generate_graph(users: dict, statuses: dict, shares: dict, reactions: dict, comments: dict, graph: nx.DiGraph = None) -> nx.DiGraph:
+def generate_graph(users: dict, statuses: dict, shares: dict, reactions: dict, comments: dict, graph: nx.DiGraph = None, now: int = None,
+                   workers: int = 1) -> nx.DiGraph:
     """Generate/updates graph.
 
     Args:
-        users (dict): all users
-        statuses (dict): all statuses
+        users (dict): all users, keyed by user id
+        statuses (dict): all statuses, keyed by status id
         shares (dict): all shares
         reactions (dict): all reactions
         comments (dict): all comments
         graph (nx.DiGraph, optional): Graph to update. Defaults to None.
+        now (int, optional): Time recency is measured from, in seconds. Defaults to None (current time).
+        workers (int, optional): Processes for a new graph, see `generate_graph_sharded`. Defaults to 1.
 
     Returns:
         nx.DiGraph: Generated/updated graph
     """
+    if now is None:
+        now = timestamps.now()
+    if graph is None and workers != 1:
+        return generate_graph_sharded(users, statuses, shares, reactions, comments, now, workers)
     if graph is None:
         graph = nx.DiGraph()
     start = time.time()
@@ -114,10 +178,10 @@ def generate_graph(users: dict, statuses: dict, shares: dict, reactions: dict, c
     for comment_author in comments:
         authors_comments: list = comments[comment_author]
         for author_comment in authors_comments:
-            status_id: str = author_comment['status_id']
-            status_author: str = statuses[status_id]['author']
+            status_id: int = author_comment['status_id']
+            status_author: int = statuses[status_id]['author']
             
-            add_affinity(comment_author, status_author, COMMENT_WEIGHT * get_date_difference_multiplier(author_comment['comment_published']), graph)
+            add_affinity(comment_author, status_author, COMMENT_WEIGHT * get_date_difference_multiplier(author_comment['comment_published'], now), graph)
     
     print(f"Adding comments: {time.time() - start}")
     
@@ -125,21 +189,21 @@ def generate_graph(users: dict, statuses: dict, shares: dict, reactions: dict, c
     for reactor in reactions:
         reactor_reactions: list = reactions[reactor]
         for reactor_reaction in reactor_reactions:
-            status_id: str = reactor_reaction['status_id']
-            status_author: str = statuses[status_id]['author']
+            status_id: int = reactor_reaction['status_id']
+            status_author: int = statuses[status_id]['author']
             reaction_type: str = reactor_reaction['type_of_reaction']
             
-            add_affinity(reactor, status_author, REACTION_WEIGHT[reaction_type] * get_date_difference_multiplier(reactor_reaction['reacted']), graph)
+            add_affinity(reactor, status_author, REACTION_WEIGHT[reaction_type] * get_date_difference_multiplier(reactor_reaction['reacted'], now), graph)
     print(f"Adding reactions: {time.time() - start}")
     
     start = time.time()
     for sharer in shares:
         sharer_shares: list = shares[sharer]
         for sharer_share in sharer_shares:
-            status_id: str = sharer_share['status_id']
-            status_author: str = statuses[status_id]['author']
+            status_id: int = sharer_share['status_id']
+            status_author: int = statuses[status_id]['author']
             
-            add_affinity(sharer, status_author, SHARE_WEIGHT * get_date_difference_multiplier(sharer_share['status_shared']), graph)
+            add_affinity(sharer, status_author, SHARE_WEIGHT * get_date_difference_multiplier(sharer_share['status_shared'], now), graph)
     print(f"Adding shares: {time.time() - start}")
     
     start = time.time()
@@ -147,32 +211,73 @@ def generate_graph(users: dict, statuses: dict, shares: dict, reactions: dict, c
         friends: list = users[user]
         for friend in friends:
             add_affinity(user, friend, FRIEND_WEIGHT, graph)
-            # friends_of_friend: list = users[friend]
-            # for friend_of_friend in friends_of_friend:
-            #     add_affinity(user, friend_of_friend, FRIEND_OF_FRIEND_WEIGHT, graph)
     print(f"Adding friends: {time.time() - start}")
     
-    graph_file_obj = open("graph.obj", "wb")
-    pickle.dump(graph, graph_file_obj)
-    graph_file_obj.close()
     return graph
 
 
-def load_graph(file: str) -> nx.DiGraph:
-    """Loads graph from `file`.
+def _edge_weights(users: dict, statuses: dict, shares: dict, reactions: dict, comments: dict, now: int) -> tuple:
+    """Sums affinity of one shard in the order `generate_graph` adds it.
+
+    Returns:
+        tuple: (`users`, `friends`, `affinities`) lists
+    """
+    weights: dict = {}
+    for comment_author, authors_comments in comments.items():
+        for author_comment in authors_comments:
+            key: tuple = (comment_author, statuses[author_comment['status_id']]['author'])
+            weights[key] = weights.get(key, 0) + COMMENT_WEIGHT * get_date_difference_multiplier(author_comment['comment_published'], now)
+    for reactor, reactor_reactions in reactions.items():
+        for reactor_reaction in reactor_reactions:
+            key: tuple = (reactor, statuses[reactor_reaction['status_id']]['author'])
+            weights[key] = weights.get(key, 0) + REACTION_WEIGHT[reactor_reaction['type_of_reaction']] * get_date_difference_multiplier(reactor_reaction['reacted'], now)
+    for sharer, sharer_shares in shares.items():
+        for sharer_share in sharer_shares:
+            key: tuple = (sharer, statuses[sharer_share['status_id']]['author'])
+            weights[key] = weights.get(key, 0) + SHARE_WEIGHT * get_date_difference_multiplier(sharer_share['status_shared'], now)
+    for user, friends in users.items():
+        for friend in friends:
+            weights[(user, friend)] = weights.get((user, friend), 0) + FRIEND_WEIGHT
+    return [key[0] for key in weights], [key[1] for key in weights], list(weights.values())
+
+
+def _shard(groups: dict, shard: int, shards: int) -> dict:
+    return {actor: records for actor, records in groups.items() if actor % shards == shard}
+
+
+def generate_graph_sharded(users: dict, statuses: dict, shares: dict, reactions: dict, comments: dict, now: int = None, workers: int = None) -> nx.DiGraph:
+    """Generates graph in worker processes. Interactions are sharded by actor, so every edge is summed by one
+    worker in the same order as `generate_graph` and the weights are identical for the same `now`.
 
     Args:
-        file (str): file path
+        users (dict): all users, keyed by user id
+        statuses (dict): all statuses, keyed by status id
+        shares (dict): all shares
+        reactions (dict): all reactions
+        comments (dict): all comments
+        now (int, optional): Time recency is measured from, in seconds. Defaults to None (current time).
+        workers (int, optional): Number of processes and shards, 0 or None for all cores. Defaults to None.
 
     Returns:
-        nx.DiGraph: Loaded graph, None if graph is not found in file.
+        nx.DiGraph: Generated graph
     """
-    try:
-        graph_file_obj = open(file, "rb")
-        graph = pickle.load(graph_file_obj)
-        graph_file_obj.close()
-        print(f"Found graph in file - {graph}")
-        return graph
-    except FileNotFoundError:
-        print("Graph not found in file")
-        
\ No newline at end of file
+    if now is None:
+        now = timestamps.now()
+    shards: int = workers or os.cpu_count() or 1
+    start = time.time()
+
+    graph = nx.DiGraph()
+    with ProcessPoolExecutor(max_workers=shards) as executor:
+        futures: list = []
+        for shard in range(shards):
+            shard_groups: list = [_shard(groups, shard, shards) for groups in (users, shares, reactions, comments)]
+            status_ids: set = {record['status_id'] for groups in shard_groups[1:] for records in groups.values() for record in records}
+            shard_statuses: dict = {status_id: statuses[status_id] for status_id in status_ids}
+            futures.append(executor.submit(_edge_weights, shard_groups[0], shard_statuses, *shard_groups[1:], now))
+
+        for future in futures:
+            shard_users, shard_friends, affinities = future.result()
+            graph.add_weighted_edges_from(zip(shard_users, shard_friends, affinities), weight='affinity')
+
+    print(f"Adding interactions in {shards} shards: {time.time() - start}")
+    return graph
@@ -0,0 +1,196 @@
+"""Versioned affinity graph snapshots. The header records the snapshot version, the weight constants, a
+fingerprint of every source dataset and of the interned user ids. Edges are stored as flat arrays that are
+memory-mapped on load. A snapshot that does not match the current datasets or constants is refused, so the
+caller rebuilds the graph.
+"""
+
+import hashlib
+
+import networkx as nx
+import numpy as np
+
+import dataset_cache
+import graph_generator
+import ids
+from affinity import BucketedAffinity
+from snapshot import read_arrays, read_header, update_header, write_snapshot
+from timestamps import SECONDS_PER_DAY
+
+
+GRAPH_SNAPSHOT_VERSION: int = 2
+GRAPH_PATH: str = "cache/graph.snap"
+BUCKETED_PATH: str = "cache/affinity.snap"
+
+
+def weight_constants() -> dict:
+    """Gets constants the affinity weights depend on.
+
+    Returns:
+        dict: weight constants
+    """
+    return {
+        "FRIEND_WEIGHT": graph_generator.FRIEND_WEIGHT,
+        "SHARE_WEIGHT": graph_generator.SHARE_WEIGHT,
+        "COMMENT_WEIGHT": graph_generator.COMMENT_WEIGHT,
+        "REACTION_WEIGHT": graph_generator.REACTION_WEIGHT,
+        "DAY_THRESHOLDS": list(graph_generator.DAY_THRESHOLDS),
+        "DAY_MULTIPLIERS": list(graph_generator.DAY_MULTIPLIERS),
+    }
+
+
+def names_fingerprint(id_map: ids.IdMap) -> str:
+    """Hashes interned names in id order.
+
+    Args:
+        id_map (ids.IdMap): user or status ids
+
+    Returns:
+        str: hex digest
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for name in id_map.names:
+        digest.update(name.encode("utf-8"))
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+
+def snapshot_header(kind: str, sources: dict, registry: ids.Registry) -> dict:
+    return {
+        "version": GRAPH_SNAPSHOT_VERSION,
+        "kind": kind,
+        "constants": weight_constants(),
+        "sources": {path: dataset_cache.fingerprint(path) for path in sources.values()},
+        "users": names_fingerprint(registry.users),
+    }
+
+
+def check_header(header: dict, kind: str, sources: dict, registry: ids.Registry) -> str:
+    """Checks that a snapshot header matches the loaded data.
+
+    Args:
+        header (dict): snapshot header
+        kind (str): expected snapshot kind
+        sources (dict): (`kind` : `path`) of the datasets the graph is built from
+        registry (ids.Registry): id registry of the loaded datasets
+
+    Returns:
+        str: reason the snapshot is stale, None if it can be used
+    """
+    if header is None:
+        return "not found"
+    if header.get("version") != GRAPH_SNAPSHOT_VERSION or header.get("kind") != kind:
+        return "different format version"
+    if header["constants"] != weight_constants():
+        return "weight constants changed"
+    if set(header["sources"]) != set(sources.values()):
+        return "different datasets"
+    for path, source in header["sources"].items():
+        if not dataset_cache.is_fresh(source, path):
+            return f"{path} changed"
+    if header["users"] != names_fingerprint(registry.users):
+        return "user ids changed"
+    return None
+
+
+def save_bucketed(bucketed: BucketedAffinity, sources: dict, registry: ids.Registry, file_path: str = BUCKETED_PATH) -> None:
+    """Saves bucketed affinity. It does not depend on the current time, so it stays valid across days.
+
+    Args:
+        bucketed (BucketedAffinity): bucketed affinity
+        sources (dict): (`kind` : `path`) of the datasets it was built from
+        registry (ids.Registry): id registry
+        file_path (str, optional): Snapshot path. Defaults to `BUCKETED_PATH`.
+    """
+    header: dict = snapshot_header("bucketed", sources, registry)
+    header["rolled_day"] = bucketed.rolled_day
+    write_snapshot(file_path, header, {
+        "bucket_actors": bucketed.buckets[0],
+        "bucket_authors": bucketed.buckets[1],
+        "bucket_days": bucketed.buckets[2],
+        "bucket_weights": bucketed.bucket_weights,
+        "expired_actors": bucketed.expired[0],
+        "expired_authors": bucketed.expired[1],
+        "expired_weights": bucketed.expired_weights,
+        "static_actors": bucketed.static[0],
+        "static_authors": bucketed.static[1],
+        "static_weights": bucketed.static_weights,
+    })
+
+
+def load_bucketed(sources: dict, registry: ids.Registry, file_path: str = BUCKETED_PATH) -> tuple:
+    """Loads bucketed affinity if its snapshot matches the loaded data.
+
+    Args:
+        sources (dict): (`kind` : `path`) of the datasets
+        registry (ids.Registry): id registry
+        file_path (str, optional): Snapshot path. Defaults to `BUCKETED_PATH`.
+
+    Returns:
+        tuple: (`BucketedAffinity` or None, reason the snapshot was refused or None)
+    """
+    header: dict = read_header(file_path)
+    reason: str = check_header(header, "bucketed", sources, registry)
+    if reason is not None:
+        return None, reason
+
+    update_header(file_path, header)
+    _, arrays = read_arrays(file_path)
+    bucketed = BucketedAffinity()
+    bucketed.rolled_day = header.get("rolled_day")
+    bucketed.buckets = (arrays["bucket_actors"], arrays["bucket_authors"], arrays["bucket_days"])
+    bucketed.bucket_weights = arrays["bucket_weights"]
+    bucketed.expired = (arrays["expired_actors"], arrays["expired_authors"])
+    bucketed.expired_weights = arrays["expired_weights"]
+    bucketed.static = (arrays["static_actors"], arrays["static_authors"])
+    bucketed.static_weights = arrays["static_weights"]
+    return bucketed, None
+
+
+def save_graph(graph: nx.DiGraph, now: int, sources: dict, registry: ids.Registry, file_path: str = GRAPH_PATH) -> None:
+    """Saves networkx graph as edge arrays. Its weights already include time dependency, so the snapshot
+    is valid only on the day of `now`.
+
+    Args:
+        graph (nx.DiGraph): affinity graph
+        now (int): time the graph was generated for, in seconds
+        sources (dict): (`kind` : `path`) of the datasets it was built from
+        registry (ids.Registry): id registry
+        file_path (str, optional): Snapshot path. Defaults to `GRAPH_PATH`.
+    """
+    edges: list = list(graph.edges(data='affinity'))
+    nodes: list = list(graph.nodes)
+    header: dict = snapshot_header("networkx", sources, registry)
+    header["day"] = now // SECONDS_PER_DAY
+    write_snapshot(file_path, header, {
+        "nodes": np.array(nodes, dtype=np.int64),
+        "users": np.array([edge[0] for edge in edges], dtype=np.int64),
+        "friends": np.array([edge[1] for edge in edges], dtype=np.int64),
+        "affinity": np.array([edge[2] for edge in edges], dtype=np.float64),
+    })
+
+
+def load_graph(now: int, sources: dict, registry: ids.Registry, file_path: str = GRAPH_PATH) -> tuple:
+    """Loads networkx graph if its snapshot matches the loaded data and the day of `now`.
+
+    Args:
+        now (int): current time, in seconds
+        sources (dict): (`kind` : `path`) of the datasets
+        registry (ids.Registry): id registry
+        file_path (str, optional): Snapshot path. Defaults to `GRAPH_PATH`.
+
+    Returns:
+        tuple: (`nx.DiGraph` or None, reason the snapshot was refused or None)
+    """
+    header: dict = read_header(file_path)
+    reason: str = check_header(header, "networkx", sources, registry)
+    if reason is None and header["day"] != now // SECONDS_PER_DAY:
+        reason = "built on another day"
+    if reason is not None:
+        return None, reason
+
+    update_header(file_path, header)
+    _, arrays = read_arrays(file_path)
+    graph = nx.DiGraph()
+    graph.add_nodes_from(arrays["nodes"].tolist())
+    graph.add_weighted_edges_from(zip(arrays["users"].tolist(), arrays["friends"].tolist(), arrays["affinity"].tolist()), weight='affinity')
+    return graph, None
@@ -0,0 +1,133 @@
+"""Dense integer IDs for users and statuses. Names are interned once at load time, everything after that
+works on ints and names are looked up again only for display. Maps only grow, and a name is readable by
+id before its id is published, so readers on other threads never see a half interned name.
+"""
+
+
+UNKNOWN_ID: int = -1
+
+
+class IdMap(object):
+    """Two-way mapping between names and dense ids `0..n-1`.
+    """
+    def __init__(self):
+        self.ids: dict = {}
+        self.names: list = []
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.ids
+
+    def intern(self, name: str) -> int:
+        """Gets id of `name`, assigning the next free id if it is new.
+
+        Args:
+            name (str): name
+
+        Returns:
+            int: id
+        """
+        id = self.ids.get(name)
+        if id is None:
+            id = len(self.names)
+            self.names.append(name)
+            self.ids[name] = id
+        return id
+
+    def get(self, name: str, default: int = None) -> int:
+        """Gets id of `name` without interning it.
+
+        Args:
+            name (str): name
+            default (int, optional): Id of unknown names, `UNKNOWN_ID` matches no user or status. Defaults to None.
+
+        Returns:
+            int: id, `default` if `name` is unknown
+        """
+        return self.ids.get(name, default)
+
+    def name(self, id: int) -> str:
+        """Gets name of `id`.
+
+        Args:
+            id (int): id
+
+        Returns:
+            str: name
+        """
+        return self.names[id]
+
+
+class Registry(object):
+    """User and status id maps shared by loaders, graph, feed and trie.
+    """
+    def __init__(self):
+        self.users: IdMap = IdMap()
+        self.statuses: IdMap = IdMap()
+
+
+def intern_status(status: dict, registry: Registry) -> dict:
+    status["status_id"] = registry.statuses.intern(status["status_id"])
+    status["author"] = registry.users.intern(status["author"])
+    return status
+
+
+def intern_comment(comment: dict, registry: Registry) -> dict:
+    comment["status_id"] = registry.statuses.intern(comment["status_id"])
+    comment["comment_author"] = registry.users.intern(comment["comment_author"])
+    return comment
+
+
+def intern_reaction(reaction: dict, registry: Registry) -> dict:
+    reaction["status_id"] = registry.statuses.intern(reaction["status_id"])
+    reaction["reactor"] = registry.users.intern(reaction["reactor"])
+    return reaction
+
+
+def intern_share(share: dict, registry: Registry) -> dict:
+    share["status_id"] = registry.statuses.intern(share["status_id"])
+    share["sharer"] = registry.users.intern(share["sharer"])
+    return share
+
+
+RECORD_INTERNERS: dict = {
+    "comments": intern_comment,
+    "reactions": intern_reaction,
+    "shares": intern_share,
+}
+
+
+def intern_dataset(kind: str, dataset: dict, registry: Registry) -> dict:
+    """Replaces user and status names in a loaded dataset with ids. Records are updated in place.
+
+    Args:
+        kind (str): dataset kind
+        dataset (dict): dataset with names
+        registry (Registry): id registry
+
+    Returns:
+        dict: dataset keyed by ids
+    """
+    if kind == "statuses":
+        return {status["status_id"]: status for status in (intern_status(status, registry) for status in dataset.values())}
+    if kind == "friends":
+        users = registry.users
+        return {users.intern(user): [users.intern(friend) for friend in friends] for user, friends in dataset.items()}
+
+    intern_record = RECORD_INTERNERS[kind]
+    return {registry.users.intern(key): [intern_record(record, registry) for record in records] for key, records in dataset.items()}
+
+
+def intern_datasets(datasets: dict, registry: Registry) -> dict:
+    """Interns every dataset in `datasets`.
+
+    Args:
+        datasets (dict): (`kind` : `dataset`)
+        registry (Registry): id registry
+
+    Returns:
+        dict: (`kind` : `dataset keyed by ids`)
+    """
+    return {kind: intern_dataset(kind, dataset, registry) for kind, dataset in datasets.items()}
@@ -0,0 +1,198 @@
+"""Incremental ingestion of rows appended to the dataset files. Each file has a byte offset checkpoint,
+only complete records after it are parsed and applied to the affinity graph, the status table and the trie.
+Interactions with a status that is not loaded yet wait in the checkpoint until the status arrives.
+"""
+
+import json
+import os
+
+import networkx as nx
+
+import graph_generator
+from affinity import BucketedAffinity, CsrAffinity, affinity_triples
+import ids
+import parse_dict
+import timestamps
+from status_table import StatusTable
+from trie import Trie
+
+
+CHECKPOINT_PATH: str = os.path.join("cache", "ingest_checkpoint.json")
+
+RECORD_PARSERS: dict = {
+    "statuses": (parse_dict.parse_status, ids.intern_status),
+    "comments": (parse_dict.parse_comment, ids.intern_comment),
+    "reactions": (parse_dict.parse_reaction, ids.intern_reaction),
+    "shares": (parse_dict.parse_share, ids.intern_share),
+}
+GROUP_KEYS: dict = {
+    "comments": "comment_author",
+    "reactions": "reactor",
+    "shares": "sharer",
+}
+
+
+class Ingestor(object):
+    """Tails dataset files and applies new rows.
+    """
+    def __init__(self, sources: dict, registry: ids.Registry, checkpoint_path: str = CHECKPOINT_PATH):
+        """
+        Args:
+            sources (dict): (`kind` : `path`), kinds are keys of `RECORD_PARSERS`
+            registry (ids.Registry): id registry
+            checkpoint_path (str, optional): Offset checkpoint file, None to keep offsets in memory. Defaults to `CHECKPOINT_PATH`.
+        """
+        self.sources: dict = sources
+        self.registry: ids.Registry = registry
+        self.checkpoint_path: str = checkpoint_path
+        self.offsets: dict = {}
+        self.waiting: dict = {}
+        self.touched_users: set = set()
+        self.__load_checkpoint()
+
+    def __load_checkpoint(self) -> None:
+        if self.checkpoint_path is None:
+            return
+        try:
+            with open(self.checkpoint_path, encoding="utf-8") as file:
+                checkpoint: dict = json.load(file)
+        except (FileNotFoundError, ValueError):
+            return
+        if "offsets" not in checkpoint:
+            checkpoint = {"offsets": checkpoint}
+        self.offsets = checkpoint["offsets"]
+        self.waiting = checkpoint.get("waiting", {})
+
+    def save_checkpoint(self) -> None:
+        """Writes offsets and waiting records to the checkpoint file.
+        """
+        if self.checkpoint_path is None:
+            return
+        os.makedirs(os.path.dirname(self.checkpoint_path) or ".", exist_ok=True)
+        temp_path: str = f"{self.checkpoint_path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump({"offsets": self.offsets, "waiting": self.waiting}, file)
+        os.replace(temp_path, self.checkpoint_path)
+
+    def mark_loaded(self, sizes: dict) -> None:
+        """Moves checkpoints to the end of the loaded rows, rows appended to the files after them are ingested.
+        Waiting records are dropped, they are part of the loaded rows.
+
+        Args:
+            sizes (dict): (`path` : bytes the loader parsed), see `dataset_cache.loaded_sizes`
+        """
+        for path in self.sources.values():
+            self.offsets[path] = sizes[path]
+        self.waiting = {}
+        self.save_checkpoint()
+
+    def tail(self, kind: str) -> tuple:
+        """Reads complete records appended to a file since its checkpoint. The checkpoint is not moved, see
+        `commit`. A file that shrank below its checkpoint is read again from the start.
+
+        Args:
+            kind (str): dataset kind
+
+        Returns:
+            tuple: (new records as CSV text, offset after them)
+        """
+        path: str = self.sources[kind]
+        offset: int = self.offsets.get(path, 0)
+        if os.path.getsize(path) < offset:
+            offset = 0
+
+        with open(path, "rb") as file:
+            file.seek(offset)
+            data: bytes = file.read()
+        length: int = parse_dict.complete_length(data)
+        if length == 0:
+            return [], offset
+
+        records: list = list(parse_dict.split_records([data[:length].decode("utf-8")]))
+        if offset == 0:
+            records = records[1:]
+        return records, offset + length
+
+    def parse(self, kind: str, records: list) -> list:
+        """Parses and interns records.
+
+        Args:
+            kind (str): dataset kind
+            records (list): records as CSV text
+
+        Returns:
+            list: interned records
+        """
+        parse, intern = RECORD_PARSERS[kind]
+        return [intern(parse(record), self.registry) for record in records]
+
+    def ingest(self, graph: nx.DiGraph, statuses: StatusTable, trie: Trie, now: int = None) -> tuple:
+        """Applies new rows of every source. Statuses go first so appended interactions can refer to them,
+        interactions with statuses that are still unknown wait in `waiting` and are tried again on the next
+        ingest. A status that arrives again replaces its row in the table but keeps the words the trie already
+        indexed for it, the tries cannot remove words.
+
+        Checkpoints are not moved here: the returned progress is passed to `commit` once the changed data
+        is published, so rows of an ingest that failed are read again.
+
+        Args:
+            graph (nx.DiGraph): affinity graph, `CsrAffinity` and `BucketedAffinity` are updated in place too
+            statuses (StatusTable): status table
+            trie (Trie): search trie
+            now (int, optional): Time recency is measured from, in seconds. Defaults to None (current time).
+
+        Returns:
+            tuple: ((`kind` : `applied rows`) plus `waiting` interactions, progress for `commit`)
+        """
+        if now is None:
+            now = timestamps.now()
+        applied: dict = {}
+        offsets: dict = dict(self.offsets)
+        waiting: dict = dict(self.waiting)
+
+        if "statuses" in self.sources:
+            texts, offsets[self.sources["statuses"]] = self.tail("statuses")
+            new_statuses: dict = {status["status_id"]: status for status in self.parse("statuses", texts)}
+            known_ids: set = {status_id for status_id in new_statuses if status_id in statuses}
+            statuses.insert(new_statuses)
+            for status_id, status in new_statuses.items():
+                if status_id not in known_ids:
+                    trie.insert(status["status_message"], status_id)
+            applied["statuses"] = len(new_statuses)
+
+        interactions: dict = {}
+        for kind in GROUP_KEYS:
+            if kind not in self.sources:
+                continue
+            new_texts, offsets[self.sources[kind]] = self.tail(kind)
+            texts: list = self.waiting.get(kind, []) + new_texts
+            records: list = self.parse(kind, texts)
+            known: list = [record for record in records if record["status_id"] in statuses]
+            waiting[kind] = [text for text, record in zip(texts, records) if record["status_id"] not in statuses]
+            interactions[kind] = parse_dict.group_by(known, GROUP_KEYS[kind])
+            applied[kind] = len(known)
+
+        touched_users: set = {actor for groups in interactions.values() for actor in groups}
+        referenced_ids: set = {record["status_id"] for groups in interactions.values() for records in groups.values() for record in records}
+        referenced: dict = {status_id: statuses[status_id] for status_id in referenced_ids}
+        shares, reactions, comments = (interactions.get(kind, {}) for kind in ("shares", "reactions", "comments"))
+        if isinstance(graph, BucketedAffinity):
+            graph.add({}, referenced, shares, reactions, comments)
+        elif isinstance(graph, CsrAffinity):
+            graph.update(*affinity_triples({}, referenced, shares, reactions, comments, now))
+        else:
+            graph_generator.add_affinities(graph, graph_generator.generate_graph({}, referenced, shares, reactions, comments, nx.DiGraph(), now))
+        applied["waiting"] = sum(len(texts) for texts in waiting.values())
+        return applied, {"offsets": offsets, "waiting": waiting, "touched_users": touched_users}
+
+    def commit(self, progress: dict) -> None:
+        """Moves checkpoints past the rows of a published ingest and keeps users whose affinity edges changed
+        in `touched_users`.
+
+        Args:
+            progress (dict): progress returned by `ingest`
+        """
+        self.offsets = progress["offsets"]
+        self.waiting = progress["waiting"]
+        self.touched_users = progress["touched_users"]
+        self.save_checkpoint()
@@ -0,0 +1,165 @@
+"""Parallel dataset loading. Independent files are parsed at the same time and large files are split into
+byte ranges that end on record boundaries, parsed in worker processes and merged back in file order, so the
+result is the same as the serial loaders in `parse_dict`.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import mmap
+import os
+
+import parse_dict
+
+
+CHUNK_BYTES: int = 16 << 20
+QUOTE_SCAN_BYTES: int = 1 << 20
+
+RECORD_PARSERS: dict = {
+    "statuses": parse_dict.parse_status,
+    "comments": parse_dict.parse_comment,
+    "reactions": parse_dict.parse_reaction,
+    "shares": parse_dict.parse_share,
+    "friends": parse_dict.parse_friends,
+}
+GROUP_KEYS: dict = {
+    "comments": "comment_author",
+    "reactions": "reactor",
+    "shares": "sharer",
+}
+
+
+def _count_quotes(buffer: mmap.mmap, start: int, end: int) -> int:
+    count: int = 0
+    for position in range(start, end, QUOTE_SCAN_BYTES):
+        count += buffer[position:min(position + QUOTE_SCAN_BYTES, end)].count(b"\"")
+    return count
+
+
+def _next_record_start(buffer: mmap.mmap, position: int, in_quotes: bool) -> tuple:
+    """Walks forward from `position` to the first line end that is outside quotes.
+
+    Returns:
+        tuple: (`offset after that line end`, `quote state at it`)
+    """
+    size: int = len(buffer)
+    while position < size:
+        newline: int = buffer.find(b"\n", position)
+        end: int = size if newline == -1 else newline
+        if buffer[position:end].count(b"\"") % 2 == 1:
+            in_quotes = not in_quotes
+        position = end + 1
+        if not in_quotes:
+            return min(position, size), in_quotes
+    return size, in_quotes
+
+
+def record_boundaries(path: str, parts: int, size: int = None) -> list:
+    """Splits file into at most `parts` byte ranges that start and end on record boundaries. The header is
+    left out of the first range.
+
+    Args:
+        path (str): file path
+        parts (int): wanted number of ranges
+        size (int, optional): Bytes to split, rows appended after them are left out. Defaults to None (whole file).
+
+    Returns:
+        list: offsets, range `i` is `[offsets[i], offsets[i + 1])`, the last one ends after the last complete record
+    """
+    size = parse_dict.complete_size(path, size)
+    if size == 0:
+        return [0, 0]
+
+    with open(path, "rb") as file:
+        with mmap.mmap(file.fileno(), size, access=mmap.ACCESS_READ) as buffer:
+            start, in_quotes = _next_record_start(buffer, 0, False)
+            boundaries: list = [start]
+            position: int = start
+            for part in range(1, parts):
+                target: int = start + (size - start) * part // parts
+                if target <= position:
+                    continue
+                if _count_quotes(buffer, position, target) % 2 == 1:
+                    in_quotes = not in_quotes
+                position, in_quotes = _next_record_start(buffer, target, in_quotes)
+                if position >= size:
+                    break
+                boundaries.append(position)
+
+    boundaries.append(size)
+    return boundaries
+
+
+def _build(kind: str, records) -> dict:
+    if kind in GROUP_KEYS:
+        return parse_dict.group_by(records, GROUP_KEYS[kind])
+    if kind == "statuses":
+        return {record["status_id"]: record for record in records}
+    return dict(records)
+
+
+def _parse_range(kind: str, path: str, start: int, end: int) -> dict:
+    """Parses records in byte range `[start, end)` of `path`.
+
+    Args:
+        kind (str): dataset kind
+        path (str): file path
+        start (int): first byte
+        end (int): end byte
+
+    Returns:
+        dict: partial dataset
+    """
+    with open(path, "rb") as file:
+        file.seek(start)
+        text: str = file.read(end - start).decode("utf-8")
+    parse = RECORD_PARSERS[kind]
+    return _build(kind, (parse(record) for record in parse_dict.split_records([text])))
+
+
+def merge(kind: str, parts: list) -> dict:
+    """Merges partial datasets in file order.
+
+    Args:
+        kind (str): dataset kind
+        parts (list): partial datasets, ordered as their ranges in the file
+
+    Returns:
+        dict: dataset equal to the one parsed serially
+    """
+    merged: dict = {}
+    if kind not in GROUP_KEYS:
+        for part in parts:
+            merged.update(part)
+        return merged
+
+    for part in parts:
+        for key, records in part.items():
+            if key in merged:
+                merged[key].extend(records)
+            else:
+                merged[key] = records
+    return merged
+
+
+def load_datasets(sources: dict, workers: int = None, chunk_bytes: int = CHUNK_BYTES, sizes: dict = None) -> dict:
+    """Parses datasets in worker processes.
+
+    Args:
+        sources (dict): (`kind` : `path`)
+        workers (int, optional): Number of worker processes. Defaults to None (all cores).
+        chunk_bytes (int, optional): Target size of a parsed byte range. Defaults to `CHUNK_BYTES`.
+        sizes (dict, optional): (`kind` : bytes to parse). Defaults to None (whole files).
+
+    Returns:
+        dict: (`kind` : `dataset`)
+    """
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures: dict = {}
+        for kind, path in sources.items():
+            size: int = os.path.getsize(path) if sizes is None else sizes[kind]
+            parts: int = max(1, -(-size // chunk_bytes))
+            boundaries: list = record_boundaries(path, parts, size)
+            futures[kind] = [executor.submit(_parse_range, kind, path, boundaries[i], boundaries[i + 1])
+                             for i in range(len(boundaries) - 1)]
+
+        return {kind: merge(kind, [future.result() for future in parts]) for kind, parts in futures.items()}
@@ -1,189 +1,293 @@
-from random import randint, random
-import datetime
-import time
+import codecs
+import mmap
+import os
+from typing import Iterable, Iterator
 
-def load_comments_dict(path):
-    output_data = {}
-    with open(path, encoding="utf-8") as file:
-        lines = file.readlines()
-        comment = ""
-        found_open_ellipsis = False
-        found_close_ellipsis = False
-
-        for index in range(1, len(lines)):
+from ids import Registry, intern_comment, intern_reaction, intern_share, intern_status
+from timestamps import parse_timestamp
 
-            line = lines[index]
 
-            if line == "\n":
-                comment += line
+CHUNK_SIZE: int = 1 << 20
 
-            if line[-1] == "\n":
-                line = line[:-1]
 
-            first_index = line.index("\"") if "\"" in line else -1
-            if first_index > -1:
-                found_open_ellipsis = True
+def split_records(chunks: Iterable[str]) -> Iterator[str]:
+    """Splits CSV text into records. Newlines inside quoted fields are kept in the record,
+    so a record that spans several lines is yielded once.
 
-            next_index = line.index("\"", first_index + 1) if "\"" in line[first_index + 1:] else -1
-            if next_index > -1:
-                found_close_ellipsis = True
+    Args:
+        chunks (Iterable[str]): consecutive pieces of CSV text
 
-            if found_open_ellipsis and not found_close_ellipsis:
-                comment += line
+    Yields:
+        str: record without the line terminator
+    """
+    pending: list = []
+    in_quotes: bool = False
+    for chunk in chunks:
+        start: int = 0
+        while True:
+            newline: int = chunk.find("\n", start)
+            piece: str = chunk[start:] if newline == -1 else chunk[start:newline]
+            if piece.count("\"") % 2 == 1:
+                in_quotes = not in_quotes
+            if newline == -1:
+                pending.append(piece)
+                break
+            start = newline + 1
+            if in_quotes:
+                pending.append(piece + "\n")
                 continue
-            else:
-                comment = line
-
-            data = comment.split(",")
-            n = len(data)
-
-            if n < 14:
-                raise Exception("Comment does not contain necessary data.")
-            elif n > 14:
-                comment_text = "".join(data[3:n - 10])
-            else:
-                comment_text = data[3]
-            
-            content = {
-                "comment_id": data[0],
-                "status_id": data[1],
-                "parent_id": data[2],
-                "comment_message": comment_text,
-                "comment_author": data[n - 10],
-                "comment_published": datetime.datetime.strptime(data[n - 9], "%Y-%m-%d %H:%M:%S"),
-                "num_reactions": int(data[n - 8]),
-                "num_likes": int(data[n - 7]),
-                "num_loves": int(data[n - 6]),
-                "num_wows": int(data[n - 5]),
-                "num_hahas": int(data[n - 4]),
-                "num_sads": int(data[n - 3]),
-                "num_angrys": int(data[n - 2]),
-                "num_special": int(data[n - 1])
-            }
-            
-            if data[n-10] not in output_data:
-                output_data[data[n-10]] = []
-            
-            output_data[data[n-10]].append(content)
-            found_open_ellipsis = found_close_ellipsis = False
-            comment = ""
+            pending.append(piece)
+            record: str = "".join(pending).rstrip("\r")
+            pending = []
+            if record:
+                yield record
 
-    return output_data
+    record = "".join(pending).rstrip("\r")
+    if record:
+        yield record
 
-def load_statuses_dict(path):
-    extracted_statuses = {}
-    with open(path, encoding="utf-8") as file:
-        lines = file.readlines()
-        comment = ""
-        paired_ellipses = True
 
-        for index in range(1, len(lines)):
+def complete_length(data: bytes) -> int:
+    """Gets length of the longest prefix of `data` that ends on a record boundary.
 
-            line = lines[index]
+    Args:
+        data (bytes): CSV bytes
+
+    Returns:
+        int: prefix length, 0 if `data` holds no complete record
+    """
+    end: int = 0
+    position: int = 0
+    in_quotes: bool = False
+    while True:
+        newline: int = data.find(b"\n", position)
+        if newline == -1:
+            return end
+        if data.count(b"\"", position, newline) % 2 == 1:
+            in_quotes = not in_quotes
+        position = newline + 1
+        if not in_quotes:
+            end = position
 
-            if line == "\n":
-                comment += line
-                continue
 
-            # if line[-1] == "\n":
-            #     line = line[:-1]
-            line = line.strip()
+def complete_size(path: str, size: int = None) -> int:
+    """Gets length of the longest prefix of the first `size` bytes of a file that ends on a record boundary,
+    like `complete_length` but without reading the file into memory.
 
-            previous_index = -1
+    Args:
+        path (str): file path
+        size (int, optional): Bytes to look at. Defaults to None (whole file).
 
+    Returns:
+        int: prefix length, 0 if the bytes hold no complete record
+    """
+    if size is None:
+        size = os.path.getsize(path)
+    if size == 0:
+        return 0
+    with open(path, "rb") as file:
+        with mmap.mmap(file.fileno(), size, access=mmap.ACCESS_READ) as buffer:
+            quotes: int = sum(buffer[position:min(position + CHUNK_SIZE, size)].count(b"\"") for position in range(0, size, CHUNK_SIZE))
+            end: int = size
             while True:
-                index = line.index("\"", previous_index+1) if "\"" in line[previous_index+1:] else -1
-                if index == -1:
-                    break
-                paired_ellipses = not paired_ellipses
-                previous_index = index
-
-            comment += line
-            if not paired_ellipses:
-                continue
+                newline: int = buffer.rfind(b"\n", 0, end)
+                if newline == -1:
+                    return 0
+                quotes -= buffer[newline + 1:end].count(b"\"")
+                if quotes % 2 == 0:
+                    return newline + 1
+                end = newline
+
+
+def _read_chunks(file, chunk_size: int, size: int) -> Iterator[str]:
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    while size is None or size > 0:
+        data: bytes = file.read(chunk_size if size is None else min(chunk_size, size))
+        if not data:
+            break
+        if size is not None:
+            size -= len(data)
+        yield decoder.decode(data)
+    yield decoder.decode(b"", final=True)
+
+
+def iter_records(path: str, chunk_size: int = CHUNK_SIZE, size: int = None) -> Iterator[str]:
+    """Reads `path` in chunks of `chunk_size` bytes and yields its records, skipping the header.
+
+    Args:
+        path (str): file path
+        chunk_size (int, optional): bytes read at once. Defaults to `CHUNK_SIZE`.
+        size (int, optional): Bytes to read, see `complete_size`. Defaults to None (whole file).
+
+    Yields:
+        str: record
+    """
+    with open(path, "rb") as file:
+        records: Iterator[str] = split_records(_read_chunks(file, chunk_size, size))
+        next(records, None)
+        yield from records
+
+
+def parse_comment(record: str) -> dict:
+    data = record.strip().split(",")
+    n = len(data)
+
+    if n < 14:
+        raise Exception("Comment does not contain necessary data.")
+    elif n > 14:
+        comment_text = "".join(data[3:n - 10])
+    else:
+        comment_text = data[3]
+
+    return {
+        "comment_id": data[0],
+        "status_id": data[1],
+        "parent_id": data[2],
+        "comment_message": comment_text,
+        "comment_author": data[n - 10],
+        "comment_published": parse_timestamp(data[n - 9]),
+        "num_reactions": int(data[n - 8]),
+        "num_likes": int(data[n - 7]),
+        "num_loves": int(data[n - 6]),
+        "num_wows": int(data[n - 5]),
+        "num_hahas": int(data[n - 4]),
+        "num_sads": int(data[n - 3]),
+        "num_angrys": int(data[n - 2]),
+        "num_special": int(data[n - 1])
+    }
+
+
+def parse_status(record: str) -> dict:
+    data = record.strip().split(",")
+    n = len(data)
+
+    if n < 16:
+        raise Exception("Status does not contain necessary data.")
+    elif n > 16:
+        comment_text = "".join(data[1:n-14])
+    else:
+        comment_text = data[1]
+
+    return {
+        "status_id": data[0],
+        "status_message": comment_text,
+        "status_type": data[n - 14],
+        "status_link": data[n - 13],
+        "status_published": parse_timestamp(data[n - 12]),
+        "author": data[n - 11],
+        "num_reactions": int(data[n - 10]),
+        "num_comments": int(data[n - 9]),
+        "num_shares": int(data[n - 8]),
+        "num_likes": int(data[n - 7]),
+        "num_loves": int(data[n - 6]),
+        "num_wows": int(data[n - 5]),
+        "num_hahas": int(data[n - 4]),
+        "num_sads": int(data[n - 3]),
+        "num_angrys": int(data[n - 2]),
+        "num_special": int(data[n - 1])
+    }
+
+
+def parse_share(record: str) -> dict:
+    line_data = record.strip().split(",")
+    return {
+        "status_id": line_data[0],
+        "sharer": line_data[1],
+        "status_shared": parse_timestamp(line_data[2])
+    }
+
+
+def parse_reaction(record: str) -> dict:
+    line_data = record.strip().split(",")
+    return {
+        "status_id": line_data[0],
+        "type_of_reaction": line_data[1],
+        "reactor": line_data[2],
+        "reacted": parse_timestamp(line_data[3])
+    }
 
-            data = comment.split(",")
-            n = len(data)
-
-            if n < 16:
-                raise Exception("Status does not contain necessary data.")
-            elif n > 16:
-                comment_text = "".join(data[1:n-14])
-            else:
-                comment_text = data[1]
-                
-            content = {
-                "status_id": data[0],
-                "status_message": comment_text,
-                "status_type": data[n - 14],
-                "status_link": data[n - 13],
-                "status_published": datetime.datetime.strptime(data[n - 12], "%Y-%m-%d %H:%M:%S"),
-                "author": data[n - 11],
-                "num_reactions": int(data[n - 10]),
-                "num_comments": int(data[n - 9]),
-                "num_shares": int(data[n - 8]),
-                "num_likes": int(data[n - 7]),
-                "num_loves": int(data[n - 6]),
-                "num_wows": int(data[n - 5]),
-                "num_hahas": int(data[n - 4]),
-                "num_sads": int(data[n - 3]),
-                "num_angrys": int(data[n - 2]),
-                "num_special": int(data[n - 1])
-            }
-            
-            extracted_statuses[data[0]] = content
-             
-            comment = ""
-            paired_ellipses = True
 
+def parse_friends(record: str) -> tuple:
+    line_data = record.strip().split(",")
+    return line_data[0], line_data[2:]
+
+
+def iter_comments(path: str, size: int = None) -> Iterator[dict]:
+    for record in iter_records(path, size=size):
+        yield parse_comment(record)
+
+
+def iter_statuses(path: str, size: int = None) -> Iterator[dict]:
+    for record in iter_records(path, size=size):
+        yield parse_status(record)
+
+
+def iter_shares(path: str, size: int = None) -> Iterator[dict]:
+    for record in iter_records(path, size=size):
+        yield parse_share(record)
+
+
+def iter_reactions(path: str, size: int = None) -> Iterator[dict]:
+    for record in iter_records(path, size=size):
+        yield parse_reaction(record)
+
+
+def iter_friends(path: str, size: int = None) -> Iterator[tuple]:
+    for record in iter_records(path, size=size):
+        yield parse_friends(record)
+
+
+def group_by(records: Iterable[dict], key: str) -> dict:
+    """Groups records into lists by the value of `key`, keeping file order.
+
+    Args:
+        records (Iterable[dict]): records
+        key (str): grouping field
+
+    Returns:
+        dict: `key value` : list of records
+    """
+    output_data = {}
+    for content in records:
+        value = content[key]
+        if value not in output_data:
+            output_data[value] = []
+        output_data[value].append(content)
+    return output_data
+
+
+def load_comments_dict(path, registry: Registry = None):
+    comments = iter_comments(path)
+    if registry is not None:
+        comments = (intern_comment(comment, registry) for comment in comments)
+    return group_by(comments, "comment_author")
+
+
+def load_statuses_dict(path, registry: Registry = None):
+    extracted_statuses = {}
+    for content in iter_statuses(path):
+        if registry is not None:
+            intern_status(content, registry)
+        extracted_statuses[content["status_id"]] = content
     return extracted_statuses
 
 
-def load_shares_dict(path):
-    shares = {}
-    with open(path, encoding="utf-8") as file:
-        lines = file.readlines()
-        for line in lines[1:]:
-            line_data = line.strip().split(",")
-            
-            content = {
-                "status_id": line_data[0],
-                "sharer": line_data[1],
-                "status_shared": datetime.datetime.strptime(line_data[2], "%Y-%m-%d %H:%M:%S")
-            }
-            
-            if line_data[1] not in shares:
-                shares[line_data[1]] = []
-            
-            shares[line_data[1]].append(content)
-    return shares
-
-def load_reactions_dict(path):
-    reactions = {}
-    with open(path, encoding="utf-8") as file:
-        lines = file.readlines()
-        for line in lines[1:]:
-            line_data = line.strip().split(",")
-            content = {
-                "status_id": line_data[0],
-                "type_of_reaction": line_data[1],
-                "reactor": line_data[2],
-                "reacted": datetime.datetime.strptime(line_data[3], "%Y-%m-%d %H:%M:%S")
-            }
-            
-            if line_data[2] not in reactions:
-                reactions[line_data[2]] = []
-            
-            reactions[line_data[2]].append(content)
-            
-    return reactions
-
-def load_friends_dict(path):
-    friends = {}
-    with open(path, encoding="utf-8") as file:
-        lines = file.readlines()
-        for line in lines[1:]:
-            line_data = line.strip().split(",")
-            friends[line_data[0]] = line_data[2:]
-    return friends
+def load_shares_dict(path, registry: Registry = None):
+    shares = iter_shares(path)
+    if registry is not None:
+        shares = (intern_share(share, registry) for share in shares)
+    return group_by(shares, "sharer")
+
+
+def load_reactions_dict(path, registry: Registry = None):
+    reactions = iter_reactions(path)
+    if registry is not None:
+        reactions = (intern_reaction(reaction, registry) for reaction in reactions)
+    return group_by(reactions, "reactor")
+
 
+def load_friends_dict(path, registry: Registry = None):
+    if registry is None:
+        return dict(iter_friends(path))
+    users = registry.users
+    return {users.intern(user): [users.intern(friend) for friend in friends] for user, friends in iter_friends(path)}
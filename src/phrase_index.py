@@ -0,0 +1,232 @@
+"""Positional inverted index for phrase search. Every word occurrence is stored as (`term`, `status`,
+`position`, `offset`): the token position in the filtered message and the character offset of the word in
+it. Terms are sorted in one string, occurrences are sorted by term, status and position, so a phrase is the
+intersection of the occurrences of its words shifted by their place in the phrase.
+
+A phrase matches like `text.has_phrase(message, " " + phrase + " ")` does: the words follow each other
+separated by single spaces, with a word before and after them.
+"""
+
+from bisect import bisect_left
+import threading
+from typing import NamedTuple
+
+import numpy as np
+
+from text import filter_chars
+
+
+class PositionArrays(NamedTuple):
+    """Arrays of a compacted phrase index. `token_counts` is indexed by status id.
+    """
+    text: str
+    term_ptr: np.ndarray
+    occurrence_ptr: np.ndarray
+    statuses: np.ndarray
+    positions: np.ndarray
+    offsets: np.ndarray
+    token_counts: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.term_ptr) - 1
+
+    def term(self, term_id: int) -> str:
+        return self.text[int(self.term_ptr[term_id]):int(self.term_ptr[term_id + 1])]
+
+    def find(self, word: str) -> int:
+        term_id: int = bisect_left(range(len(self)), word, key=self.term)
+        return term_id if term_id < len(self) and self.term(term_id) == word else -1
+
+    def occurrences(self, term_id: int) -> tuple:
+        start, end = int(self.occurrence_ptr[term_id]), int(self.occurrence_ptr[term_id + 1])
+        return self.statuses[start:end], self.positions[start:end], self.offsets[start:end]
+
+
+def empty_arrays() -> PositionArrays:
+    """Builds arrays without occurrences.
+
+    Returns:
+        PositionArrays: empty arrays
+    """
+    return PositionArrays("", np.zeros(1, dtype=np.int64), np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int32),
+                          np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32))
+
+
+def tokenize(status: str) -> tuple:
+    """Splits status into the words `text.filter_chars` keeps.
+
+    Args:
+        status (str): status
+
+    Returns:
+        tuple: (`words`, character `offsets` of the words in the lowercase status)
+    """
+    filtered: str = filter_chars(status, strip=False)
+    offset: int = len(filtered) - len(filtered.lstrip(" "))
+    words: list = filtered.strip(" ").split(" ")
+    offsets: list = []
+    for word in words:
+        offsets.append(offset)
+        offset += len(word) + 1
+    return words, offsets
+
+
+def original_spans(status: str, spans: list) -> list:
+    """Maps character spans of the lowercase status to the status. Lowercasing can make a character longer,
+    like "İ", then later offsets move.
+
+    Args:
+        status (str): status
+        spans (list): (`start`, `end`) offsets in `status.lower()`
+
+    Returns:
+        list: (`start`, `end`) offsets in `status`
+    """
+    if len(status.lower()) == len(status):
+        return spans
+    origins: list = []
+    for index, char in enumerate(status):
+        origins.extend([index] * len(char.lower()))
+    return [(origins[start], origins[end - 1] + 1) for start, end in spans]
+
+
+class PhraseIndex(object):
+    """Positional index. Inserts are staged and merged into new arrays by `compact`, which the first query
+    after inserts runs. `copy` shares the arrays, they are never changed in place.
+    """
+    def __init__(self, arrays: PositionArrays = None):
+        """
+        Args:
+            arrays (PositionArrays, optional): Compacted arrays. Defaults to None (empty index).
+        """
+        self.arrays: PositionArrays = arrays if arrays is not None else empty_arrays()
+        self.pending: list = []
+        self.lock: threading.Lock = threading.Lock()
+
+    def copy(self) -> "PhraseIndex":
+        """Copies index without copying arrays.
+
+        Returns:
+            PhraseIndex: copy
+        """
+        index: PhraseIndex = PhraseIndex(self.arrays)
+        index.pending = list(self.pending)
+        return index
+
+    def insert(self, status: str, id: int) -> None:
+        """Inserts status words with their positions.
+
+        Args:
+            status (str): status
+            id (int): status id
+        """
+        self.pending.append((id,) + tokenize(status))
+
+    def compact(self) -> PositionArrays:
+        """Merges inserted statuses into the arrays. Only the inserted occurrences are sorted, every inserted
+        word is looked up in the terms and its occurrences are placed into the existing ones by status and
+        position. New terms and all occurrences are then inserted into the arrays at once.
+
+        Returns:
+            PositionArrays: compacted arrays
+        """
+        with self.lock:
+            if not self.pending:
+                return self.arrays
+            arrays: PositionArrays = self.arrays
+            words: list = [word for _, status_words, _ in self.pending for word in status_words]
+            terms: list = sorted(set(words))
+            ranks: dict = {term: rank for rank, term in enumerate(terms)}
+            word_ranks: np.ndarray = np.asarray([ranks[word] for word in words], dtype=np.int64)
+            statuses: np.ndarray = np.repeat(np.asarray([status_id for status_id, _, _ in self.pending], dtype=np.int32),
+                                             [len(status_words) for _, status_words, _ in self.pending])
+            positions: np.ndarray = np.asarray([position for _, status_words, _ in self.pending for position in range(len(status_words))],
+                                               dtype=np.int32)
+            offsets: np.ndarray = np.asarray([offset for _, _, word_offsets in self.pending for offset in word_offsets], dtype=np.int32)
+            order: np.ndarray = np.lexsort((positions, statuses, word_ranks))
+            statuses, positions, offsets = statuses[order], positions[order], offsets[order]
+            bounds: list = np.searchsorted(word_ranks[order], np.arange(len(terms) + 1)).tolist()
+
+            occurrence_counts: np.ndarray = np.diff(arrays.occurrence_ptr)
+            insert_at: np.ndarray = np.zeros(len(words), dtype=np.int64)
+            new_terms: list = []
+            new_at: list = []
+            new_counts: list = []
+            for term, low, high in zip(terms, bounds, bounds[1:]):
+                term_id: int = bisect_left(range(len(arrays)), term, key=arrays.term)
+                start: int = int(arrays.occurrence_ptr[term_id])
+                if term_id == len(arrays) or arrays.term(term_id) != term:
+                    insert_at[low:high] = start
+                    new_terms.append(term)
+                    new_at.append(term_id)
+                    new_counts.append(high - low)
+                    continue
+                old_statuses, old_positions, _ = arrays.occurrences(term_id)
+                places: np.ndarray = np.searchsorted(old_statuses, statuses[low:high])
+                for place in np.nonzero(old_statuses[np.minimum(places, len(old_statuses) - 1)] == statuses[low:high])[0].tolist():
+                    status_end: int = int(np.searchsorted(old_statuses, statuses[low + place], side="right"))
+                    places[place] += np.searchsorted(old_positions[places[place]:status_end], positions[low + place], side="right")
+                insert_at[low:high] = start + places
+                occurrence_counts[term_id] += high - low
+
+            occurrence_counts = np.insert(occurrence_counts, new_at, new_counts)
+            occurrence_ptr: np.ndarray = np.zeros(len(occurrence_counts) + 1, dtype=np.int64)
+            np.cumsum(occurrence_counts, out=occurrence_ptr[1:])
+            term_ptr: np.ndarray = np.zeros(len(occurrence_counts) + 1, dtype=np.int64)
+            np.cumsum(np.insert(np.diff(arrays.term_ptr), new_at, [len(term) for term in new_terms]), out=term_ptr[1:])
+            pieces: list = []
+            previous: int = 0
+            for term, term_id in zip(new_terms, new_at):
+                start = int(arrays.term_ptr[term_id])
+                pieces += [arrays.text[previous:start], term]
+                previous = start
+            pieces.append(arrays.text[previous:])
+
+            token_counts: np.ndarray = np.zeros(max(len(arrays.token_counts), max(status_id for status_id, _, _ in self.pending) + 1), dtype=np.int32)
+            token_counts[:len(arrays.token_counts)] = arrays.token_counts
+            for status_id, status_words, _ in self.pending:
+                token_counts[status_id] = len(status_words)
+
+            self.arrays = PositionArrays("".join(pieces), term_ptr, occurrence_ptr, np.insert(arrays.statuses, insert_at, statuses),
+                                         np.insert(arrays.positions, insert_at, positions), np.insert(arrays.offsets, insert_at, offsets),
+                                         token_counts)
+            self.pending = []
+            return self.arrays
+
+    def find(self, phrase: str) -> dict:
+        """Finds statuses with `phrase`. The occurrences of every phrase word are shifted back by the word's
+        place in the phrase and intersected, the rarest word first.
+
+        Args:
+            phrase (str): phrase
+
+        Returns:
+            dict: (`status` : list of (`start`, `end`) character offsets of the matches in the lowercase status)
+        """
+        arrays: PositionArrays = self.compact() if self.pending else self.arrays
+        words: list = filter_chars(phrase).split(" ")
+        term_ids: list = [arrays.find(word) for word in words]
+        if min(term_ids) < 0:
+            return {}
+
+        starts: list = []
+        for place, term_id in enumerate(term_ids):
+            statuses, positions, _ = arrays.occurrences(term_id)
+            keys: np.ndarray = (statuses.astype(np.int64) << 32) | (positions.astype(np.int64) - place)
+            starts.append(keys[positions > place])
+        starts.sort(key=len)
+        matches: np.ndarray = starts[0]
+        for keys in starts[1:]:
+            matches = np.intersect1d(matches, keys)
+
+        statuses: np.ndarray = matches >> 32
+        matches = matches[(matches & 0xFFFFFFFF) + len(words) < arrays.token_counts[statuses]]
+        first_statuses, first_positions, first_offsets = arrays.occurrences(term_ids[0])
+        first_keys: np.ndarray = (first_statuses.astype(np.int64) << 32) | first_positions
+        offsets: list = first_offsets[np.searchsorted(first_keys, matches)].tolist()
+
+        length: int = len(" ".join(words))
+        found: dict = {}
+        for status_id, offset in zip((matches >> 32).tolist(), offsets):
+            found.setdefault(status_id, []).append((offset, offset + length))
+        return found
@@ -0,0 +1,163 @@
+"""LRU cache of search and autocomplete results. Keys hold the user, the query kind, the normalized term and the data
+version, so results of older data are never returned and age out. Entries of a user are dropped with
+`invalidate_users` when the user's affinity edges change.
+"""
+
+from collections import OrderedDict
+import sys
+
+from text import filter_chars
+
+
+MAX_BYTES: int = 64 * 1024 * 1024
+
+
+def normalize_term(term: str, kind: str = None) -> str:
+    """Normalizes search term, case and repeated spaces do not change results. Phrases are normalized with
+    `text.filter_chars` like the phrase index does, spaces between their words matter.
+
+    Args:
+        term (str): search term
+        kind (str, optional): Query kind. Defaults to None.
+
+    Returns:
+        str: normalized term
+    """
+    if kind == "phrase":
+        return filter_chars(term)
+    return " ".join(term.lower().split())
+
+
+def estimate_size(value, seen: set = None) -> int:
+    """Estimates memory held by a value. Containers are counted with their items, other objects with their
+    string and number attributes only, objects they reference are shared and not owned by the value.
+
+    Args:
+        value: any value
+        seen (set, optional): Ids of objects already counted. Defaults to None.
+
+    Returns:
+        int: size in bytes
+    """
+    if seen is None:
+        seen = set()
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    size: int = sys.getsizeof(value)
+    if isinstance(value, (str, bytes, int, float, bool)) or value is None:
+        return size
+    if isinstance(value, dict):
+        return size + sum(estimate_size(key, seen) + estimate_size(item, seen) for key, item in value.items())
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return size + sum(estimate_size(item, seen) for item in value)
+    attributes: list = list(vars(value).values()) if hasattr(value, "__dict__") else []
+    attributes.extend(getattr(value, slot) for slot in getattr(type(value), "__slots__", ()) if hasattr(value, slot))
+    return size + sum(estimate_size(attribute, seen) for attribute in attributes if isinstance(attribute, (str, bytes, int, float)))
+
+
+class ResultCache(object):
+    """Least recently used results, bounded by their estimated size in bytes.
+    """
+    def __init__(self, max_bytes: int = MAX_BYTES):
+        """
+        Args:
+            max_bytes (int, optional): Memory bound. Defaults to `MAX_BYTES`.
+        """
+        self.max_bytes: int = max_bytes
+        self.entries: OrderedDict = OrderedDict()
+        self.user_keys: dict = {}
+        self.bytes: int = 0
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, key: tuple) -> bool:
+        return key in self.entries
+
+    @staticmethod
+    def key(user_id: int, kind: str, term: str, version) -> tuple:
+        """Builds cache key.
+
+        Args:
+            user_id (int): user, None for results that do not depend on the user
+            kind (str): query kind, like `words` or `phrase`
+            term (str): search term, normalized with `normalize_term`
+            version: data version the result is computed from
+
+        Returns:
+            tuple: key
+        """
+        return (user_id, kind, normalize_term(term, kind), version)
+
+    def get(self, key: tuple):
+        """Gets cached result and marks it as recently used.
+
+        Args:
+            key (tuple): key from `key`
+
+        Returns:
+            cached result, None on a miss
+        """
+        entry: tuple = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key: tuple, value) -> None:
+        """Caches result, least recently used entries are evicted to stay within `max_bytes`. Results larger
+        than the bound are not cached.
+
+        Args:
+            key (tuple): key from `key`
+            value: result
+        """
+        self.__remove(key)
+        size: int = estimate_size(value)
+        if size > self.max_bytes:
+            return
+        while self.entries and self.bytes + size > self.max_bytes:
+            self.__remove(next(iter(self.entries)))
+        self.entries[key] = (value, size)
+        self.user_keys.setdefault(key[0], set()).add(key)
+        self.bytes += size
+
+    def __remove(self, key: tuple) -> None:
+        entry: tuple = self.entries.pop(key, None)
+        if entry is None:
+            return
+        self.bytes -= entry[1]
+        keys: set = self.user_keys[key[0]]
+        keys.discard(key)
+        if not keys:
+            del self.user_keys[key[0]]
+
+    def invalidate_users(self, user_ids) -> None:
+        """Drops results of users whose affinity edges changed.
+
+        Args:
+            user_ids (Iterable[int]): users
+        """
+        for user_id in user_ids:
+            for key in list(self.user_keys.get(user_id, ())):
+                self.__remove(key)
+
+    def clear(self) -> None:
+        """Drops every result.
+        """
+        self.entries.clear()
+        self.user_keys.clear()
+        self.bytes = 0
+
+    def stats(self) -> dict:
+        """Gets cache counters.
+
+        Returns:
+            dict: `hits`, `misses`, `entries` and `bytes`
+        """
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self.entries), "bytes": self.bytes}
@@ -0,0 +1,92 @@
+"""Search index snapshots. The arrays of a compacted `CompactTrie` (terms, counts, posting lists, suffix order
+and radix nodes) and of its phrase index (word positions) are written to one snapshot file and
+memory-mapped on load, so a start does not insert any status. Posting lists and positions are paged in
+only when a search reads them. The header holds a fingerprint of the status dataset and of the interned
+status ids, the postings refer to them.
+"""
+
+import numpy as np
+
+from compact_trie import CompactTrie, RadixIndex
+import dataset_cache
+import graph_snapshot
+import ids
+from phrase_index import PhraseIndex, PositionArrays
+from snapshot import read_arrays, read_header, update_header, write_snapshot
+
+
+SEARCH_INDEX_VERSION: int = 3
+SEARCH_INDEX_PATH: str = "cache/search.snap"
+
+
+def index_header(status_path: str, registry: ids.Registry) -> dict:
+    return {
+        "version": SEARCH_INDEX_VERSION,
+        "kind": "search",
+        "sources": {status_path: dataset_cache.fingerprint(status_path)},
+        "statuses": graph_snapshot.names_fingerprint(registry.statuses),
+    }
+
+
+def check_index_header(header: dict, status_path: str, registry: ids.Registry) -> str:
+    """Checks that a search index header matches the loaded statuses.
+
+    Args:
+        header (dict): snapshot header
+        status_path (str): status dataset the index is built from
+        registry (ids.Registry): id registry of the loaded datasets
+
+    Returns:
+        str: reason the index is stale, None if it can be used
+    """
+    if header is None:
+        return "not found"
+    if header.get("version") != SEARCH_INDEX_VERSION or header.get("kind") != "search":
+        return "different format version"
+    if set(header["sources"]) != {status_path}:
+        return "different datasets"
+    if not dataset_cache.is_fresh(header["sources"][status_path], status_path):
+        return f"{status_path} changed"
+    if header["statuses"] != graph_snapshot.names_fingerprint(registry.statuses):
+        return "status ids changed"
+    return None
+
+
+def save_index(trie: CompactTrie, status_path: str, registry: ids.Registry, file_path: str = SEARCH_INDEX_PATH) -> None:
+    """Saves search index, staged inserts are compacted first.
+
+    Args:
+        trie (CompactTrie): trie built from the statuses of `status_path`
+        status_path (str): status dataset
+        registry (ids.Registry): id registry
+        file_path (str, optional): Snapshot path. Defaults to `SEARCH_INDEX_PATH`.
+    """
+    arrays: dict = {}
+    for prefix, index in (("", trie.compact()), ("phrase_", trie.phrases.compact())):
+        arrays.update((prefix + name, getattr(index, name)) for name in index._fields if name != "text")
+        arrays[prefix + "text"] = np.frombuffer(index.text.encode("ascii"), dtype=np.uint8)
+    write_snapshot(file_path, index_header(status_path, registry), arrays)
+
+
+def load_index(status_path: str, registry: ids.Registry, file_path: str = SEARCH_INDEX_PATH) -> tuple:
+    """Loads search index if its snapshot matches the loaded statuses.
+
+    Args:
+        status_path (str): status dataset
+        registry (ids.Registry): id registry
+        file_path (str, optional): Snapshot path. Defaults to `SEARCH_INDEX_PATH`.
+
+    Returns:
+        tuple: (`CompactTrie` or None, reason the snapshot was refused or None)
+    """
+    header: dict = read_header(file_path)
+    reason: str = check_index_header(header, status_path, registry)
+    if reason is not None:
+        return None, reason
+
+    update_header(file_path, header)
+    _, arrays = read_arrays(file_path)
+    for name in ("text", "phrase_text"):
+        arrays[name] = arrays[name].tobytes().decode("ascii")
+    phrases: PositionArrays = PositionArrays(**{name: arrays.pop("phrase_" + name) for name in PositionArrays._fields})
+    return CompactTrie(RadixIndex(**arrays), PhraseIndex(phrases)), None
@@ -0,0 +1,293 @@
+"""Asyncio HTTP service. Data is loaded once and shared read-only by every request. The event loop only
+parses requests and writes responses, feeds and searches run in a thread pool. `MAX_CONCURRENT_REQUESTS`
+requests are computed at once, further requests wait, and over `MAX_PENDING_REQUESTS` waiting requests
+are refused with 503.
+
+Endpoints, all `GET` with JSON responses:
+
+* `/feed?user=NAME[&cursor=CURSOR][&size=N]` - feed page and the cursor of the next page
+* `/search?user=NAME&q=TERM` - statuses with any word of the term
+* `/phrase?user=NAME&q=PHRASE` - statuses with the phrase and the character offsets of its matches
+* `/autocomplete?q=PREFIX[&limit=N]` - most frequent words starting with the prefix
+"""
+
+import argparse
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import json
+import time
+from urllib.parse import parse_qs, urlsplit
+
+import app
+from data_snapshot import DataSnapshot, SnapshotHolder
+import feed
+import graph_generator
+import ids
+from status_table import StatusTable
+import timestamps
+from trie import Trie
+
+
+HOST: str = "127.0.0.1"
+PORT: int = 8080
+MAX_CONCURRENT_REQUESTS: int = 16
+MAX_PENDING_REQUESTS: int = 256
+MAX_REQUEST_BYTES: int = 16 * 1024
+MAX_PAGE_SIZE: int = 100
+
+REASONS: dict = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    409: "Conflict",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+}
+
+
+class HttpError(Exception):
+    """Request error with HTTP status.
+    """
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status: int = status
+
+
+class FeedService(object):
+    """Feed and search queries over loaded data. Every query reads one data snapshot and never modifies it,
+    unknown users get the feed of a user without affinity.
+    """
+    def __init__(self, holder: SnapshotHolder, registry: ids.Registry):
+        """
+        Args:
+            holder (SnapshotHolder): current data snapshot
+            registry (ids.Registry): id registry
+        """
+        self.holder: SnapshotHolder = holder
+        self.registry: ids.Registry = registry
+        self.routes: dict = {
+            "/feed": self.feed,
+            "/search": self.search,
+            "/phrase": self.phrase,
+            "/autocomplete": self.autocomplete,
+        }
+
+    def user_id(self, params: dict) -> int:
+        name: str = self.__param(params, "user")
+        return self.registry.users.get(name, ids.UNKNOWN_ID)
+
+    @staticmethod
+    def __param(params: dict, name: str) -> str:
+        if not params.get(name):
+            raise HttpError(400, f"Missing parameter: {name}")
+        return params[name]
+
+    @staticmethod
+    def __int_param(params: dict, name: str, default: int) -> int:
+        try:
+            value: int = int(params.get(name, default))
+        except ValueError:
+            raise HttpError(400, f"Parameter {name} must be an integer")
+        if not 0 < value <= MAX_PAGE_SIZE:
+            raise HttpError(400, f"Parameter {name} must be between 1 and {MAX_PAGE_SIZE}")
+        return value
+
+    def status_json(self, status: feed.Status) -> dict:
+        """Converts ranked status to JSON.
+
+        Args:
+            status (feed.Status): ranked status
+
+        Returns:
+            dict: status fields with original ids and names
+        """
+        record: dict = status.statuses[status.status_id]
+        return {
+            "status_id": self.registry.statuses.name(status.status_id),
+            "author": self.registry.users.name(record["author"]),
+            "message": record["status_message"],
+            "link": record["status_link"],
+            "published": timestamps.format_timestamp(record["status_published"]),
+            "relevance": status.relevance,
+        }
+
+    def feed(self, params: dict) -> dict:
+        snapshot: DataSnapshot = self.holder.current
+        try:
+            page, cursor = feed.get_feed_page(snapshot.graph, self.user_id(params), snapshot.statuses, params.get("cursor"),
+                                              self.__int_param(params, "size", feed.FEED_SIZE), snapshot_version=snapshot.version)
+        except feed.StaleCursorError as error:
+            raise HttpError(409, str(error))
+        except ValueError as error:
+            raise HttpError(400, str(error))
+        return {"statuses": [self.status_json(status) for status in page], "cursor": cursor}
+
+    def search(self, params: dict) -> dict:
+        term: str = self.__param(params, "q")
+        snapshot: DataSnapshot = self.holder.current
+        statuses: list = feed.get_feed(snapshot.graph, self.user_id(params), snapshot.statuses, snapshot.trie.search_words_union(term))
+        return {"statuses": [self.status_json(status) for status in statuses]}
+
+    def phrase(self, params: dict) -> dict:
+        term: str = self.__param(params, "q")
+        snapshot: DataSnapshot = self.holder.current
+        statuses, matches = app.search_phrase(snapshot.graph, self.user_id(params), snapshot.statuses, snapshot.trie, term)
+        return {"statuses": [dict(self.status_json(status), matches=matches[status.status_id]) for status in statuses]}
+
+    def autocomplete(self, params: dict) -> dict:
+        words: list = self.holder.current.trie.autocomplete(self.__param(params, "q"), self.__int_param(params, "limit", app.AUTOCOMPLETE_SIZE))
+        return {"words": [{"word": word, "count": count} for word, count in words]}
+
+
+class FeedServer(object):
+    """HTTP/1.1 front end of a `FeedService`, one request per connection.
+    """
+    def __init__(self, service: FeedService, threads: int = None, max_concurrent: int = MAX_CONCURRENT_REQUESTS,
+                 max_pending: int = MAX_PENDING_REQUESTS):
+        """
+        Args:
+            service (FeedService): queries
+            threads (int, optional): Worker threads. Defaults to None (`max_concurrent`).
+            max_concurrent (int, optional): Requests computed at once. Defaults to `MAX_CONCURRENT_REQUESTS`.
+            max_pending (int, optional): Requests waiting for a worker before new ones are refused. Defaults to `MAX_PENDING_REQUESTS`.
+        """
+        self.service: FeedService = service
+        self.executor: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=threads or max_concurrent)
+        self.max_concurrent: int = max_concurrent
+        self.max_pending: int = max_pending
+        self.pending: int = 0
+        self.semaphore: asyncio.Semaphore = None
+
+    async def dispatch(self, method: str, target: str) -> tuple:
+        """Routes request to the service.
+
+        Args:
+            method (str): HTTP method
+            target (str): request target
+
+        Returns:
+            tuple: (`status`, `body`)
+        """
+        url = urlsplit(target)
+        handler = self.service.routes.get(url.path)
+        if handler is None:
+            raise HttpError(404, f"Unknown path: {url.path}")
+        if method != "GET":
+            raise HttpError(405, f"Method not allowed: {method}")
+        params: dict = {name: values[0] for name, values in parse_qs(url.query).items()}
+
+        if self.pending >= self.max_pending:
+            raise HttpError(503, "Too many requests")
+        self.pending += 1
+        try:
+            async with self.semaphore:
+                body: dict = await asyncio.get_running_loop().run_in_executor(self.executor, handler, params)
+        finally:
+            self.pending -= 1
+        return 200, body
+
+    @staticmethod
+    async def read_request(reader: asyncio.StreamReader) -> tuple:
+        """Reads request head.
+
+        Args:
+            reader (asyncio.StreamReader): request stream
+
+        Raises:
+            HttpError: request is too large or malformed
+
+        Returns:
+            tuple: (`method`, `target`)
+        """
+        try:
+            head: bytes = await reader.readuntil(b"\r\n\r\n")
+        except asyncio.LimitOverrunError:
+            raise HttpError(413, "Request head too large")
+        except asyncio.IncompleteReadError:
+            raise HttpError(400, "Incomplete request")
+        parts: list = head.split(b"\r\n", 1)[0].decode("latin-1").split(" ")
+        if len(parts) != 3:
+            raise HttpError(400, "Malformed request line")
+        return parts[0], parts[1]
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Serves one connection.
+
+        Args:
+            reader (asyncio.StreamReader): request stream
+            writer (asyncio.StreamWriter): response stream
+        """
+        try:
+            try:
+                status, body = await self.dispatch(*await self.read_request(reader))
+            except HttpError as error:
+                status, body = error.status, {"error": str(error)}
+            except Exception as error:
+                status, body = 500, {"error": f"{type(error).__name__}: {error}"}
+
+            payload: bytes = json.dumps(body).encode("utf-8")
+            writer.write(f"HTTP/1.1 {status} {REASONS[status]}\r\nContent-Type: application/json\r\n"
+                         f"Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n".encode("latin-1") + payload)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str = HOST, port: int = PORT) -> None:
+        """Serves requests until cancelled.
+
+        Args:
+            host (str, optional): Listening address. Defaults to `HOST`.
+            port (int, optional): Listening port. Defaults to `PORT`.
+        """
+        self.semaphore = asyncio.Semaphore(self.max_concurrent)
+        server = await asyncio.start_server(self.handle, host, port, limit=MAX_REQUEST_BYTES)
+        print(f"Serving on http://{host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+
+def load_service(workers: int = 1, backend: str = "csr", friends_of_friends: int = 0,
+                 fof_weight: float = graph_generator.FRIEND_OF_FRIEND_WEIGHT,
+                 fof_max_products: int = graph_generator.FRIEND_OF_FRIEND_MAX_PRODUCTS, trie_kind: str = "compact") -> FeedService:
+    """Loads original datasets, affinity graph, status table and search index like `app.main`.
+
+    Args:
+        workers (int, optional): Dataset parsing processes, 0 for all cores. Defaults to 1.
+        backend (str, optional): `csr` or `networkx`. Defaults to "csr".
+        friends_of_friends (int, optional): Second degree neighbours added per user, 0 to disable. Defaults to 0.
+        fof_weight (float, optional): Friend of friend weight. Defaults to `FRIEND_OF_FRIEND_WEIGHT`.
+        fof_max_products (int, optional): Two-hop products held in memory at once. Defaults to `FRIEND_OF_FRIEND_MAX_PRODUCTS`.
+        trie_kind (str, optional): `compact` or `nodes`. Defaults to "compact".
+
+    Returns:
+        FeedService: service over the loaded data
+    """
+    start = time.time()
+    registry: ids.Registry = ids.Registry()
+    sources: dict = dict(app.ORIGINAL_SOURCES)
+    datasets: dict = app.load_datasets(sources, workers, registry)
+    graph = app.build_graph(backend, sources, datasets, registry, workers, friends_of_friends, fof_weight, fof_max_products)
+    statuses: StatusTable = StatusTable.from_statuses(datasets["statuses"])
+    trie: Trie = app.load_trie(sources["statuses"], datasets["statuses"], registry, trie_kind)
+    print(f"Loading data: {time.time() - start}")
+    return FeedService(SnapshotHolder(DataSnapshot(graph, statuses, trie, 0)), registry)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="EdgeRank feed HTTP service")
+    app.add_arguments(parser)
+    parser.add_argument("--host", default=HOST, help="listening address")
+    parser.add_argument("--port", type=int, default=PORT, help="listening port")
+    parser.add_argument("--threads", type=int, default=None, help="worker threads, defaults to the concurrency limit")
+    parser.add_argument("--max-concurrent", type=int, default=MAX_CONCURRENT_REQUESTS, help="requests computed at once")
+    parser.add_argument("--max-pending", type=int, default=MAX_PENDING_REQUESTS, help="waiting requests before 503")
+    args = parser.parse_args()
+    service: FeedService = load_service(args.workers, args.affinity, args.friends_of_friends, args.fof_weight, args.fof_max_products, args.trie)
+    try:
+        asyncio.run(FeedServer(service, args.threads, args.max_concurrent, args.max_pending).serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,115 @@
+"""Binary snapshot file: `MAGIC`, header length, JSON header and named numpy arrays aligned to `ALIGNMENT`
+bytes. Arrays are read back as read-only views of an mmap of the file, so nothing is copied until used.
+"""
+
+import json
+import mmap
+import os
+import struct
+
+import numpy as np
+
+
+MAGIC: bytes = b"ERSNAP01"
+ALIGNMENT: int = 8
+
+
+def write_snapshot(file_path: str, header: dict, arrays: dict) -> None:
+    """Writes header and arrays to `file_path`. The file is replaced atomically.
+
+    Args:
+        file_path (str): snapshot file path
+        header (dict): JSON serializable header, the array layout is stored under `arrays`
+        arrays (dict): (`name` : `np.ndarray`)
+    """
+    layout: dict = {}
+    blobs: list = []
+    offset: int = 0
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        layout[name] = {"dtype": array.dtype.str, "offset": offset, "count": int(array.size)}
+        blobs.append(array)
+        offset += array.nbytes
+        offset += -offset % ALIGNMENT
+
+    encoded: bytes = json.dumps(dict(header, arrays=layout)).encode("utf-8")
+    padding: int = -(len(MAGIC) + 8 + len(encoded)) % ALIGNMENT
+
+    os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+    temp_path: str = f"{file_path}.tmp"
+    with open(temp_path, "wb") as file:
+        file.write(MAGIC)
+        file.write(struct.pack("<Q", len(encoded) + padding))
+        file.write(encoded)
+        file.write(b" " * padding)
+        for array in blobs:
+            file.write(array.tobytes())
+            file.write(b"\0" * (-array.nbytes % ALIGNMENT))
+    os.replace(temp_path, file_path)
+
+
+def read_header(file_path: str) -> dict:
+    """Reads snapshot header.
+
+    Args:
+        file_path (str): snapshot file path
+
+    Returns:
+        dict: header, None if the file is missing or not a snapshot
+    """
+    try:
+        with open(file_path, "rb") as file:
+            if file.read(len(MAGIC)) != MAGIC:
+                return None
+            (length,) = struct.unpack("<Q", file.read(8))
+            return json.loads(file.read(length))
+    except (FileNotFoundError, struct.error, ValueError):
+        return None
+
+
+def update_header(file_path: str, header: dict) -> None:
+    """Replaces the header of a snapshot read by `read_header`, if it changed. A header that fits the space of
+    the old one is written in place, otherwise the snapshot is written again with the same arrays.
+
+    Args:
+        file_path (str): snapshot file path
+        header (dict): header with the array layout under `arrays`
+    """
+    with open(file_path, "r+b") as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            return
+        (length,) = struct.unpack("<Q", file.read(8))
+        if json.loads(file.read(length)) == header:
+            return
+        encoded: bytes = json.dumps(header).encode("utf-8")
+        if len(encoded) <= length:
+            file.seek(len(MAGIC) + 8)
+            file.write(encoded + b" " * (length - len(encoded)))
+            return
+    _, arrays = read_arrays(file_path)
+    write_snapshot(file_path, {name: value for name, value in header.items() if name != "arrays"}, arrays)
+
+
+def read_arrays(file_path: str) -> tuple:
+    """Maps snapshot arrays into memory. The mapping stays open while any returned array is referenced.
+
+    Args:
+        file_path (str): snapshot file path
+
+    Returns:
+        tuple: (`header`, (`name` : `np.ndarray`))
+    """
+    with open(file_path, "rb") as file:
+        buffer: mmap.mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    (length,) = struct.unpack_from("<Q", buffer, len(MAGIC))
+    header: dict = json.loads(buffer[len(MAGIC) + 8:len(MAGIC) + 8 + length])
+    base: int = len(MAGIC) + 8 + length
+
+    arrays: dict = {}
+    for name, entry in header["arrays"].items():
+        dtype: np.dtype = np.dtype(entry["dtype"])
+        if entry["count"] == 0:
+            arrays[name] = np.empty(0, dtype=dtype)
+        else:
+            arrays[name] = np.frombuffer(buffer, dtype=dtype, count=entry["count"], offset=base + entry["offset"])
+    return header, arrays
@@ -0,0 +1,262 @@
+"""Columnar status store. Counters, timestamps and authors live in typed numpy arrays, messages, links and
+status types in a string pool, and status ids are mapped to rows through an index array.
+"""
+
+from typing import Iterable, Iterator
+
+import numpy as np
+
+from candidates import CandidateIndex
+from graph_generator import COMMENT_WEIGHT, SHARE_WEIGHT, get_date_difference_multipliers
+
+
+COUNT_FIELDS: tuple = ("num_reactions", "num_comments", "num_shares", "num_likes", "num_loves",
+                       "num_wows", "num_hahas", "num_sads", "num_angrys", "num_special")
+STRING_FIELDS: tuple = ("status_message", "status_type", "status_link")
+SCORE_BUCKET: int = 3600
+
+
+class StringPool(object):
+    """Deduplicated strings addressed by index. Strings are only appended, so table copies share one pool.
+    """
+    def __init__(self):
+        self.strings: list = []
+        self.index: dict = {}
+
+    def __len__(self) -> int:
+        return len(self.strings)
+
+    def add(self, value: str) -> int:
+        position = self.index.get(value)
+        if position is None:
+            position = len(self.strings)
+            self.index[value] = position
+            self.strings.append(value)
+        return position
+
+    def get(self, position: int) -> str:
+        return self.strings[position]
+
+
+class StatusTable(object):
+    """Statuses stored by column. Rows keep insertion order, a status inserted again replaces its row. `version`
+    counts inserts. Copies share the columns, appending rows replaces them, and a table copies a shared column
+    before it writes into it.
+    """
+    def __init__(self):
+        self.strings: StringPool = StringPool()
+        self.status_ids: np.ndarray = np.empty(0, dtype=np.int32)
+        self.authors: np.ndarray = np.empty(0, dtype=np.int32)
+        self.published: np.ndarray = np.empty(0, dtype=np.int64)
+        self.counts: dict = {field: np.empty(0, dtype=np.int64) for field in COUNT_FIELDS}
+        self.texts: dict = {field: np.empty(0, dtype=np.int32) for field in STRING_FIELDS}
+        self.index: np.ndarray = np.empty(0, dtype=np.int32)
+        self.owns_columns: bool = True
+        self.owns_index: bool = True
+        self.version: int = 0
+        self.score_cache: tuple = (None, None, None)
+
+    @classmethod
+    def from_statuses(cls, statuses: dict) -> "StatusTable":
+        """Builds table from status records keyed by status id.
+
+        Args:
+            statuses (dict): status records
+
+        Returns:
+            StatusTable: table
+        """
+        table = cls()
+        table.insert(statuses)
+        return table
+
+    def copy(self) -> "StatusTable":
+        """Copies table without copying columns, inserts into the copy do not change this table.
+
+        Returns:
+            StatusTable: copy
+        """
+        table = StatusTable()
+        table.strings = self.strings
+        table.status_ids = self.status_ids
+        table.authors = self.authors
+        table.published = self.published
+        table.counts = dict(self.counts)
+        table.texts = dict(self.texts)
+        table.index = self.index
+        table.owns_columns = table.owns_index = False
+        self.owns_columns = self.owns_index = False
+        table.version = self.version
+        table.score_cache = self.score_cache
+        return table
+
+    def __len__(self) -> int:
+        return len(self.status_ids)
+
+    def __contains__(self, status_id: int) -> bool:
+        return 0 <= status_id < len(self.index) and self.index[status_id] >= 0
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.status_ids.tolist())
+
+    def __getitem__(self, status_id: int) -> dict:
+        if status_id not in self:
+            raise KeyError(status_id)
+        return self.record(int(self.index[status_id]))
+
+    def insert(self, statuses: dict) -> None:
+        """Inserts status records. Records whose id is already stored overwrite their row.
+
+        Args:
+            statuses (dict): status records keyed by status id
+        """
+        if not statuses:
+            return
+        self.version += 1
+        self.score_cache = (None, None, None)
+        new: list = []
+        for status_id, status in statuses.items():
+            if status_id in self:
+                self._set_row(int(self.index[status_id]), status)
+            else:
+                new.append(status)
+        if not new:
+            return
+
+        size: int = max(max(statuses) + 1, len(self.index))
+        if size > len(self.index):
+            self.index = np.concatenate((self.index, np.full(size - len(self.index), -1, dtype=np.int32)))
+        elif not self.owns_index:
+            self.index = self.index.copy()
+        self.owns_index = True
+
+        first: int = len(self.status_ids)
+        self.status_ids = np.concatenate((self.status_ids, np.array([status["status_id"] for status in new], dtype=np.int32)))
+        self.authors = np.concatenate((self.authors, np.array([status["author"] for status in new], dtype=np.int32)))
+        self.published = np.concatenate((self.published, np.array([status["status_published"] for status in new], dtype=np.int64)))
+        for field in COUNT_FIELDS:
+            self.counts[field] = np.concatenate((self.counts[field], np.array([status[field] for status in new], dtype=np.int64)))
+        for field in STRING_FIELDS:
+            positions = np.array([self.strings.add(status[field]) for status in new], dtype=np.int32)
+            self.texts[field] = np.concatenate((self.texts[field], positions))
+        self.index[self.status_ids[first:]] = np.arange(first, len(self.status_ids), dtype=np.int32)
+        self.owns_columns = True
+
+    def _set_row(self, row: int, status: dict) -> None:
+        if not self.owns_columns:
+            self.authors = self.authors.copy()
+            self.published = self.published.copy()
+            self.counts = {field: column.copy() for field, column in self.counts.items()}
+            self.texts = {field: column.copy() for field, column in self.texts.items()}
+            self.owns_columns = True
+        self.authors[row] = status["author"]
+        self.published[row] = status["status_published"]
+        for field in COUNT_FIELDS:
+            self.counts[field][row] = status[field]
+        for field in STRING_FIELDS:
+            self.texts[field][row] = self.strings.add(status[field])
+
+    def rows(self, status_ids: Iterable[int]) -> np.ndarray:
+        """Gets rows of stored statuses, unknown ids are skipped.
+
+        Args:
+            status_ids (Iterable[int]): status ids
+
+        Returns:
+            np.ndarray: rows
+        """
+        ids: np.ndarray = np.fromiter(status_ids, dtype=np.int64)
+        ids = ids[(ids >= 0) & (ids < len(self.index))]
+        rows: np.ndarray = self.index[ids]
+        return rows[rows >= 0]
+
+    def record(self, row: int) -> dict:
+        """Builds status record of `row`.
+
+        Args:
+            row (int): row
+
+        Returns:
+            dict: status record
+        """
+        record: dict = {
+            "status_id": int(self.status_ids[row]),
+            "author": int(self.authors[row]),
+            "status_published": int(self.published[row]),
+        }
+        for field in STRING_FIELDS:
+            record[field] = self.strings.get(int(self.texts[field][row]))
+        for field in COUNT_FIELDS:
+            record[field] = int(self.counts[field][row])
+        return record
+
+    def message(self, status_id: int) -> str:
+        """Gets message of a status.
+
+        Args:
+            status_id (int): status id
+
+        Returns:
+            str: status message
+        """
+        return self.strings.get(int(self.texts["status_message"][self.index[status_id]]))
+
+    def popularity(self, rows: np.ndarray = None) -> np.ndarray:
+        """Gets popularity `comments + 2 * shares + all reactions` of statuses.
+
+        Args:
+            rows (np.ndarray, optional): Rows to compute. Defaults to None (all rows).
+
+        Returns:
+            np.ndarray: popularity per row
+        """
+        counts = self.counts if rows is None else {field: self.counts[field][rows] for field in COUNT_FIELDS}
+        return (COMMENT_WEIGHT * counts["num_comments"] + counts["num_shares"] * SHARE_WEIGHT + counts["num_likes"] + counts["num_loves"] +
+                counts["num_wows"] + counts["num_hahas"] + counts["num_sads"] + counts["num_angrys"] + counts["num_special"])
+
+    def time_dependency(self, now: int, rows: np.ndarray = None) -> np.ndarray:
+        """Gets time dependency of statuses.
+
+        Args:
+            now (int): current time, in seconds
+            rows (np.ndarray, optional): Rows to compute. Defaults to None (all rows).
+
+        Returns:
+            np.ndarray: time dependency per row
+        """
+        published: np.ndarray = self.published if rows is None else self.published[rows]
+        return get_date_difference_multipliers(published, now)
+
+    def base_scores(self, now: int) -> np.ndarray:
+        """Gets `popularity * time dependency` of every row. Scores are computed for the start of the
+        `SCORE_BUCKET` seconds long bucket `now` falls in and reused until the bucket or the table changes.
+        The cache is replaced as one tuple, so concurrent readers never mix scores of different buckets.
+
+        Args:
+            now (int): current time, in seconds
+
+        Returns:
+            np.ndarray: base score per row
+        """
+        bucket: int = now // SCORE_BUCKET
+        cached_bucket, scores, _ = self.score_cache
+        if cached_bucket != bucket:
+            scores = self.popularity() * self.time_dependency(bucket * SCORE_BUCKET)
+            self.score_cache = (bucket, scores, None)
+        return scores
+
+    def candidate_index(self, now: int) -> CandidateIndex:
+        """Gets candidate index over the base scores of `now`, rebuilt together with them.
+
+        Args:
+            now (int): current time, in seconds
+
+        Returns:
+            CandidateIndex: candidate index
+        """
+        scores: np.ndarray = self.base_scores(now)
+        _, cached_scores, candidates = self.score_cache
+        if candidates is None or cached_scores is not scores:
+            candidates = CandidateIndex(scores, self.authors)
+            self.score_cache = (now // SCORE_BUCKET, scores, candidates)
+        return candidates
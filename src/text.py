@@ -0,0 +1,58 @@
+"""Text filtering shared by the search trie and the phrase index.
+"""
+
+
+def filter_chars(status: str, to_lower: bool = True, strip: bool = True) -> str:
+    """Replaces all none-letter characters with space.
+
+    Args:
+        status (str): status
+        to_lower (bool, optional): Is case insensitive. Defaults to True.
+        strip (bool, optional): Removes leading and trailing spaces. Defaults to True.
+
+    Returns:
+        str: modified status
+    """
+    char_filter: str = ""
+    if to_lower:
+        status = status.lower()
+    for char in status:
+        if (97 <= ord(char) <= 122) or (not to_lower and (65 <= ord(char) <= 90)) or char == ' ':
+            char_filter += char
+        else:
+            char_filter += " "
+    return char_filter.strip() if strip else char_filter
+
+
+def has_phrase(status: str, phrase: str) -> tuple:
+    """Checks if status have `phrase`.
+
+    Args:
+        status (str): status
+        phrase (str): phrase
+
+    Returns:
+        tuple: (True if status have phrase, index of its first character or None)
+    """
+    status = filter_chars(status)
+    phrase_len: int = len(phrase)
+    status_len: int = len(status)
+    
+    bad_char = {}
+    for i in range(phrase_len):
+        bad_char[phrase[i]] = i 
+    
+    i: int = phrase_len - 1       
+    k: int = phrase_len - 1
+    while i < status_len:
+        if status[i] == phrase[k]:
+            if k == 0:
+                return True, i
+            else:
+                i -= 1
+                k -= 1
+        else:
+            j = bad_char.get(status[i], -1)
+            i += phrase_len - min(k, j + 1)
+            k = phrase_len - 1
+    return False, None
@@ -0,0 +1,81 @@
+"""Timestamps as integer seconds. Dataset times are naive wall-clock times, so they are counted from the
+naive epoch `1970-01-01 00:00:00` and `now` reads the local wall clock the same way. Differences between
+them equal the old naive `datetime` subtraction.
+"""
+
+from datetime import date, datetime, timedelta
+
+
+DATE_FORMAT: str = "%Y-%m-%d %H:%M:%S"
+SECONDS_PER_DAY: int = 86400
+EPOCH: datetime = datetime(1970, 1, 1)
+EPOCH_ORDINAL: int = EPOCH.toordinal()
+
+_day_seconds: dict = {}
+
+
+def parse_timestamp(text: str) -> int:
+    """Parses `YYYY-MM-DD HH:MM:SS` into seconds. Dates are cached, so only the time of day is parsed
+    for most rows. Other formats fall back to `strptime`.
+
+    Args:
+        text (str): timestamp
+
+    Returns:
+        int: seconds since the naive epoch
+    """
+    try:
+        day: int = _day_seconds[text[:10]]
+    except KeyError:
+        if len(text) != 19:
+            return to_timestamp(datetime.strptime(text, DATE_FORMAT))
+        day = (date(int(text[0:4]), int(text[5:7]), int(text[8:10])).toordinal() - EPOCH_ORDINAL) * SECONDS_PER_DAY
+        _day_seconds[text[:10]] = day
+    if len(text) != 19 or text[10] != " " or text[13] != ":" or text[16] != ":":
+        return to_timestamp(datetime.strptime(text, DATE_FORMAT))
+    return day + int(text[11:13]) * 3600 + int(text[14:16]) * 60 + int(text[17:19])
+
+
+def to_timestamp(value: datetime) -> int:
+    """Converts naive datetime into seconds.
+
+    Args:
+        value (datetime): naive datetime
+
+    Returns:
+        int: seconds since the naive epoch
+    """
+    return (value.toordinal() - EPOCH_ORDINAL) * SECONDS_PER_DAY + value.hour * 3600 + value.minute * 60 + value.second
+
+
+def to_datetime(seconds: int) -> datetime:
+    """Converts seconds into naive datetime.
+
+    Args:
+        seconds (int): seconds since the naive epoch
+
+    Returns:
+        datetime: naive datetime
+    """
+    return EPOCH + timedelta(seconds=seconds)
+
+
+def format_timestamp(seconds: int) -> str:
+    """Formats seconds as `DATE_FORMAT`.
+
+    Args:
+        seconds (int): seconds since the naive epoch
+
+    Returns:
+        str: formatted timestamp
+    """
+    return to_datetime(seconds).strftime(DATE_FORMAT)
+
+
+def now() -> int:
+    """Gets current local wall-clock time.
+
+    Returns:
+        int: seconds since the naive epoch
+    """
+    return to_timestamp(datetime.today())
@@ -1,79 +1,158 @@
+from bisect import bisect_left
+import heapq
 import re
+import threading
+
+from phrase_index import PhraseIndex
+from text import filter_chars, has_phrase
+
+
+def suffix_range(words, chars: str, key=None) -> tuple:
+    """Finds words ending with `chars` in a list sorted by reversed word.
+
+    Args:
+        words (Sequence): words or word ids sorted by reversed word
+        chars (str): word end
+        key (Callable, optional): Gets reversed word of an item. Defaults to None (items are reversed words).
+
+    Returns:
+        tuple: (`first`, `last`) positions, the range is empty if no word matches
+    """
+    reverse: str = chars[::-1]
+    first: int = bisect_left(words, reverse, key=key)
+    return first, bisect_left(words, reverse + "{", lo=first, key=key)
+
 
 class Node(object):
-    """Trie node.
+    """Trie node. `owner` is the trie version allowed to change it and `best` the largest word count in
+    its subtree.
     """
-    def __init__(self, char: str):
+    def __init__(self, char: str, owner: object = None):
         self.char = char
         self.is_end = False
         self.counter = 0
+        self.best = 0
         self.children = {}
         self.status_ids = set()
+        self.owner = owner
 
 class Trie(object):
-    """Trie class.
+    """Trie class. `suffixes` holds every word reversed and sorted, words ending with a search word are
+    found in it by binary search. New words are collected in `new_suffixes` and sorted into a new
+    `suffixes` list by the first search after inserts. `copy` shares all nodes and `suffixes` with the
+    copy, inserts into either trie copy the nodes on the inserted paths, so the other trie never changes.
+    Phrases are searched in the positional index `phrases`.
     """    
     def __init__(self):
-        self.root: Node = Node("")
-        self.char_hash: dict = {}
-            
-    def __filter_chars(self, status: str, to_lower: bool = True) -> str:
-        """Replaces all none-letter characters with space.
+        self.owner: object = object()
+        self.root: Node = Node("", self.owner)
+        self.suffixes: list = []
+        self.new_suffixes: list = []
+        self.lock: threading.Lock = threading.Lock()
+        self.phrases: PhraseIndex = PhraseIndex()
+        self.version: int = 0
+
+    def copy(self) -> "Trie":
+        """Copies trie without copying nodes.
+
+        Returns:
+            Trie: copy
+        """
+        trie: Trie = Trie()
+        trie.root = self.root
+        with self.lock:
+            trie.suffixes = self.suffixes
+            trie.new_suffixes = list(self.new_suffixes)
+        trie.phrases = self.phrases.copy()
+        trie.version = self.version
+        self.owner = object()
+        return trie
+
+    def __own(self, node: Node) -> Node:
+        """Gets a node this trie may change, copying `node` if it is shared.
 
         Args:
-            status (str): status
-            to_lower (bool, optional): Is case insensitive. Defaults to True.
+            node (Node): node
 
         Returns:
-            str: modified status
+            Node: owned node
         """
-        char_filter: str = ""
-        if to_lower:
-            status = status.lower()
-        for char in status:
-            if (97 <= ord(char) <= 122) or (not to_lower and (65 <= ord(char) <= 90)) or char == ' ':
-                char_filter += char
-            else:
-                char_filter += " "
-        return char_filter.strip()
+        if node.owner is self.owner:
+            return node
+        owned: Node = Node(node.char, self.owner)
+        owned.is_end = node.is_end
+        owned.counter = node.counter
+        owned.best = node.best
+        owned.children = dict(node.children)
+        owned.status_ids = set(node.status_ids)
+        return owned
+
+    def __add_suffix(self, word: str) -> None:
+        self.new_suffixes.append(word[::-1])
+
+    def __sorted_suffixes(self) -> list:
+        """Merges new words into a new sorted `suffixes` list, one sort per batch of inserts.
+
+        Returns:
+            list: all words reversed and sorted
+        """
+        with self.lock:
+            if self.new_suffixes:
+                self.suffixes = sorted(self.suffixes + self.new_suffixes)
+                self.new_suffixes = []
+            return self.suffixes
+            
+    def __filter_chars(self, status: str, to_lower: bool = True) -> str:
+        return filter_chars(status, to_lower)
         
-    def insert(self, status: str, id: str):
+    def insert(self, status: str, id: int):
         """Inserts status words into trie.
 
         Args:
             status (str): status
-            id (str): status id
+            id (int): status id
         """
+        self.version += 1
+        self.phrases.insert(status, id)
         status: str = self.__filter_chars(status)
         words = status.split(" ")    
         
+        self.root = self.__own(self.root)
         for word in words:
             node = self.root
+            path: list = [node]
             for char in word:
                 if char in node.children:
-                    node = node.children[char]
+                    child: Node = self.__own(node.children[char])
+                    node.children[char] = child
+                    node = child
                 else:
-                    new_node: Node = Node(char)
+                    new_node: Node = Node(char, self.owner)
                     node.children[char] = new_node
                     node = new_node
-                    if char not in self.char_hash:
-                        self.char_hash.update({char : [node]})
-                    else:
-                        self.char_hash[char].append(node)
+                path.append(node)
                     
+            if not node.is_end:
+                self.__add_suffix(word)
             node.status_ids.add(id)
             node.counter += 1
             node.is_end = True
+            for parent in reversed(path):
+                if parent.best >= node.counter:
+                    break
+                parent.best = node.counter
         
     
-    def autocomplete(self, prefix: str) -> dict:
-        """Autocomletes word.
+    def autocomplete(self, prefix: str, k: int = None) -> list:
+        """Autocomletes word. All words are sorted at once, the `k` first are found best first by the
+        largest count of every subtree, visiting only the paths to them and their siblings.
 
         Args:
             prefix (str): word prefix
+            k (int, optional): Number of words. Defaults to None (all words).
 
         Returns:
-            dict: `word` : `word count`
+            list: (`word`, `word count`) pairs, the most frequent first, equal counts in trie order
         """
         prefix = self.__filter_chars(prefix)
         node: Node = self.root
@@ -83,28 +162,28 @@ class Trie(object):
                 return []
             node = node.children[char]
         
-        words: list = self.__get_words_from_prefix(node, prefix)
-        words.sort(key = lambda w: w[1], reverse=True)
-        return words
-        
-    def __get_words_from_prefix(self, node: Node, prefix: str) -> list:
-        """Recursively gets all words from prefix.
-
-        Args:
-            node (Node): current node
-            prefix (str): word prefix
+        words: list = []
+        if k is None:
+            stack: list = [(node, prefix)]
+            while stack:
+                node, word = stack.pop()
+                if node.is_end:
+                    words.append((word, node.counter))
+                for char, child in reversed(node.children.items()):
+                    stack.append((child, word + char))
+            words.sort(key = lambda w: w[1], reverse=True)
+            return words
 
-        Returns:
-            list: list of words that start with prefix
-        """
-        words = []
-        
-        if node.is_end:
-            words.append((prefix, node.counter))
-        
-        for char, child in node.children.items():
-            words.extend(self.__get_words_from_prefix(child, prefix + char))
-        
+        heap: list = [(-node.best, (), 1, node, prefix)]
+        while heap and (k is None or len(words) < k):
+            count, ranks, is_subtree, node, word = heapq.heappop(heap)
+            if not is_subtree:
+                words.append((word, -count))
+                continue
+            if node.is_end:
+                heapq.heappush(heap, (-node.counter, ranks, 0, node, word))
+            for rank, (char, child) in enumerate(node.children.items()):
+                heapq.heappush(heap, (-child.best, ranks + (rank,), 1, child, word + char))
         return words
     
     def search_words_union(self, term: str) -> dict:
@@ -129,87 +208,34 @@ class Trie(object):
             
         return status_ids
     
-    def __search(self, word: str, counter: int, node: Node) -> set:
-        """Recursively searches trie.
+    def __search(self, word: str) -> set:
+        """Searches trie.
 
         Args:
             word (str): word
-            counter (int): word size
-            node (Node): current node
 
         Returns:
             set: set of statuses that have `word`
         """
-        if len(word) == counter:
-            return node.status_ids
-            
-        ids = set()
-        char = word[counter]
-        if char in node.children:
-            status_ids = self.__search(word, counter + 1, node.children[char])
-            if status_ids:
-                ids.update(status_ids)
-        
-        return ids
-
-    def has_phrase(self, status: str, phrase: str) -> bool:
-        """Checks if status have `phrase`.
-
-        Args:
-            status (str): status
-            phrase (str): phrase
+        node: Node = self.root
+        for char in word:
+            if char not in node.children:
+                return set()
+            node = node.children[char]
+        return node.status_ids
 
-        Returns:
-            bool: True if status have phrase.
+    def has_phrase(self, status: str, phrase: str) -> tuple:
+        """Checks if status have `phrase`, see `text.has_phrase`.
         """
-        status = self.__filter_chars(status)
-        phrase_len: int = len(phrase)
-        status_len: int = len(status)
+        return has_phrase(status, phrase)
         
-        bad_char = {}
-        for i in range(phrase_len):
-            bad_char[phrase[i]] = i 
-        
-        i: int = phrase_len - 1       
-        k: int = phrase_len - 1
-        while i < status_len:
-            if status[i] == phrase[k]:
-                if k == 0:
-                    return True, i
-                else:
-                    i -= 1
-                    k -= 1
-            else:
-                j = bad_char.get(status[i], -1)
-                i += phrase_len - min(k, j + 1)
-                k = phrase_len - 1
-        return False, None
-        
-    def search_phrases(self, phrase: str, statuses: dict) -> list:
-        """Search for phrases in all `statuses`.
-
-        Args:
-            phrase (str): phrase
-            statuses (dict): all statuses
-
-        Returns:
-            list: statuses with `phrase`
+    def search_phrases(self, phrase: str) -> dict:
+        """Search for phrases, see `PhraseIndex.find`.
         """
-        phrase = self.__filter_chars(phrase)
-
-        status_ids: list = []
-        for status in statuses:
-            message = statuses[status]['status_message']
-            message = self.__filter_chars(message)
-            has_phrase, _ = self.has_phrase(message, " " + phrase + " ")
-            if has_phrase:
-                status_ids.append(status)
-                
-
-        return status_ids
+        return self.phrases.find(phrase)
  
     def __quary(self, term: str) -> set:
-        """Returns all statuses with `term`.
+        """Returns all statuses with a word ending with `term`.
 
         Args:
             term (str): term
@@ -222,13 +248,9 @@ class Trie(object):
             return set()
         
         ids = set()
-        if chars[0] not in self.char_hash:
-            return ids
-        
-        nodes: list[Node] = self.char_hash[chars[0]]
-        for node in nodes:
-            node_id = self.__search(chars, 1, node)
-            if node_id:
-                ids.update(node_id)
+        suffixes: list = self.__sorted_suffixes()
+        first, last = suffix_range(suffixes, chars)
+        for reverse in suffixes[first:last]:
+            ids.update(self.__search(reverse[::-1]))
 
         return ids
\ No newline at end of file
@@ -0,0 +1,97 @@
+"""Compares `trie.Trie` with `compact_trie.CompactTrie` on the status messages of a dataset: build time,
+memory held after the build, full and top-k autocomplete and word search latency, and checks that both
+return the same results. Run from the repository root, e.g. `python src/trie_benchmark.py dataset/original_statuses.csv`.
+"""
+
+import argparse
+import random
+import string
+import time
+import tracemalloc
+
+from compact_trie import CompactTrie
+import ids
+from parse_dict import load_statuses_dict
+from trie import Trie
+
+
+def fill(factory, messages: list):
+    trie = factory()
+    for status_id, message in messages:
+        trie.insert(message, status_id)
+    if isinstance(trie, CompactTrie):
+        trie.compact()
+    return trie
+
+
+def build(factory, messages: list) -> tuple:
+    """Builds a trie and measures it. Memory is traced in a second build, tracing slows the build down.
+
+    Args:
+        factory (Callable): trie class
+        messages (list): (`status_id`, `message`) pairs
+
+    Returns:
+        tuple: (trie, build seconds, bytes held)
+    """
+    start: float = time.perf_counter()
+    trie = fill(factory, messages)
+    seconds: float = time.perf_counter() - start
+    tracemalloc.start()
+    traced = fill(factory, messages)
+    held, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del traced
+    return trie, seconds, held
+
+
+def lookup(method, queries: list) -> tuple:
+    """Runs queries and measures them.
+
+    Args:
+        method (Callable): query method
+        queries (list): query strings
+
+    Returns:
+        tuple: (results, mean milliseconds per query)
+    """
+    start: float = time.perf_counter()
+    results: list = [method(query) for query in queries]
+    return results, (time.perf_counter() - start) * 1000 / max(len(queries), 1)
+
+
+def main(path: str, queries: int, seed: int, top: int) -> None:
+    statuses: dict = load_statuses_dict(path, ids.Registry())
+    messages: list = [(status["status_id"], status["status_message"]) for status in statuses.values()]
+    print(f"{len(messages)} statuses")
+
+    nodes, nodes_seconds, nodes_bytes = build(Trie, messages)
+    compact, compact_seconds, compact_bytes = build(CompactTrie, messages)
+    print(f"{'':14}{'Trie':>14}{'CompactTrie':>14}")
+    print(f"{'build s':14}{nodes_seconds:14.3f}{compact_seconds:14.3f}")
+    print(f"{'memory MB':14}{nodes_bytes / 2 ** 20:14.1f}{compact_bytes / 2 ** 20:14.1f}")
+
+    random_generator: random.Random = random.Random(seed)
+    words: list = [word for word, _ in compact.autocomplete("")]
+    prefixes: list = [random_generator.choice(string.ascii_lowercase) for _ in range(queries // 2)]
+    prefixes += [word[:random_generator.randint(1, len(word))] for word in random_generator.choices(words, k=queries - len(prefixes)) if word]
+    terms: list = [" ".join(random_generator.choices(words, k=random_generator.randint(1, 3))) for _ in range(queries)]
+
+    for name, query, arguments in (("autocomplete", lambda trie, prefix: trie.autocomplete(prefix), prefixes),
+                                   (f"top {top}", lambda trie, prefix: trie.autocomplete(prefix, top), prefixes),
+                                   ("search", lambda trie, term: trie.search_words_union(term), terms)):
+        expected, nodes_ms = lookup(lambda argument: query(nodes, argument), arguments)
+        actual, compact_ms = lookup(lambda argument: query(compact, argument), arguments)
+        print(f"{name + ' ms':14}{nodes_ms:14.3f}{compact_ms:14.3f}")
+        if actual != expected:
+            print(f"{name} results differ")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Trie memory and lookup benchmark")
+    parser.add_argument("statuses", help="status dataset")
+    parser.add_argument("--queries", type=int, default=200, help="queries per lookup kind")
+    parser.add_argument("--top", type=int, default=10, help="words per top-k autocompletion")
+    parser.add_argument("--seed", type=int, default=0, help="random seed of the queries")
+    args = parser.parse_args()
+    main(args.statuses, args.queries, args.seed, args.top)